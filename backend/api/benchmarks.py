@@ -0,0 +1,257 @@
+import json
+import math
+import os
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.core.management import BaseCommand, CommandError
+from django.http import QueryDict
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.request import Request
+from rest_framework.test import APIRequestFactory
+
+from foodgram.models import Follow, Ingredient, Recipe, Tag, User
+from .filter import RecipeFilter
+from .instrumentation import record_queries
+from .matching import recipe_match_index
+from .search import ingredient_search_index
+from .serializers import (FollowSerializer, IngredientSerializer,
+                          RecipeSerializer, ShoppingListItemSerializer,
+                          TagSerializer, UserSerializer)
+
+PAGE_SIZE = 6
+
+MicroBenchmark = namedtuple('MicroBenchmark', ('name', 'run'))
+
+
+def percentile(values, fraction):
+    """Перцентиль методом ближайшего ранга."""
+    ordered = sorted(values)
+    rank = max(1, math.ceil(fraction * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize(timings, queries) -> dict:
+    """Итог замера: перцентили времени в миллисекундах и среднее число
+    запросов к базе."""
+    return {
+        'samples': len(timings),
+        'p50': round(percentile(timings, 0.5) * 1000, 3),
+        'p95': round(percentile(timings, 0.95) * 1000, 3),
+        'p99': round(percentile(timings, 0.99) * 1000, 3),
+        'queries': round(sum(queries) / len(queries), 2),
+    }
+
+
+def load_baseline(path) -> dict:
+    with open(path, encoding='utf-8') as baseline_file:
+        return json.load(baseline_file)
+
+
+def save_baseline(path, results) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as baseline_file:
+        json.dump(results, baseline_file, ensure_ascii=False, indent=2,
+                  sort_keys=True)
+
+
+def compare_with_baseline(results, baseline, tolerance) -> list:
+    """Регрессии относительно базовой линии: p95 медленнее больше чем на
+    tolerance или больше запросов на операцию."""
+    regressions = []
+    for name, result in sorted(results.items()):
+        expected = baseline.get(name)
+        if expected is None:
+            continue
+        if result['p95'] > expected['p95'] * (1 + tolerance):
+            regressions.append(
+                f'{name}: p95 {result["p95"]:.2f} мс, в базовой линии '
+                f'{expected["p95"]:.2f} мс'
+            )
+        if result['queries'] > expected['queries']:
+            regressions.append(
+                f'{name}: {result["queries"]} запросов, в базовой линии '
+                f'{expected["queries"]}'
+            )
+    return regressions
+
+
+def format_result(name, result, expected=None) -> str:
+    line = (
+        f'{name}: p50 {result["p50"]:.2f} мс, p95 {result["p95"]:.2f} мс, '
+        f'p99 {result["p99"]:.2f} мс, запросов {result["queries"]}'
+    )
+    if expected and expected['p95']:
+        change = (result['p95'] / expected['p95'] - 1) * 100
+        line += f' (p95 {change:+.0f}% к базовой линии)'
+    return line
+
+
+def make_request(user, path='/', params=None) -> Request:
+    request = Request(APIRequestFactory().get(path, params or {}))
+    request.user = user
+    return request
+
+
+# Запрос создаётся заново на каждый прогон: карта идентичности и
+# подписки кэшируются на нём и исказили бы повторные замеры.
+def serializer_benchmark(serializer_class, get_instances, user, params=None):
+    def run():
+        serializer_class(
+            get_instances(), many=True,
+            context={'request': make_request(user, params=params)}
+        ).data
+    return run
+
+
+def filter_benchmark(params, user):
+    # Как в ленте: COUNT(*) для пагинатора и первая страница.
+    def run():
+        queryset = RecipeFilter(
+            QueryDict(params),
+            queryset=Recipe.objects.select_related(
+                'author'
+            ).with_user_flags(user),
+            request=make_request(user),
+        ).qs
+        queryset.count()
+        list(queryset[:PAGE_SIZE])
+    return run
+
+
+def get_micro_benchmarks(user) -> list:
+    """Замеры сериализаторов и путей фильтрации ленты от имени user."""
+    feed = Recipe.objects.select_related('author').with_user_flags(user)
+    slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+    author = Recipe.objects.values_list('author_id', flat=True).first()
+    prefix = Ingredient.objects.values_list('name', flat=True).first()[:3]
+    word = Recipe.objects.values_list('name', flat=True).first().split()[0]
+    pantry = list(Ingredient.objects.values_list('id', flat=True)[:20])
+    return [
+        MicroBenchmark('serializer.recipe_list', serializer_benchmark(
+            RecipeSerializer,
+            lambda: feed.prefetch_related(
+                *Recipe.objects.related_lookups()
+            )[:PAGE_SIZE],
+            user,
+        )),
+        MicroBenchmark('serializer.follow', serializer_benchmark(
+            FollowSerializer,
+            lambda: Follow.objects.filter(
+                user=user
+            ).select_related('author')[:PAGE_SIZE],
+            user,
+            params={'recipes_limit': 3},
+        )),
+        MicroBenchmark('serializer.user', serializer_benchmark(
+            UserSerializer, lambda: User.objects.all()[:PAGE_SIZE], user
+        )),
+        MicroBenchmark('serializer.tag', serializer_benchmark(
+            TagSerializer, Tag.objects.all, user
+        )),
+        MicroBenchmark('serializer.ingredient', serializer_benchmark(
+            IngredientSerializer,
+            lambda: ingredient_search_index.search(prefix, 50),
+            user,
+        )),
+        MicroBenchmark('serializer.shopping_list', serializer_benchmark(
+            ShoppingListItemSerializer,
+            lambda: user.shopping_list.select_related('ingredient'),
+            user,
+        )),
+        MicroBenchmark('matching.recipes', lambda: recipe_match_index.match(
+            pantry, settings.RECIPE_MATCH_MAX_MISSING
+        )),
+        MicroBenchmark('filter.none', filter_benchmark('', user)),
+        MicroBenchmark('filter.tags_any', filter_benchmark(
+            '&'.join(f'tags={slug}' for slug in slugs), user
+        )),
+        MicroBenchmark('filter.tags_all', filter_benchmark(
+            '&'.join(f'tags={slug}' for slug in slugs) + '&tags_match=all',
+            user
+        )),
+        MicroBenchmark('filter.author', filter_benchmark(
+            f'author={author}', user
+        )),
+        MicroBenchmark('filter.search', filter_benchmark(
+            f'search={word}', user
+        )),
+        MicroBenchmark('filter.popular', filter_benchmark(
+            'ordering=popular', user
+        )),
+        MicroBenchmark('filter.is_favorited', filter_benchmark(
+            'is_favorited=1', user
+        )),
+        MicroBenchmark('filter.not_favorited', filter_benchmark(
+            'is_favorited=0', user
+        )),
+        MicroBenchmark('filter.is_in_shopping_cart', filter_benchmark(
+            'is_in_shopping_cart=1', user
+        )),
+    ]
+
+
+def run_micro_benchmark(benchmark, repeat, warmup=1) -> dict:
+    for _warmup in range(warmup):
+        benchmark.run()
+    timings = []
+    queries = []
+    for _repeat in range(repeat):
+        with record_queries() as stats:
+            started = time.perf_counter()
+            benchmark.run()
+            timings.append(time.perf_counter() - started)
+        queries.append(stats.count)
+    return summarize(timings, queries)
+
+
+class BenchmarkCommand(BaseCommand):
+    """Общие параметры и отчёт команд замеров: сравнение с сохранённой
+    базовой линией и её обновление."""
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--baseline',
+            help=_('JSON-файл базовой линии для сравнения; при регрессии '
+                   'команда завершается с ошибкой')
+        )
+        parser.add_argument(
+            '--save-baseline',
+            help=_('Сохранить результаты как базовую линию в JSON-файл')
+        )
+        parser.add_argument(
+            '--tolerance',
+            type=float,
+            default=0.2,
+            help=_('Допустимое замедление p95 относительно базовой линии '
+                   '(доля, по умолчанию 0.2)')
+        )
+
+    def report(self, results, options):
+        baseline = {}
+        if options['baseline']:
+            try:
+                baseline = load_baseline(options['baseline'])
+            except (OSError, ValueError) as error:
+                raise CommandError(str(error))
+        for name, result in results.items():
+            self.stdout.write(format_result(name, result, baseline.get(name)))
+        if options['save_baseline']:
+            save_baseline(options['save_baseline'], results)
+            self.stdout.write(_('Базовая линия сохранена в {}').format(
+                options['save_baseline']
+            ))
+        regressions = compare_with_baseline(
+            results, baseline, options['tolerance']
+        )
+        for regression in regressions:
+            self.stdout.write(self.style.ERROR(regression))
+        if regressions:
+            raise CommandError(
+                _('Регрессий относительно базовой линии: {}').format(
+                    len(regressions)
+                )
+            )
@@ -0,0 +1,198 @@
+import hashlib
+import json
+import threading
+import time
+from collections import Counter
+from typing import Optional
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from rest_framework import status
+from rest_framework.response import Response
+
+from .conditional import etag_matches, make_etag, not_modified_response
+from .instrumentation import unbudgeted
+
+CACHE_PREFIX = 'reference-cache'
+CACHE_STATS = ('hits', 'misses')
+CHANGES_TIMEOUT = 24 * 60 * 60
+MAX_CHANGES_VERSIONS = 1000
+SHARED_CACHE = 'shared'
+
+# Версии, прочитанные процессом: пространство имён → (версия, до какого
+# момента по time.monotonic() её не перечитывать).
+_versions = {}
+# Попадания и промахи считаются в памяти процесса: запись в кэш на
+# каждый запрос стоила бы больше самого кэширования.
+_stats = Counter()
+_stats_lock = threading.Lock()
+
+
+def _version_key(namespace: str) -> str:
+    return f'{CACHE_PREFIX}:{namespace}:version'
+
+
+def _changes_key(namespace: str, version: int) -> str:
+    return f'{CACHE_PREFIX}:{namespace}:changes:{version}'
+
+
+def _increment(store, key: str, initial: int = 0) -> int:
+    store.add(key, initial, timeout=None)
+    try:
+        return store.incr(key)
+    except ValueError:
+        store.set(key, initial + 1, timeout=None)
+        return initial + 1
+
+
+def _initial_version() -> int:
+    # Версия начинается с метки времени: если ключ версии будет вытеснен
+    # из кэша, записи со старой версией не станут снова актуальными.
+    return int(time.time() * 1000)
+
+
+def _remember_version(namespace: str, version: int) -> int:
+    _versions[namespace] = (
+        version, time.monotonic() + settings.REFERENCE_CACHE_VERSION_TTL
+    )
+    return version
+
+
+def forget_reference_cache_versions() -> None:
+    """Заставляет процесс перечитать все версии из общего кэша."""
+    _versions.clear()
+
+
+def get_reference_cache_version(namespace: str) -> int:
+    """Версия пространства имён из общего кэша.
+
+    Процесс перечитывает её не чаще раза в REFERENCE_CACHE_VERSION_TTL
+    секунд; запросы к общему кэшу не входят в бюджет действия.
+    """
+    remembered = _versions.get(namespace)
+    if remembered is not None and remembered[1] > time.monotonic():
+        return remembered[0]
+    with unbudgeted():
+        version = caches[SHARED_CACHE].get_or_set(
+            _version_key(namespace), _initial_version, timeout=None
+        )
+    return _remember_version(namespace, version)
+
+
+def _next_version(namespace: str, changes=None) -> int:
+    store = caches[SHARED_CACHE]
+    with unbudgeted():
+        while True:
+            version = _increment(store, _version_key(namespace),
+                                 _initial_version())
+            # incr общего кэша в базе не атомарен: два процесса могут
+            # получить одну версию. Журнал версии занимает тот, кто
+            # записал его первым, второй берёт следующую версию.
+            if store.add(_changes_key(namespace, version),
+                         list(changes or ()), timeout=CHANGES_TIMEOUT):
+                return _remember_version(namespace, version)
+
+
+def invalidate_reference_cache(namespace: str) -> None:
+    _next_version(namespace)
+
+
+def record_reference_changes(namespace: str, changes) -> None:
+    """Поднимает версию пространства имён и запоминает, что изменилось в
+    этой версии.
+
+    Процесс, отставший на несколько версий, может применить изменения
+    вместо полной перезагрузки данных. Журнал хранится ограниченное
+    время: если записи какой-то версии нет, данные перечитываются целиком.
+    """
+    _next_version(namespace, changes)
+
+
+def get_reference_changes(namespace: str, since: int,
+                          until: int) -> Optional[list]:
+    """Изменения версий после since до until включительно или None, если
+    журнал неполон."""
+    if not 0 < until - since <= MAX_CHANGES_VERSIONS:
+        return None
+    keys = [
+        _changes_key(namespace, version)
+        for version in range(since + 1, until + 1)
+    ]
+    with unbudgeted():
+        found = caches[SHARED_CACHE].get_many(keys)
+    if len(found) != len(keys):
+        return None
+    return [change for key in keys for change in found[key]]
+
+
+def _count(name: str) -> None:
+    with _stats_lock:
+        _stats[name] += 1
+
+
+def get_reference_cache_stats() -> dict:
+    """Попадания и промахи кэша справочников в этом процессе."""
+    with _stats_lock:
+        return {name: _stats[name] for name in CACHE_STATS}
+
+
+class ReferenceCacheMixin:
+    """Кэширует ответы list/retrieve справочников.
+
+    Ключ строится из пространства имён, его версии, действия, аргументов
+    URL и параметров запроса. Версия увеличивается обработчиками сигналов
+    при изменении моделей, поэтому устаревшие записи просто перестают
+    читаться. Ответ несёт сильный ETag и отдаётся с кодом 304, если
+    клиент прислал совпадающий If-None-Match.
+    """
+
+    cache_namespace = None
+
+    def get_cache_key(self, request, **kwargs) -> str:
+        version = get_reference_cache_version(self.cache_namespace)
+        query_params = sorted(
+            (key, value) for key in request.query_params
+            for value in request.query_params.getlist(key)
+        )
+        return '{}:{}:{}:{}:{}'.format(
+            CACHE_PREFIX,
+            self.cache_namespace,
+            version,
+            self.action,
+            hashlib.sha1(
+                json.dumps([sorted(kwargs.items()), query_params]).encode()
+            ).hexdigest(),
+        )
+
+    def get_cached_response(self, handler, request, *args, **kwargs):
+        key = self.get_cache_key(request, **kwargs)
+        cached = cache.get(key)
+        if cached is None:
+            _count('misses')
+            response = handler(request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+            cached = (make_etag(response.data), response.data)
+            cache.set(key, cached)
+            cache_status = 'MISS'
+        else:
+            _count('hits')
+            cache_status = 'HIT'
+        etag, data = cached
+        if etag_matches(request, etag):
+            response = not_modified_response(etag)
+        else:
+            response = Response(data)
+            response['ETag'] = etag
+        response['X-Cache'] = cache_status
+        return response
+
+    def list(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().list, request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.get_cached_response(
+            super().retrieve, request, *args, **kwargs
+        )
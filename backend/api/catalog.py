@@ -0,0 +1,58 @@
+import threading
+from collections import namedtuple
+
+from foodgram.models import Ingredient, Tag
+from .cache import get_reference_cache_version
+from .instrumentation import unbudgeted
+
+CatalogSnapshot = namedtuple('CatalogSnapshot', ('version', 'objects'))
+
+
+class Catalog:
+    """Справочник модели в памяти процесса.
+
+    Каждый воркер загружает таблицу целиком один раз и сверяет снимок с
+    версией пространства имён в общем кэше: обработчики сигналов
+    увеличивают её при сохранении и удалении, и при следующем обращении
+    все воркеры перечитывают справочник. Объекты снимка общие для всех
+    запросов процесса, изменять их нельзя.
+    """
+
+    def __init__(self, model, namespace):
+        self.model = model
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    def _load(self, version):
+        with unbudgeted():
+            return CatalogSnapshot(version, {
+                instance.pk: instance
+                for instance in self.model._default_manager.all()
+            })
+
+    def get_snapshot(self) -> CatalogSnapshot:
+        # Версия читается до загрузки: изменение, сделанное между ними,
+        # поднимет версию ещё раз, и снимок будет перечитан.
+        version = get_reference_cache_version(self.namespace)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self._load(version)
+        return snapshot
+
+    def get_many(self, pks) -> dict:
+        objects = self.get_snapshot().objects
+        return {pk: objects[pk] for pk in pks if pk in objects}
+
+
+CATALOGS = {
+    Tag: Catalog(Tag, 'tags'),
+    Ingredient: Catalog(Ingredient, 'ingredients'),
+}
+
+
+def get_catalog(model):
+    return CATALOGS.get(model)
@@ -0,0 +1,32 @@
+import hashlib
+import json
+
+from django.utils.http import parse_etags, quote_etag
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+
+def make_etag(data) -> str:
+    content = json.dumps(data, cls=JSONEncoder, sort_keys=True,
+                         ensure_ascii=False)
+    return quote_etag(hashlib.sha1(content.encode('utf-8')).hexdigest())
+
+
+def etag_matches(request, etag: str) -> bool:
+    if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+    if not if_none_match:
+        return False
+    etags = parse_etags(if_none_match)
+    return '*' in etags or etag in etags
+
+
+def set_validators(response: Response, etag: str) -> Response:
+    response['ETag'] = etag
+    return response
+
+
+def not_modified_response(etag: str) -> Response:
+    return set_validators(
+        Response(status=status.HTTP_304_NOT_MODIFIED), etag
+    )
@@ -1,17 +1,145 @@
-import base64
+import binascii
+import tempfile
 import uuid
 
-from django.core.files.base import ContentFile
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.core.files import File
 from rest_framework import serializers
+from rest_framework.fields import get_attribute
+from rest_framework.relations import MANY_RELATION_KWARGS
+
+from foodgram.images import check_image_size, get_variant_urls
+from .loaders import get_identity_map
+
+DECODE_CHUNK_SIZE = 64 * 1024
+SPOOL_MAX_SIZE = 1024 * 1024
 
 
 class Base64ImageField(serializers.ImageField):
+    default_error_messages = {
+        'max_size': 'Размер изображения не должен превышать {max_size} байт.',
+        'max_pixels': 'Изображение не должно быть больше {max_pixels} '
+                      'пикселей.',
+        'invalid_base64': 'Некорректные данные изображения.',
+    }
+
     def to_internal_value(self, data):
         if isinstance(data, str) and data.startswith('data:image'):
             format, imgstr = data.split(';base64,')
             ext = format.split('/')[-1]
+            if len(imgstr) * 3 // 4 > settings.RECIPE_IMAGE_MAX_SIZE:
+                self.fail('max_size', max_size=settings.RECIPE_IMAGE_MAX_SIZE)
             id = uuid.uuid4()
-            data = ContentFile(
-                base64.b64decode(imgstr),
+            data = File(
+                self.decode(imgstr),
                 name=id.urn[9:] + '.' + ext)
-        return super(Base64ImageField, self).to_internal_value(data)
+        image = super(Base64ImageField, self).to_internal_value(data)
+        try:
+            check_image_size(image.image)
+        except ValueError:
+            self.fail('max_pixels',
+                      max_pixels=settings.RECIPE_IMAGE_MAX_PIXELS)
+        return image
+
+    def decode(self, imgstr):
+        """Декодирует base64 во временный файл, который уходит на диск,
+        когда становится больше SPOOL_MAX_SIZE. Сама строка base64 к этому
+        времени уже целиком в памяти: тело запроса разобрано."""
+        decoded = tempfile.SpooledTemporaryFile(max_size=SPOOL_MAX_SIZE)
+        imgstr = ''.join(imgstr.split())
+        try:
+            for start in range(0, len(imgstr), DECODE_CHUNK_SIZE):
+                decoded.write(binascii.a2b_base64(
+                    imgstr[start:start + DECODE_CHUNK_SIZE]
+                ))
+        except binascii.Error:
+            decoded.close()
+            self.fail('invalid_base64')
+        decoded.seek(0)
+        return decoded
+
+
+class ImageVariantsField(serializers.ReadOnlyField):
+    """Ссылки на уменьшенные копии и WebP-вариант изображения рецепта.
+
+    Пока варианты не готовы, возвращается None и клиент использует
+    исходное изображение.
+    """
+
+    def __init__(self, **kwargs):
+        kwargs['source'] = '*'
+        super().__init__(**kwargs)
+
+    def to_representation(self, recipe):
+        if (not recipe.image
+                or recipe.image_variants_source != recipe.image.name):
+            return None
+        request = self.context.get('request')
+        urls = get_variant_urls(recipe.image.name)
+        if request is None:
+            return urls
+        return {
+            variant: request.build_absolute_uri(url)
+            for variant, url in urls.items()
+        }
+
+
+class LoadedManyRelatedField(serializers.ManyRelatedField):
+    """Список связанных объектов через карту идентичности запроса:
+    все ключи проверяются и загружаются одним запросом."""
+
+    @property
+    def identity_map(self):
+        return get_identity_map(self.context.get('request'))
+
+    def get_model(self):
+        return self.child_relation.get_queryset().model
+
+    def to_internal_value(self, data):
+        if isinstance(data, str) or not hasattr(data, '__iter__'):
+            self.fail('not_a_list', input_type=type(data).__name__)
+        if not self.allow_empty and len(data) == 0:
+            self.fail('empty')
+        model = self.get_model()
+        pks = []
+        for item in data:
+            try:
+                if isinstance(item, bool):
+                    raise ValidationError(item)
+                pks.append(model._meta.pk.to_python(item))
+            except ValidationError:
+                self.child_relation.fail(
+                    'incorrect_type', data_type=type(item).__name__
+                )
+        objects = self.identity_map.load_many(model, pks)
+        for pk in pks:
+            if pk not in objects:
+                self.child_relation.fail('does_not_exist', pk_value=pk)
+        return [objects[pk] for pk in pks]
+
+    def get_attribute(self, instance):
+        if instance.pk is None:
+            return []
+        relationship = get_attribute(instance, self.source_attrs)
+        prefetched = getattr(instance, '_prefetched_objects_cache', {})
+        if self.source_attrs[-1] in prefetched:
+            pks = [related.pk for related in relationship.all()]
+        else:
+            pks = list(relationship.values_list('pk', flat=True))
+        objects = self.identity_map.load_many(self.get_model(), pks)
+        return [objects[pk] for pk in pks if pk in objects]
+
+
+class LoadedPrimaryKeyRelatedField(serializers.PrimaryKeyRelatedField):
+    """PrimaryKeyRelatedField, который при many=True загружает объекты
+    через карту идентичности. Объекты берутся из менеджера модели,
+    поэтому queryset поля не должен их дополнительно ограничивать."""
+
+    @classmethod
+    def many_init(cls, *args, **kwargs):
+        list_kwargs = {'child_relation': cls(*args, **kwargs)}
+        for key in kwargs:
+            if key in MANY_RELATION_KWARGS:
+                list_kwargs[key] = kwargs[key]
+        return LoadedManyRelatedField(**list_kwargs)
@@ -1,34 +1,80 @@
 import django_filters as filters
+from django_filters.widgets import QueryArrayWidget
 
-from foodgram.models import Recipe
+from foodgram.models import Favorite, Recipe, ShoppingCart
+from foodgram.ranking import RANKING_ORDERINGS
+
+TAGS_MATCH_ANY = 'any'
+TAGS_MATCH_ALL = 'all'
+
+
+class CharInFilter(filters.BaseInFilter, filters.CharFilter):
+    pass
 
 
 class RecipeFilter(filters.FilterSet):
-    tags = filters.CharFilter(field_name='tags__slug', method='tags_filter')
+    tags = CharInFilter(method='tags_filter', widget=QueryArrayWidget)
+    tags_match = filters.ChoiceFilter(
+        choices=((TAGS_MATCH_ANY, TAGS_MATCH_ANY),
+                 (TAGS_MATCH_ALL, TAGS_MATCH_ALL)),
+        method='tags_match_filter'
+    )
     author = filters.NumberFilter(field_name='author__id')
+    search = filters.CharFilter(method='search_filter')
     is_favorited = filters.NumberFilter(
         method='is_favorited_or_in_shopping_cart_filter'
     )
     is_in_shopping_cart = filters.NumberFilter(
         method='is_favorited_or_in_shopping_cart_filter'
     )
+    # Объявлен последним: явная сортировка заменяет порядок поиска.
+    ordering = filters.ChoiceFilter(
+        choices=[(ordering, ordering) for ordering in RANKING_ORDERINGS],
+        method='ordering_filter'
+    )
 
     CASES_VALUES = [1, 0]
+    USER_LIST_MODELS = {
+        'is_favorited': Favorite,
+        'is_in_shopping_cart': ShoppingCart,
+    }
 
     class Meta:
         model = Recipe
-        fields = ('tags', 'author', 'is_favorited', 'is_in_shopping_cart',)
+        fields = ('tags', 'tags_match', 'author', 'search', 'is_favorited',
+                  'is_in_shopping_cart', 'ordering',)
 
     def tags_filter(self, queryset, name, value):
-        tags_query_parameter = self.request.query_params.getlist('tags')
-        lookup = '__'.join([name, 'in'])
-        return queryset.filter(**{lookup: tags_query_parameter}).distinct()
+        match_all = self.form.cleaned_data.get('tags_match') == TAGS_MATCH_ALL
+        return queryset.with_tags(value, match_all=match_all)
+
+    def tags_match_filter(self, queryset, name, value):
+        # Режим учитывается в tags_filter.
+        return queryset
+
+    def search_filter(self, queryset, name, value):
+        # Найденные рецепты упорядочены по релевантности; остальные
+        # фильтры только сужают выборку.
+        value = value.strip()
+        if not value:
+            return queryset
+        return queryset.search(value)
 
     def is_favorited_or_in_shopping_cart_filter(self, queryset, name, value):
+        # Полусоединение через IN (подзапрос): выборка идёт от коротких
+        # списков пользователя по индексу (user, recipe), без JOIN и
+        # DISTINCT.
         user = self.request.user
         if user.is_authenticated and int(value) in self.CASES_VALUES:
-            if name == 'is_favorited':
-                queryset = queryset.filter(favorites__user=user)
-            if name == 'is_in_shopping_cart':
-                queryset = queryset.filter(purchases__user=user)
+            recipe_ids = self.USER_LIST_MODELS[name].objects.filter(
+                user=user
+            ).values('recipe_id')
+            if int(value):
+                return queryset.filter(pk__in=recipe_ids)
+            return queryset.exclude(pk__in=recipe_ids)
         return queryset
+
+    def ordering_filter(self, queryset, name, value):
+        # Оценки хранятся в рецептах и проиндексированы: сортировка не
+        # считает события избранного и корзин в запросе.
+        return queryset.order_by(*RANKING_ORDERINGS[value])
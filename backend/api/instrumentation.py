@@ -0,0 +1,215 @@
+import logging
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+
+logger = logging.getLogger(__name__)
+
+WHITESPACE = re.compile(r'\s+')
+PLACEHOLDER_LIST = re.compile(r'\(\s*%s(?:\s*,\s*%s)*\s*\)')
+DUPLICATES_IN_MESSAGE = 5
+
+_local = threading.local()
+
+
+class QueryBudgetExceeded(AssertionError):
+    pass
+
+
+def fingerprint(sql: str) -> str:
+    """Текст запроса без параметров: списки IN (%s, %s, ...) разной длины
+    сводятся к одному виду, чтобы N+1 по пачкам тоже считался повтором."""
+    return PLACEHOLDER_LIST.sub('(...)', WHITESPACE.sub(' ', sql).strip())
+
+
+class QueryStats:
+    """Запросы к базе, выполненные за время запроса или блока кода."""
+
+    def __init__(self, budget: int = None, endpoint: str = None):
+        self.budget = budget
+        self.endpoint = endpoint
+        self.queries = []
+        self.unbudgeted = 0
+        self._duplicates = None
+
+    def add(self, sql: str, duration: float) -> None:
+        self.queries.append((sql, duration))
+        self._duplicates = None
+        if getattr(_local, 'unbudgeted', False):
+            self.unbudgeted += 1
+
+    @property
+    def count(self) -> int:
+        return len(self.queries)
+
+    @property
+    def budgeted_count(self) -> int:
+        return self.count - self.unbudgeted
+
+    @property
+    def duration(self) -> float:
+        """Суммарное время запросов в миллисекундах."""
+        return sum(duration for _sql, duration in self.queries) * 1000
+
+    @property
+    def duplicates(self) -> dict:
+        """Повторяющиеся отпечатки запросов и число их выполнений.
+
+        Считаются один раз после последнего запроса: заголовок, журнал и
+        проверка бюджета читают готовый результат.
+        """
+        if self._duplicates is None:
+            counts = Counter(
+                fingerprint(sql) for sql, _duration in self.queries
+            )
+            self._duplicates = {
+                sql: count for sql, count in counts.items() if count > 1
+            }
+        return self._duplicates
+
+    @property
+    def over_budget(self) -> bool:
+        return self.budget is not None and self.budgeted_count > self.budget
+
+    def as_dict(self) -> dict:
+        return {
+            'endpoint': self.endpoint,
+            'queries': self.count,
+            'unbudgeted': self.unbudgeted,
+            'duration_ms': round(self.duration, 2),
+            'duplicates': self.duplicates,
+            'budget': self.budget,
+        }
+
+    def server_timing(self) -> str:
+        metrics = [f'db;dur={self.duration:.2f};desc="{self.count} queries"']
+        duplicates = sum(self.duplicates.values())
+        if duplicates:
+            metrics.append(f'db-duplicates;desc="{duplicates}"')
+        return ', '.join(metrics)
+
+    def check(self) -> None:
+        if not self.over_budget:
+            return
+        message = '{}: {} запросов при бюджете {}'.format(
+            self.endpoint or 'блок кода', self.budgeted_count, self.budget
+        )
+        duplicates = sorted(
+            self.duplicates.items(), key=lambda item: -item[1]
+        )[:DUPLICATES_IN_MESSAGE]
+        for sql, count in duplicates:
+            message += f'\n    {count} × {sql}'
+        raise QueryBudgetExceeded(message)
+
+
+@contextmanager
+def record_queries(stats: QueryStats = None):
+    """Записывает запросы ко всем подключениям в QueryStats."""
+    stats = stats or QueryStats()
+
+    def wrapper(execute, sql, params, many, context):
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            stats.add(sql, time.perf_counter() - start)
+
+    with ExitStack() as stack:
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(wrapper))
+        yield stats
+
+
+@contextmanager
+def unbudgeted():
+    """Запросы блока попадают в статистику, но не в бюджет. Так
+    загружаются данные, общие для всего процесса: их цена платится один
+    раз на воркер, и бюджет не должен зависеть от порядка запросов."""
+    previous = getattr(_local, 'unbudgeted', False)
+    _local.unbudgeted = True
+    try:
+        yield
+    finally:
+        _local.unbudgeted = previous
+
+
+@contextmanager
+def query_budget(budget: int):
+    """Помощник для тестов: падает, если блок выполнил больше запросов."""
+    with record_queries(QueryStats(budget)) as stats:
+        yield stats
+    stats.check()
+
+
+def assert_query_budget(response) -> None:
+    """Помощник для тестов: проверяет ответ тестового клиента на бюджет
+    действия, объявленный во вьюсете."""
+    stats = getattr(response, 'query_stats', None)
+    if stats is None:
+        raise AssertionError(
+            'Ответ получен без QueryInstrumentationMiddleware.'
+        )
+    stats.check()
+
+
+def get_view_budget(view_func, method: str):
+    """Бюджет из атрибута query_budgets вьюсета для действия, которым
+    маршрут обрабатывает метод запроса."""
+    view_class = getattr(view_func, 'cls', None)
+    actions = getattr(view_func, 'actions', None)
+    if view_class is None or not actions:
+        return None, None
+    method = method.lower()
+    if method == 'head' and method not in actions:
+        method = 'get'
+    action = actions.get(method)
+    budgets = getattr(view_class, 'query_budgets', None) or {}
+    return budgets.get(action), f'{view_class.__name__}.{action}'
+
+
+class QueryInstrumentationMiddleware:
+    """Считает запросы к базе и их время для каждого HTTP-запроса.
+
+    Итог попадает в заголовок Server-Timing и в журнал api.instrumentation,
+    ответ получает атрибут query_stats. Превышение бюджета действия
+    записывается предупреждением, а при QUERY_BUDGETS_STRICT — приводит к
+    исключению QueryBudgetExceeded, чтобы тесты падали на регрессиях.
+    Запросы, выполненные при чтении потокового ответа, не учитываются.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        request.query_stats = QueryStats()
+        with record_queries(request.query_stats) as stats:
+            response = self.get_response(request)
+        response.query_stats = stats
+        response['Server-Timing'] = stats.server_timing()
+        self.log(request, response, stats)
+        if settings.QUERY_BUDGETS_STRICT:
+            stats.check()
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        stats = request.query_stats
+        stats.budget, stats.endpoint = get_view_budget(
+            view_func, request.method
+        )
+
+    def log(self, request, response, stats):
+        level = logging.WARNING if stats.over_budget else logging.INFO
+        logger.log(
+            level,
+            '%s %s %s: %d запросов (в бюджете %d из %s), %.2f мс, '
+            'повторов %d',
+            request.method, request.path, response.status_code,
+            stats.count, stats.budgeted_count, stats.budget, stats.duration,
+            sum(stats.duplicates.values()),
+            extra={'query_stats': stats.as_dict()}
+        )
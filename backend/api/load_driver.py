@@ -0,0 +1,190 @@
+import http.client
+import json
+import random
+import re
+import threading
+import time
+from collections import defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from socketserver import ThreadingMixIn
+from wsgiref.simple_server import WSGIRequestHandler, WSGIServer, make_server
+
+from foodgram.models import Ingredient, Recipe, Tag
+from .benchmarks import summarize
+
+SERVER_TIMING_QUERIES = re.compile(r'(?:^|,)\s*db;[^,]*desc="(\d+) queries"')
+RECIPE_SAMPLE_SIZE = 1000
+REQUEST_TIMEOUT = 30
+
+LoadData = namedtuple('LoadData', ('recipe_ids', 'tag_slugs', 'prefixes',
+                                   'pages'))
+Sample = namedtuple('Sample', ('name', 'status', 'duration', 'queries'))
+
+
+class ThreadingWSGIServer(ThreadingMixIn, WSGIServer):
+    daemon_threads = True
+
+
+class QuietRequestHandler(WSGIRequestHandler):
+    def log_message(self, format, *args):
+        pass
+
+
+@contextmanager
+def serve(application):
+    """Запускает WSGI-приложение на свободном локальном порту и отдаёт
+    (хост, порт)."""
+    server = make_server('127.0.0.1', 0, application,
+                         server_class=ThreadingWSGIServer,
+                         handler_class=QuietRequestHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield server.server_address
+    finally:
+        server.shutdown()
+        server.server_close()
+
+
+def get_load_data(page_size) -> LoadData:
+    recipe_ids = list(Recipe.objects.order_by('-pub_date', '-id').values_list(
+        'id', flat=True
+    )[:RECIPE_SAMPLE_SIZE])
+    names = Ingredient.objects.values_list('name', flat=True)[:100]
+    return LoadData(
+        recipe_ids=recipe_ids,
+        tag_slugs=list(Tag.objects.values_list('slug', flat=True)),
+        prefixes=sorted({name[:3] for name in names if len(name) >= 3}),
+        pages=max(1, len(recipe_ids) // page_size),
+    )
+
+
+class LoadClient:
+    def __init__(self, address, token):
+        self.address = address
+        self.token = token
+
+    def request(self, name, method, path, body=None) -> Sample:
+        headers = {'Authorization': f'Token {self.token}'}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+        connection = http.client.HTTPConnection(*self.address,
+                                                timeout=REQUEST_TIMEOUT)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body=body, headers=headers)
+            response = connection.getresponse()
+            response.read()
+        finally:
+            connection.close()
+        duration = time.perf_counter() - started
+        match = SERVER_TIMING_QUERIES.search(
+            response.getheader('Server-Timing', '')
+        )
+        return Sample(name, response.status, duration,
+                      int(match.group(1)) if match else 0)
+
+
+def feed(client, data, rng):
+    page = rng.randint(1, min(data.pages, 10))
+    return [client.request('feed', 'GET', f'/api/recipes/?page={page}')]
+
+
+def feed_by_tags(client, data, rng):
+    query = '&'.join(
+        f'tags={slug}'
+        for slug in rng.sample(data.tag_slugs, min(2, len(data.tag_slugs)))
+    )
+    return [client.request('feed_tags', 'GET', f'/api/recipes/?{query}')]
+
+
+def recipe(client, data, rng):
+    recipe_id = rng.choice(data.recipe_ids)
+    return [client.request('recipe', 'GET', f'/api/recipes/{recipe_id}/')]
+
+
+def search(client, data, rng):
+    path = f'/api/ingredients/?name={rng.choice(data.prefixes)}'
+    return [client.request('search', 'GET', path)]
+
+
+def cart(client, data, rng):
+    # Рецепт, добавленный сценарием, сразу убирается: корзины
+    # пользователей после прогона остаются прежними.
+    path = f'/api/recipes/{rng.choice(data.recipe_ids)}/shopping_cart/'
+    samples = [client.request('cart_add', 'POST', path)]
+    if samples[0].status == 201:
+        samples.append(client.request('cart_remove', 'DELETE', path))
+    return samples
+
+
+def download(client, data, rng):
+    return [client.request(
+        'download', 'GET', '/api/recipes/download_shopping_cart/'
+    )]
+
+
+def subscriptions(client, data, rng):
+    return [client.request(
+        'subscriptions', 'GET', '/api/users/subscriptions/?recipes_limit=3'
+    )]
+
+
+# Сценарий и его доля в смеси запросов.
+SCENARIOS = (
+    (feed, 40),
+    (feed_by_tags, 10),
+    (recipe, 15),
+    (search, 15),
+    (cart, 10),
+    (download, 5),
+    (subscriptions, 5),
+)
+
+
+def run_worker(address, tokens, data, iterations, random_seed):
+    rng = random.Random(random_seed)
+    scenarios, weights = zip(*SCENARIOS)
+    samples = []
+    for _iteration in range(iterations):
+        client = LoadClient(address, rng.choice(tokens))
+        scenario = rng.choices(scenarios, weights=weights)[0]
+        try:
+            samples.extend(scenario(client, data, rng))
+        except (OSError, http.client.HTTPException):
+            samples.append(Sample(scenario.__name__, None, 0, 0))
+    return samples
+
+
+def run_load(address, tokens, data, requests, concurrency,
+             random_seed=0) -> dict:
+    """Прогоняет смесь сценариев в concurrency потоков и возвращает
+    итоги по каждому запросу смеси и по всем вместе (total)."""
+    iterations = max(1, requests // concurrency)
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        workers = [
+            executor.submit(run_worker, address, tokens, data, iterations,
+                            random_seed + number)
+            for number in range(concurrency)
+        ]
+        samples = [sample for worker in workers for sample in worker.result()]
+    grouped = defaultdict(list)
+    for sample in samples:
+        grouped[sample.name].append(sample)
+        grouped['total'].append(sample)
+    results = {}
+    for name, group in grouped.items():
+        completed = [sample for sample in group if sample.status]
+        if not completed:
+            continue
+        results[name] = summarize(
+            [sample.duration for sample in completed],
+            [sample.queries for sample in completed],
+        )
+        results[name]['errors'] = sum(
+            1 for sample in group
+            if sample.status is None or sample.status >= 500
+        )
+    return results
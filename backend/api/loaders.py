@@ -0,0 +1,143 @@
+import logging
+from collections import defaultdict
+
+from foodgram.models import Recipe
+from .catalog import get_catalog
+
+logger = logging.getLogger(__name__)
+
+RECENT_RECIPES_SQL = '''
+    SELECT id, name, cooking_time, image, image_variants_source, author_id
+    FROM (
+        SELECT id, name, cooking_time, image, image_variants_source,
+               author_id, pub_date,
+               ROW_NUMBER() OVER (
+                   PARTITION BY author_id ORDER BY pub_date DESC, id DESC
+               ) AS position
+        FROM {table}
+        WHERE author_id IN ({placeholders})
+    ) ranked
+    WHERE position <= %s
+    ORDER BY author_id, position
+'''
+
+
+def load_recent_recipes(author_ids, limit: int) -> dict:
+    """Последние limit рецептов каждого автора одним запросом
+    с ROW_NUMBER() OVER (PARTITION BY author_id)."""
+    author_ids = sorted(set(author_ids))
+    recipes = defaultdict(list)
+    if not author_ids or limit <= 0:
+        return recipes
+    query = RECENT_RECIPES_SQL.format(
+        table=Recipe._meta.db_table,
+        placeholders=', '.join(['%s'] * len(author_ids)),
+    )
+    for recipe in Recipe.objects.raw(query, [*author_ids, limit]):
+        recipes[recipe.author_id].append(recipe)
+    return recipes
+
+
+class IdentityMap:
+    """Объекты моделей по первичному ключу в пределах одного запроса.
+
+    Повторные обращения к одному объекту получают тот же экземпляр,
+    справочники (теги, ингредиенты) берутся из каталога процесса,
+    остальные ключи загружаются одним запросом на модель. saved —
+    сколько запросов сэкономлено по сравнению с загрузкой каждого
+    объекта отдельным запросом.
+    """
+
+    def __init__(self):
+        self.objects = defaultdict(dict)
+        self.queries = 0
+        self.saved = 0
+
+    def prime(self, *instances):
+        """Регистрирует загруженные объекты и возвращает канонические
+        экземпляры."""
+        return [
+            self.objects[type(instance)].setdefault(instance.pk, instance)
+            for instance in instances
+        ]
+
+    def load_many(self, model, pks) -> dict:
+        pks = {model._meta.pk.to_python(pk) for pk in pks}
+        known = self.objects[model]
+        missing = pks - known.keys()
+        catalog = get_catalog(model)
+        if missing and catalog is not None:
+            known.update(catalog.get_many(missing))
+            missing -= known.keys()
+        if missing:
+            known.update(model._default_manager.in_bulk(missing))
+            self.queries += 1
+        self.saved += len(pks) - bool(missing)
+        return {pk: known[pk] for pk in pks if pk in known}
+
+    def get(self, model, pk):
+        """Уже загруженный объект или None, без обращения к базе."""
+        return self.objects[model].get(pk)
+
+    def load(self, model, pk):
+        return self.load_many(model, [pk]).get(
+            model._meta.pk.to_python(pk)
+        )
+
+    def resolve(self, instances, field_name):
+        """Заполняет внешний ключ field_name у всех объектов.
+
+        Уже загруженные связи (select_related) регистрируются в карте и
+        заменяются каноническими экземплярами, остальные загружаются
+        одним запросом.
+        """
+        if not instances:
+            return
+        field = instances[0]._meta.get_field(field_name)
+        pending = []
+        for instance in instances:
+            if field.is_cached(instance):
+                related = field.get_cached_value(instance)
+                if related is not None:
+                    field.set_cached_value(instance, *self.prime(related))
+            elif getattr(instance, field.attname) is not None:
+                pending.append(instance)
+        if not pending:
+            return
+        pks = {getattr(instance, field.attname) for instance in pending}
+        related = self.load_many(field.related_model, pks)
+        # Без карты каждый объект загрузил бы связь отдельным запросом.
+        self.saved += len(pending) - len(pks)
+        for instance in pending:
+            field.set_cached_value(
+                instance, related.get(getattr(instance, field.attname))
+            )
+
+
+def get_identity_map(request) -> IdentityMap:
+    if request is None:
+        return IdentityMap()
+    if not hasattr(request, '_identity_map'):
+        request._identity_map = IdentityMap()
+    return request._identity_map
+
+
+class IdentityMapMixin:
+    """Сообщает, сколько запросов сэкономила карта идентичности."""
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        identity_map = getattr(request, '_identity_map', None)
+        if identity_map is not None and identity_map.saved:
+            response['X-Identity-Map'] = (
+                f'queries={identity_map.queries}; '
+                f'saved={identity_map.saved}'
+            )
+            logger.debug(
+                '%s %s: карта идентичности сэкономила %d запросов '
+                '(выполнено %d)', request.method, request.path,
+                identity_map.saved, identity_map.queries
+            )
+        return response
@@ -0,0 +1,79 @@
+from django.core.management import CommandError
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from api.benchmarks import (BenchmarkCommand, get_micro_benchmarks,
+                            run_micro_benchmark)
+from api.catalog import CATALOGS
+from foodgram.models import User
+from foodgram.synthetic import generate_dataset
+
+
+class Command(BenchmarkCommand):
+    help = _('Микробенчмарки сериализаторов и фильтров ленты: перцентили '
+             'времени и запросы к базе на операцию')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--seed',
+            type=int,
+            metavar='RECIPES',
+            help=_('Создать указанное количество синтетических рецептов '
+                   'на время замера (изменения откатываются)')
+        )
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help=_('Перекос популярности в синтетических данных')
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=30,
+            help=_('Количество повторов каждого замера')
+        )
+        parser.add_argument(
+            '--only',
+            action='append',
+            metavar='PREFIX',
+            help=_('Выполнить только замеры с указанным префиксом имени, '
+                   'например serializer или filter.tags')
+        )
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            try:
+                if options['seed']:
+                    generate_dataset(recipes=options['seed'],
+                                     skew=options['skew'])
+                results = self.run_benchmarks(options)
+            finally:
+                transaction.set_rollback(True)
+        self.report(results, options)
+
+    def run_benchmarks(self, options):
+        user = (
+            User.objects.filter(
+                favorites__isnull=False, follower__isnull=False
+            ).order_by('id').first()
+            or User.objects.order_by('id').first()
+        )
+        if user is None:
+            raise CommandError(_('Недостаточно данных для замеров.'))
+        # Каталоги справочников загружаются один раз на процесс и в
+        # замеры не входят.
+        for catalog in CATALOGS.values():
+            catalog.get_snapshot()
+        results = {}
+        for benchmark in get_micro_benchmarks(user):
+            if options['only'] and not any(
+                benchmark.name.startswith(prefix)
+                for prefix in options['only']
+            ):
+                continue
+            results[benchmark.name] = run_micro_benchmark(
+                benchmark, options['repeat']
+            )
+        return results
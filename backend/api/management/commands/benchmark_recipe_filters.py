@@ -0,0 +1,85 @@
+import time
+from statistics import median
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.models import Favorite, Recipe, Tag, User
+from foodgram.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = _('Замер времени ленты рецептов: фильтр по тегам через '
+             'JOIN + DISTINCT против EXISTS, избранное через JOIN '
+             'против IN (подзапрос)')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            type=int,
+            metavar='RECIPES',
+            help=_('Создать указанное количество синтетических рецептов '
+                   'на время замера (изменения откатываются)')
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help=_('Количество повторов каждого замера')
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=6,
+            help=_('Размер страницы ленты')
+        )
+
+    def get_variants(self, slugs, user):
+        feed = Recipe.objects.select_related('author').with_user_flags(user)
+        return (
+            ('distinct', feed.filter(tags__slug__in=slugs).distinct()),
+            ('exists_any', feed.with_tags(slugs)),
+            ('exists_all', feed.with_tags(slugs, match_all=True)),
+            ('favorited_join', feed.filter(favorites__user=user)),
+            ('favorited_in', feed.filter(pk__in=Favorite.objects.filter(
+                user=user
+            ).values('recipe_id'))),
+        )
+
+    def measure(self, queryset, limit, repeat):
+        # Страница ленты — это COUNT(*) для пагинатора и первая страница.
+        timings = []
+        for _repeat in range(repeat):
+            started = time.perf_counter()
+            queryset.count()
+            list(queryset[:limit])
+            timings.append(time.perf_counter() - started)
+        return median(timings), max(timings)
+
+    def handle(self, *args, **options):
+        with transaction.atomic():
+            if options['seed']:
+                started = time.monotonic()
+                generate_dataset(recipes=options['seed'])
+                self.stdout.write(
+                    _('Данные созданы за {:.1f} с').format(
+                        time.monotonic() - started
+                    )
+                )
+            slugs = list(Tag.objects.values_list('slug', flat=True)[:2])
+            user = User.objects.filter(favorites__isnull=False).first()
+            self.stdout.write(
+                _('Рецептов: {}, теги: {}').format(
+                    Recipe.objects.count(), ', '.join(slugs)
+                )
+            )
+            for name, queryset in self.get_variants(slugs, user):
+                median_time, max_time = self.measure(
+                    queryset, options['limit'], options['repeat']
+                )
+                self.stdout.write(
+                    f'{name}: медиана {median_time * 1000:.1f} мс, '
+                    f'максимум {max_time * 1000:.1f} мс'
+                )
+            transaction.set_rollback(True)
@@ -0,0 +1,54 @@
+from django.core.management import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from api.query_plans import PLAN_CHECKS, check_query_plans
+from foodgram.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = _('Проверка количества запросов и планов EXPLAIN '
+             'для горячих путей API')
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--seed',
+            action='store_true',
+            help=_('Создать синтетические данные на время проверки '
+                   '(изменения откатываются)')
+        )
+        parser.add_argument(
+            '--check',
+            action='append',
+            choices=[check.name for check in PLAN_CHECKS],
+            help=_('Выполнить только указанные проверки')
+        )
+
+    def handle(self, *args, **options):
+        checks = [
+            check for check in PLAN_CHECKS
+            if not options['check'] or check.name in options['check']
+        ]
+        with transaction.atomic():
+            if options['seed']:
+                generate_dataset()
+            try:
+                results = check_query_plans(checks)
+            except ValueError as error:
+                raise CommandError(str(error))
+            finally:
+                transaction.set_rollback(True)
+        failed = 0
+        for check, path, queries, budget, problems in results:
+            line = f'{check.name}: {path} — {queries}/{budget}'
+            if not problems:
+                self.stdout.write(self.style.SUCCESS(line))
+                continue
+            failed += 1
+            self.stdout.write(self.style.ERROR(line))
+            for problem in problems:
+                self.stdout.write(f'    {problem}')
+        if failed:
+            raise CommandError(
+                _('Проверок не пройдено: {}').format(failed)
+            )
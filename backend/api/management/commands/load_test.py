@@ -0,0 +1,78 @@
+from django.core.management import CommandError
+from django.db import connections
+from django.test.utils import override_settings
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.authtoken.models import Token
+from rest_framework.settings import api_settings
+
+from api.benchmarks import BenchmarkCommand
+from api.load_driver import get_load_data, run_load, serve
+from foodgram.models import User
+
+
+class Command(BenchmarkCommand):
+    help = _('Нагрузочный тест: смесь запросов ленты, поиска, корзины и '
+             'выгрузки списка покупок к backend.wsgi на локальном порту. '
+             'Данные должны быть в базе заранее, например после '
+             'generate_synthetic_data')
+
+    def add_arguments(self, parser):
+        super().add_arguments(parser)
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=2000,
+            help=_('Общее количество сценариев')
+        )
+        parser.add_argument(
+            '--concurrency',
+            type=int,
+            default=8,
+            help=_('Количество параллельных клиентов')
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=20,
+            help=_('Количество пользователей, от имени которых идут запросы')
+        )
+        parser.add_argument(
+            '--random-seed',
+            type=int,
+            default=0,
+            help=_('Зерно выбора сценариев')
+        )
+
+    def handle(self, *args, **options):
+        from backend.wsgi import application
+
+        data = get_load_data(api_settings.PAGE_SIZE)
+        users = list(User.objects.order_by('id')[:options['users']])
+        if not users or not data.recipe_ids or not data.prefixes:
+            raise CommandError(_('Недостаточно данных для нагрузочного '
+                                 'теста: запустите generate_synthetic_data.'))
+        existing = set(Token.objects.filter(
+            user__in=users
+        ).values_list('user_id', flat=True))
+        tokens = [Token.objects.get_or_create(user=user)[0] for user in users]
+        # Соединение команды не должно держать блокировки, пока запросы
+        # обрабатываются в потоках сервера.
+        connections.close_all()
+        try:
+            with override_settings(ALLOWED_HOSTS=['127.0.0.1']):
+                with serve(application) as address:
+                    results = run_load(
+                        address, [token.key for token in tokens], data,
+                        options['requests'], options['concurrency'],
+                        options['random_seed']
+                    )
+        finally:
+            Token.objects.filter(user__in=users).exclude(
+                user_id__in=existing
+            ).delete()
+        for name, result in results.items():
+            if result['errors']:
+                self.stdout.write(self.style.WARNING(
+                    _('{}: ошибок {}').format(name, result['errors'])
+                ))
+        self.report(results, options)
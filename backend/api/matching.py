@@ -0,0 +1,215 @@
+import threading
+from array import array
+from collections import defaultdict, namedtuple
+from itertools import groupby
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count
+
+from foodgram.importer import batched
+from foodgram.models import RecipeIngredient
+from .cache import (get_reference_cache_version, get_reference_changes,
+                    record_reference_changes)
+from .instrumentation import unbudgeted
+
+RECIPE_INGREDIENTS_NAMESPACE = 'recipe-ingredients'
+# Сколько изменённых рецептов держим поверх базового снимка, прежде чем
+# перестроить индекс целиком.
+MAX_OVERLAY_RECIPES = 10000
+BUILD_CHUNK_SIZE = 10000
+CHANGES_BATCH_SIZE = 500
+
+RecipeMatch = namedtuple('RecipeMatch', ('recipe_id', 'matched', 'missing'))
+MatchSnapshot = namedtuple('MatchSnapshot', (
+    'version', 'prefix_size', 'frequencies', 'offsets', 'ingredients',
+    'postings', 'overlay', 'overlay_postings',
+))
+
+
+class RecipeMatchIndex:
+    """Индекс «ингредиент → рецепты» в памяти процесса для подбора
+    рецептов по имеющимся продуктам.
+
+    Ингредиенты каждого рецепта хранятся подряд в одном массиве (смещения
+    в массиве offsets по id рецепта) в порядке от редких к частым. Списки
+    рецептов по ингредиенту строятся только по первым prefix_size
+    ингредиентам рецепта: если рецепту не хватает не больше k продуктов,
+    хотя бы один из любых его k + 1 ингредиентов есть у пользователя.
+    Поэтому кандидатов дают короткие списки редких ингредиентов, а не
+    длинные — соли или муки, и каждый кандидат затем проверяется по
+    полному составу.
+
+    Изменённые рецепты записываются в журнал общего кэша. Воркер, у
+    которого снимок отстал, перечитывает только их и держит поверх
+    базового снимка; при неполном журнале или большом числе изменений
+    индекс строится заново.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @staticmethod
+    def _order(ingredient_ids, frequencies):
+        return sorted(ingredient_ids, key=lambda ingredient_id: (
+            frequencies.get(ingredient_id, 0), ingredient_id
+        ))
+
+    @staticmethod
+    def _add_postings(postings, recipe_id, ingredients, prefix_size):
+        for position, ingredient_id in enumerate(ingredients[:prefix_size]):
+            if ingredient_id not in postings:
+                postings[ingredient_id] = [
+                    array('I') for _position in range(prefix_size)
+                ]
+            postings[ingredient_id][position].append(recipe_id)
+
+    def _build(self, version):
+        prefix_size = settings.RECIPE_MATCH_MAX_MISSING + 1
+        frequencies = dict(RecipeIngredient.objects.order_by().values_list(
+            'ingredient_id'
+        ).annotate(Count('id')))
+        rows = RecipeIngredient.objects.order_by('recipe_id').values_list(
+            'recipe_id', 'ingredient_id'
+        ).iterator(chunk_size=BUILD_CHUNK_SIZE)
+        offsets = array('I')
+        ingredients = array('I')
+        postings = {}
+        for recipe_id, group in groupby(rows, key=itemgetter(0)):
+            ordered = self._order(
+                [ingredient_id for _recipe_id, ingredient_id in group],
+                frequencies
+            )
+            while len(offsets) <= recipe_id:
+                offsets.append(len(ingredients))
+            ingredients.extend(ordered)
+            offsets.append(len(ingredients))
+            self._add_postings(postings, recipe_id, ordered, prefix_size)
+        return MatchSnapshot(
+            version=version,
+            prefix_size=prefix_size,
+            frequencies=frequencies,
+            offsets=offsets,
+            ingredients=ingredients,
+            postings=postings,
+            overlay={},
+            overlay_postings={},
+        )
+
+    def _apply_changes(self, snapshot, version, recipe_ids):
+        overlay = dict(snapshot.overlay)
+        grouped = defaultdict(list)
+        for batch in batched(sorted(set(recipe_ids)), CHANGES_BATCH_SIZE):
+            overlay.update((recipe_id, ()) for recipe_id in batch)
+            for recipe_id, ingredient_id in RecipeIngredient.objects.filter(
+                recipe_id__in=batch
+            ).values_list('recipe_id', 'ingredient_id'):
+                grouped[recipe_id].append(ingredient_id)
+        if len(overlay) > MAX_OVERLAY_RECIPES:
+            return None
+        for recipe_id, ingredient_ids in grouped.items():
+            overlay[recipe_id] = tuple(
+                self._order(ingredient_ids, snapshot.frequencies)
+            )
+        overlay_postings = {}
+        for recipe_id, ingredients in overlay.items():
+            self._add_postings(overlay_postings, recipe_id, ingredients,
+                               snapshot.prefix_size)
+        return snapshot._replace(version=version, overlay=overlay,
+                                 overlay_postings=overlay_postings)
+
+    def _refresh(self, snapshot, version):
+        with unbudgeted():
+            if (snapshot is not None and snapshot.prefix_size
+                    == settings.RECIPE_MATCH_MAX_MISSING + 1):
+                changes = get_reference_changes(
+                    RECIPE_INGREDIENTS_NAMESPACE, snapshot.version, version
+                )
+                if changes is not None:
+                    updated = self._apply_changes(snapshot, version, changes)
+                    if updated is not None:
+                        return updated
+            return self._build(version)
+
+    def _get_snapshot(self):
+        # Как и в каталогах, версия читается до загрузки данных.
+        version = get_reference_cache_version(RECIPE_INGREDIENTS_NAMESPACE)
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != version:
+            with self._lock:
+                snapshot = self._snapshot
+                if snapshot is None or snapshot.version != version:
+                    snapshot = self._snapshot = self._refresh(
+                        snapshot, version
+                    )
+        return snapshot
+
+    @staticmethod
+    def _candidates(snapshot, pantry, max_missing):
+        candidates = set()
+        for postings in (snapshot.postings, snapshot.overlay_postings):
+            for ingredient_id in pantry:
+                recipe_ids = postings.get(ingredient_id)
+                if recipe_ids is None:
+                    continue
+                for position in range(max_missing + 1):
+                    candidates.update(recipe_ids[position])
+        return candidates
+
+    def match(self, ingredient_ids, max_missing):
+        """Рецепты, в которых есть хотя бы один из ингредиентов
+        ingredient_ids и не хватает не больше max_missing остальных.
+
+        Возвращает список RecipeMatch по убыванию доли имеющихся
+        ингредиентов, затем по числу недостающих и новизне рецепта.
+        """
+        snapshot = self._get_snapshot()
+        if not 0 <= max_missing < snapshot.prefix_size:
+            raise ValueError(
+                f'max_missing должен быть от 0 до {snapshot.prefix_size - 1}'
+            )
+        pantry = set(ingredient_ids)
+        candidates = self._candidates(snapshot, pantry, max_missing)
+        # Проверка кандидатов — самая горячая часть запроса: обращения к
+        # снимку вынесены в локальные переменные.
+        overlay = snapshot.overlay
+        offsets = snapshot.offsets
+        ingredients = snapshot.ingredients
+        max_size = len(pantry) + max_missing
+        matches = []
+        for recipe_id in candidates:
+            recipe_ingredients = overlay.get(recipe_id)
+            if recipe_ingredients is None:
+                if recipe_id + 1 >= len(offsets):
+                    continue
+                start, end = offsets[recipe_id], offsets[recipe_id + 1]
+                if end - start > max_size:
+                    continue
+                recipe_ingredients = ingredients[start:end]
+            matched = len(pantry.intersection(recipe_ingredients))
+            missing = len(recipe_ingredients) - matched
+            if matched and missing <= max_missing:
+                # Кортеж сразу в порядке сортировки: сравнение без
+                # функции-ключа заметно быстрее на тысячах совпадений.
+                matches.append((-matched / len(recipe_ingredients), missing,
+                                -recipe_id, matched))
+        matches.sort()
+        return [
+            RecipeMatch(-recipe_id, matched, missing)
+            for _coverage, missing, recipe_id, matched in matches
+        ]
+
+
+def schedule_recipe_ingredient_changes(recipe_ids) -> None:
+    """Записывает изменение состава рецептов в журнал после фиксации
+    транзакции: воркеры перечитают только эти рецепты."""
+    recipe_ids = sorted(set(recipe_ids))
+    if recipe_ids:
+        transaction.on_commit(lambda: record_reference_changes(
+            RECIPE_INGREDIENTS_NAMESPACE, recipe_ids
+        ))
+
+
+recipe_match_index = RecipeMatchIndex()
@@ -1,5 +1,149 @@
+import base64
+import json
+from collections import OrderedDict
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
 from rest_framework.pagination import PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
 
 
 class FoodgramPagination(PageNumberPagination):
+    """Постраничная пагинация с необязательным режимом курсора.
+
+    Если в запросе есть параметр cursor (для первой страницы — пустой),
+    а у view задан cursor_ordering, выборка идёт по ключу сортировки:
+    без COUNT(*) и OFFSET, следующая страница начинается после последней
+    записи текущей.
+    """
+
     page_size_query_param = 'limit'
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = 'Недопустимый курсор.'
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_ordering = getattr(view, 'cursor_ordering', None)
+        self.use_cursor = bool(
+            self.cursor_ordering
+            and self.cursor_query_param in request.query_params
+        )
+        if not self.use_cursor:
+            return super().paginate_queryset(queryset, request, view)
+        return self.paginate_by_cursor(queryset, request)
+
+    def paginate_by_cursor(self, queryset, request):
+        self.request = request
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        queryset = queryset.order_by(*self.cursor_ordering)
+        if cursor:
+            queryset = queryset.filter(
+                self.get_cursor_filter(self.decode_cursor(
+                    queryset.model, cursor, queryset.query.annotations
+                ))
+            )
+        results = list(queryset[:page_size + 1])
+        self.has_next = len(results) > page_size
+        results = results[:page_size]
+        self.next_position = (
+            self.get_position(results[-1]) if self.has_next else None
+        )
+        return results
+
+    def paginate_positions(self, fetch_positions, model, request, view):
+        """Курсорная пагинация по позициям ключа сортировки view.
+
+        fetch_positions(limit, position) возвращает не больше limit
+        позиций записей после position (None — с начала) в порядке
+        cursor_ordering. Страница — список позиций, записи по ним
+        загружает view.
+        """
+        self.request = request
+        self.cursor_ordering = view.cursor_ordering
+        self.use_cursor = True
+        page_size = self.get_page_size(request)
+        cursor = request.query_params.get(self.cursor_query_param)
+        positions = fetch_positions(
+            page_size + 1,
+            tuple(self.decode_cursor(model, cursor)) if cursor else None
+        )
+        self.has_next = len(positions) > page_size
+        positions = positions[:page_size]
+        self.next_position = positions[-1] if self.has_next else None
+        return positions
+
+    def get_position(self, instance):
+        return [
+            getattr(instance, field.lstrip('-'))
+            for field in self.cursor_ordering
+        ]
+
+    def get_cursor_filter(self, position):
+        cursor_filter = Q()
+        for index, field in enumerate(self.cursor_ordering):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition = Q(**{f'{name}__{lookup}': position[index]})
+            for previous_field, value in zip(self.cursor_ordering[:index],
+                                             position[:index]):
+                condition &= Q(**{previous_field.lstrip('-'): value})
+            cursor_filter |= condition
+        return cursor_filter
+
+    def encode_cursor(self, position):
+        # Даты кодируются с микросекундами: равенство по ключу должно быть
+        # точным, иначе записи на границе страниц потеряются.
+        return base64.urlsafe_b64encode(json.dumps([
+            value.isoformat() if hasattr(value, 'isoformat') else value
+            for value in position
+        ]).encode()).decode()
+
+    @staticmethod
+    def get_cursor_field(model, annotations, name):
+        # Ключ может включать вычисляемое поле, например ранг поиска.
+        if name in annotations:
+            return annotations[name].output_field
+        return model._meta.get_field(name)
+
+    def decode_cursor(self, model, cursor, annotations=None):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+            fields = [
+                self.get_cursor_field(
+                    model, annotations or {}, field.lstrip('-')
+                )
+                for field in self.cursor_ordering
+            ]
+            if len(values) != len(fields):
+                raise ValueError
+            return [
+                field.to_python(value) for field, value in zip(fields, values)
+            ]
+        except (TypeError, ValueError, ValidationError, FieldDoesNotExist):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_next_link(self):
+        if not self.use_cursor:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        return replace_query_param(
+            self.request.build_absolute_uri(),
+            self.cursor_query_param,
+            self.encode_cursor(self.next_position)
+        )
+
+    def get_validator_data(self):
+        if self.use_cursor:
+            return self.has_next
+        return self.page.paginator.count
+
+    def get_paginated_response(self, data):
+        if not self.use_cursor:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
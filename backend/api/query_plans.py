@@ -0,0 +1,200 @@
+import re
+from collections import namedtuple
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import override_settings
+from rest_framework.test import APIClient
+
+from foodgram.models import Ingredient, Recipe, Tag, User
+from .cache import (forget_reference_cache_versions,
+                    invalidate_reference_cache)
+from .catalog import CATALOGS
+from .matching import RECIPE_INGREDIENTS_NAMESPACE, recipe_match_index
+
+SEQUENTIAL_SCAN_PATTERNS = {
+    'postgresql': re.compile(r'Seq Scan on "?(\w+)"?'),
+    'sqlite': re.compile(r'^SCAN (?:TABLE )?"?(\w+)"?(?: AS \w+)?$'),
+}
+
+PlanCheck = namedtuple('PlanCheck', ('name', 'path', 'allowed_scans'))
+
+# Проверки горячих путей API. Число запросов сверяется с бюджетом
+# действия из query_budgets вьюсета — тем же, что проверяют тесты
+# бюджетов. В путях подставляются идентификаторы данных, выбранных
+# select_check_data; allowed_scans — таблицы, полный просмотр которых
+# ожидаем: маленькие справочники, построение индекса поиска, COUNT(*)
+# всей ленты при постраничной пагинации, фильтр по тегам, под который
+# попадает значительная доля рецептов, и поиск рецептов через LIKE на
+# СУБД без полнотекстового вектора.
+PLAN_CHECKS = (
+    PlanCheck('recipes', '/api/recipes/', ('foodgram_recipe',)),
+    PlanCheck('recipes_by_tags', '/api/recipes/?tags={tag}&tags={other_tag}',
+              ('foodgram_recipe', 'foodgram_tag')),
+    PlanCheck('recipes_by_all_tags',
+              '/api/recipes/?tags={tag}&tags={other_tag}&tags_match=all',
+              ('foodgram_recipe', 'foodgram_tag')),
+    PlanCheck('recipes_search', '/api/recipes/?search={word}',
+              ('foodgram_recipe', 'foodgram_ingredient')),
+    PlanCheck('recipes_by_author', '/api/recipes/?author={author}', ()),
+    PlanCheck('recipes_favorited', '/api/recipes/?is_favorited=1', ()),
+    PlanCheck('recipes_in_shopping_cart',
+              '/api/recipes/?is_in_shopping_cart=1', ()),
+    PlanCheck('recipes_search_cursor', '/api/recipes/?search={word}&cursor=',
+              ('foodgram_recipe', 'foodgram_ingredient')),
+    PlanCheck('recipes_cursor', '/api/recipes/?cursor=', ()),
+    PlanCheck('recipes_popular', '/api/recipes/?ordering=popular&cursor=',
+              ()),
+    PlanCheck('recipes_trending', '/api/recipes/?ordering=trending',
+              ('foodgram_recipe',)),
+    PlanCheck('recipe', '/api/recipes/{recipe}/', ()),
+    PlanCheck('recipes_match', '/api/recipes/match/?{pantry}&missing=1', ()),
+    PlanCheck('recipes_feed', '/api/recipes/feed/', ()),
+    PlanCheck('tags', '/api/tags/', ('foodgram_tag',)),
+    PlanCheck('ingredients_search', '/api/ingredients/?name={prefix}',
+              ('foodgram_ingredient',)),
+    PlanCheck('users', '/api/users/', ()),
+    PlanCheck('user', '/api/users/{author}/', ()),
+    PlanCheck('subscriptions', '/api/users/subscriptions/?recipes_limit=3',
+              ()),
+    PlanCheck('shopping_list', '/api/recipes/shopping_list/', ()),
+)
+
+
+def explain(sql, params):
+    """План запроса в виде списка строк."""
+    vendor = connection.vendor
+    prefix = 'EXPLAIN QUERY PLAN ' if vendor == 'sqlite' else 'EXPLAIN '
+    with connection.cursor() as cursor:
+        cursor.execute(prefix + sql, params)
+        rows = cursor.fetchall()
+    if vendor == 'sqlite':
+        return [row[-1] for row in rows]
+    return [row[0] for row in rows]
+
+
+def find_sequential_scans(plan):
+    """Таблицы, которые план просматривает целиком. Подзапросы и
+    производные таблицы не учитываются."""
+    pattern = SEQUENTIAL_SCAN_PATTERNS.get(connection.vendor)
+    if pattern is None:
+        return set()
+    tables = set()
+    for line in plan:
+        match = pattern.search(line.strip())
+        if match:
+            tables.add(match.group(1))
+    return tables & set(connection.introspection.table_names())
+
+
+@contextmanager
+def capture_select_queries():
+    """Собирает (sql, params) выполненных SELECT-запросов."""
+    queries = []
+
+    def wrapper(execute, sql, params, many, context):
+        if sql.lstrip().upper().startswith('SELECT'):
+            queries.append((sql, params))
+        return execute(sql, params, many, context)
+
+    with connection.execute_wrapper(wrapper):
+        yield queries
+
+
+@contextmanager
+def index_scans_preferred():
+    # На маленьких таблицах PostgreSQL выбирает Seq Scan даже при наличии
+    # индекса. С enable_seqscan = off полный просмотр останется в плане,
+    # только если подходящего индекса нет.
+    if connection.vendor != 'postgresql':
+        yield
+        return
+    with connection.cursor() as cursor:
+        cursor.execute('SET enable_seqscan = off')
+    try:
+        yield
+    finally:
+        with connection.cursor() as cursor:
+            cursor.execute('RESET enable_seqscan')
+
+
+def select_check_data():
+    """Идентификаторы для подстановки в пути проверок."""
+    user = User.objects.filter(follower__isnull=False).first()
+    tags = list(Tag.objects.values_list('slug', flat=True)[:2])
+    ingredient = Ingredient.objects.first()
+    recipe = Recipe.objects.first()
+    if not (user and len(tags) == 2 and ingredient and recipe):
+        return None, None
+    return user, {
+        'tag': tags[0],
+        'other_tag': tags[1],
+        'author': recipe.author_id,
+        'recipe': recipe.id,
+        'prefix': ingredient.name[:3],
+        'pantry': '&'.join(
+            f'ingredients={ingredient_id}'
+            for ingredient_id in recipe.ingredients.values_list(
+                'id', flat=True
+            )
+        ),
+        'word': recipe.name.split()[0],
+    }
+
+
+def run_check(client, check, data):
+    """Выполняет запрос проверки и возвращает список найденных проблем."""
+    path = check.path.format(**data)
+    with index_scans_preferred(), capture_select_queries() as queries:
+        response = client.get(path)
+    problems = []
+    if response.status_code != 200:
+        problems.append(f'статус ответа {response.status_code}')
+    stats = getattr(response, 'query_stats', None)
+    budget = stats.budget if stats is not None else None
+    if budget is None:
+        problems.append('у действия не объявлен бюджет запросов')
+    elif stats.over_budget:
+        problems.append(
+            f'{stats.endpoint}: {stats.budgeted_count} запросов при бюджете '
+            f'действия {budget}'
+        )
+    with index_scans_preferred():
+        for sql, params in queries:
+            scans = (
+                find_sequential_scans(explain(sql, params))
+                - set(check.allowed_scans)
+            )
+            for table in sorted(scans):
+                problems.append(f'полный просмотр {table}: {sql}')
+    return path, len(queries), budget, problems
+
+
+def check_query_plans(checks=PLAN_CHECKS):
+    """Прогоняет проверки и возвращает [(проверка, путь, запросов,
+    бюджет, проблемы)]."""
+    user, data = select_check_data()
+    if user is None:
+        raise ValueError('Недостаточно данных для проверки планов.')
+    # Ответы справочников из кэша не доходят до базы: сбрасываем версии,
+    # чтобы планы их запросов тоже попали в проверку. Каталоги и индекс
+    # подбора рецептов прогреваются заранее — бюджеты рассчитаны на
+    # рабочий режим. Версии не перечитываются до конца проверок, иначе
+    # чтение общего кэша попадёт в счёт запросов случайного пути.
+    client = APIClient()
+    client.force_authenticate(user)
+    results = []
+    try:
+        with override_settings(ALLOWED_HOSTS=['testserver'],
+                               REFERENCE_CACHE_VERSION_TTL=float('inf')):
+            for namespace in ('tags', 'ingredients',
+                              RECIPE_INGREDIENTS_NAMESPACE):
+                invalidate_reference_cache(namespace)
+            for catalog in CATALOGS.values():
+                catalog.get_snapshot()
+            recipe_match_index.match((), 0)
+            for check in checks:
+                results.append((check, *run_check(client, check, data)))
+    finally:
+        forget_reference_cache_versions()
+    return results
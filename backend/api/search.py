@@ -0,0 +1,122 @@
+import bisect
+import threading
+from collections import namedtuple
+
+from foodgram.models import Ingredient
+from .catalog import get_catalog
+
+IndexSnapshot = namedtuple(
+    'IndexSnapshot', ('version', 'keys', 'rows', 'trigrams', 'short_rows')
+)
+
+
+class IngredientSearchIndex:
+    """Индекс ингредиентов в памяти процесса.
+
+    Названия хранятся отсортированными: совпадения по началу строки
+    находятся двоичным поиском, совпадения внутри строки — пересечением
+    списков позиций по триграммам. Индекс строится из каталога
+    ингредиентов и перестраивается, когда меняется версия каталога.
+    """
+
+    NGRAM_SIZE = 3
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._snapshot = None
+
+    @staticmethod
+    def normalize(value):
+        return value.strip().lower()
+
+    def _ngrams(self, value):
+        return {
+            value[i:i + self.NGRAM_SIZE]
+            for i in range(len(value) - self.NGRAM_SIZE + 1)
+        }
+
+    def _build(self, catalog_snapshot):
+        rows = sorted(
+            (self.normalize(ingredient.name), ingredient.pk, ingredient)
+            for ingredient in catalog_snapshot.objects.values()
+        )
+        trigrams = {}
+        short_rows = []
+        for position, row in enumerate(rows):
+            if len(row[0]) < self.NGRAM_SIZE:
+                short_rows.append(position)
+            for ngram in self._ngrams(row[0]):
+                trigrams.setdefault(ngram, []).append(position)
+        return IndexSnapshot(
+            version=catalog_snapshot.version,
+            keys=[row[0] for row in rows],
+            rows=rows,
+            trigrams=trigrams,
+            short_rows=short_rows,
+        )
+
+    def _get_snapshot(self):
+        catalog_snapshot = get_catalog(Ingredient).get_snapshot()
+        snapshot = self._snapshot
+        if snapshot is None or snapshot.version != catalog_snapshot.version:
+            with self._lock:
+                snapshot = self._snapshot
+                if (snapshot is None
+                        or snapshot.version != catalog_snapshot.version):
+                    snapshot = self._snapshot = self._build(catalog_snapshot)
+        return snapshot
+
+    def _substring_positions(self, snapshot, keyword):
+        if len(keyword) < self.NGRAM_SIZE:
+            return self._short_substring_positions(snapshot, keyword)
+        postings = sorted(
+            (snapshot.trigrams.get(ngram, ()) for ngram in
+             self._ngrams(keyword)),
+            key=len
+        )
+        candidates = set(postings[0])
+        for positions in postings[1:]:
+            candidates.intersection_update(positions)
+            if not candidates:
+                break
+        return sorted(candidates)
+
+    def _short_substring_positions(self, snapshot, keyword):
+        # Для ключа короче триграммы объединяем списки позиций всех
+        # триграмм, содержащих его. Если совпадений много, дешевле пройти
+        # по строкам по порядку и остановиться на первых limit.
+        postings = [
+            positions for ngram, positions in snapshot.trigrams.items()
+            if keyword in ngram
+        ]
+        if sum(map(len, postings)) > len(snapshot.rows) // 4:
+            return range(len(snapshot.rows))
+        candidates = set(snapshot.short_rows)
+        for positions in postings:
+            candidates.update(positions)
+        return sorted(candidates)
+
+    def search(self, keyword, limit):
+        """Возвращает не более limit ингредиентов: сначала те, что
+        начинаются с keyword, затем содержащие его внутри названия."""
+        keyword = self.normalize(keyword)
+        if not keyword or limit <= 0:
+            return []
+        snapshot = self._get_snapshot()
+        start = bisect.bisect_left(snapshot.keys, keyword)
+        end = start
+        while (end < len(snapshot.keys) and end - start < limit
+               and snapshot.keys[end].startswith(keyword)):
+            end += 1
+        found = list(range(start, end))
+        if len(found) < limit:
+            for position in self._substring_positions(snapshot, keyword):
+                key = snapshot.keys[position]
+                if keyword in key and not key.startswith(keyword):
+                    found.append(position)
+                    if len(found) == limit:
+                        break
+        return [snapshot.rows[position][2] for position in found]
+
+
+ingredient_search_index = IngredientSearchIndex()
@@ -1,3 +1,9 @@
+from collections import Counter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Manager
+from django.utils.translation import ugettext_lazy as _
 from djoser.serializers import (
     UserCreateSerializer as DjoserUserCreateSerializer,
     UserSerializer as DjoserUserSerializer
@@ -5,10 +11,21 @@ from djoser.serializers import (
 from rest_framework import serializers
 
 from foodgram.models import (
-    Follow, Ingredient, Recipe, RecipeIngredient, RecipeTag, Tag, User
+    Follow, Ingredient, Recipe, RecipeIngredient, RecipeTag,
+    ShoppingListItem, Tag, User
 )
+from foodgram.counters import change_counter
+from foodgram.feed import schedule_fan_out
+from foodgram.images import schedule_recipe_image_variants
+from foodgram.search import schedule_search_vector_update
+from foodgram.shopping_list import refresh_recipe_in_shopping_lists
+from foodgram.user_lists import delete_rows
 from users.validators import validate_username
-from .fields import Base64ImageField
+from .fields import (Base64ImageField, ImageVariantsField,
+                     LoadedPrimaryKeyRelatedField)
+from .loaders import get_identity_map, load_recent_recipes
+from .matching import schedule_recipe_ingredient_changes
+from .utilities import get_subscribed_author_ids
 from .validators import validate_ingredients
 
 
@@ -31,9 +48,10 @@ class UserSerializer(MixinUserSerializer, DjoserUserSerializer):
         read_only_fields = ('is_subscribed',)
 
     def get_is_subscribed(self, obj):
-        user = self.context.get('request').user
+        request = self.context.get('request')
+        user = request.user
         if user.is_authenticated and user != obj:
-            status = user.follower.filter(author=obj).exists()
+            status = obj.id in get_subscribed_author_ids(request)
         else:
             status = False
         return status
@@ -58,10 +76,43 @@ class FavoriteOrShoppingCartRecipeSerializer(serializers.Serializer):
         fields = ('id', 'name', 'cooking_time', 'image')
 
 
+class UserListBatchSerializer(serializers.Serializer):
+    ids = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.USER_LIST_BATCH_MAX_ITEMS,
+    )
+
+
+class RecipeMatchQuerySerializer(serializers.Serializer):
+    ingredients = serializers.ListField(
+        child=serializers.IntegerField(min_value=1),
+        allow_empty=False,
+        max_length=settings.RECIPE_MATCH_MAX_INGREDIENTS,
+    )
+    missing = serializers.IntegerField(
+        min_value=0,
+        max_value=settings.RECIPE_MATCH_MAX_MISSING,
+        default=0,
+    )
+
+
 class FollowRecipeSerializer(serializers.ModelSerializer):
+    image_variants = ImageVariantsField()
+
     class Meta:
         model = Recipe
-        fields = ('id', 'name', 'cooking_time', 'image')
+        fields = ('id', 'name', 'cooking_time', 'image', 'image_variants')
+
+
+class FollowListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        follows = list(data.all() if isinstance(data, Manager) else data)
+        self.child.recent_recipes = load_recent_recipes(
+            [follow.author_id for follow in follows],
+            self.child.get_recipes_limit()
+        )
+        return super().to_representation(follows)
 
 
 class FollowSerializer(serializers.Serializer):
@@ -74,34 +125,45 @@ class FollowSerializer(serializers.Serializer):
     recipes_count = serializers.SerializerMethodField()
     recipes = serializers.SerializerMethodField()
 
+    recent_recipes = None
+
     class Meta:
         model = Follow
         fields = ('id', 'email', 'username', 'first_name', 'last_name',
                   'is_subscribed', 'recipes', 'recipes_count')
+        list_serializer_class = FollowListSerializer
+
+    def get_recipes_limit(self):
+        recipes_limit = self.context.get('request').query_params.get(
+            'recipes_limit', 0
+        )
+        try:
+            recipes_limit = int(recipes_limit)
+        except (TypeError, ValueError):
+            recipes_limit = -1
+        if recipes_limit < 0:
+            raise serializers.ValidationError(
+                {'recipes_limit': _('Ожидается неотрицательное целое число.')}
+            )
+        return recipes_limit
 
     def get_is_subscribed(self, obj):
-        request_user = self.context.get('request').user.id
-        return Follow.objects.filter(
-            user=request_user,
-            author=obj.author
-        ).exists()
+        return obj.user_id == self.context.get('request').user.id
 
     def get_recipes_count(self, obj):
-        return obj.author.recipes.count()
+        return obj.author.recipes_count
 
     def get_recipes(self, obj):
-        recipes_limit = int(self.context.get('request').query_params.get(
-            'recipes_limit', 0
-        ))
-        return obj.author.recipes.all()[:recipes_limit]
-
-    def to_representation(self, instance):
-        data = super(FollowSerializer, self).to_representation(instance)
-        data['recipes'] = FollowRecipeSerializer(
-            instance=data.get('recipes'),
-            many=True
+        recent_recipes = self.recent_recipes
+        if recent_recipes is None:
+            recent_recipes = load_recent_recipes(
+                [obj.author_id], self.get_recipes_limit()
+            )
+        return FollowRecipeSerializer(
+            instance=recent_recipes.get(obj.author_id, []),
+            many=True,
+            context=self.context
         ).data
-        return data
 
 
 class TagSerializer(serializers.ModelSerializer):
@@ -118,6 +180,29 @@ class IngredientSerializer(serializers.ModelSerializer):
         read_only_fields = ('id', 'name', 'measurement_unit',)
 
 
+class ShoppingListItemSerializer(serializers.ModelSerializer):
+    id = serializers.ReadOnlyField(source='ingredient.id')
+    name = serializers.ReadOnlyField(source='ingredient.name')
+    measurement_unit = serializers.ReadOnlyField(
+        source='ingredient.measurement_unit'
+    )
+
+    class Meta:
+        model = ShoppingListItem
+        fields = ('id', 'name', 'measurement_unit', 'amount')
+
+
+class RecipeIngredientListSerializer(serializers.ListSerializer):
+    def to_representation(self, data):
+        recipe_ingredients = list(
+            data.all() if isinstance(data, Manager) else data
+        )
+        get_identity_map(self.context.get('request')).resolve(
+            recipe_ingredients, 'ingredient'
+        )
+        return super().to_representation(recipe_ingredients)
+
+
 class RecipeIngredientSerializer(serializers.ModelSerializer):
     id = serializers.IntegerField(source='ingredient.id')
     name = serializers.ReadOnlyField(source='ingredient.name')
@@ -128,12 +213,65 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
     class Meta:
         model = RecipeIngredient
         fields = ('id', 'name', 'measurement_unit', 'amount')
+        list_serializer_class = RecipeIngredientListSerializer
+
+
+class RecipeListSerializer(serializers.ListSerializer):
+    """Создание рецептов пачкой: строки рецептов, тегов и ингредиентов
+    вставляются несколькими bulk-запросами."""
+
+    relation_fields = ('tags', 'recipeingredient_set')
+
+    @transaction.atomic
+    def create(self, validated_data):
+        recipes = [
+            Recipe(**{
+                field: value for field, value in item.items()
+                if field not in self.relation_fields
+            })
+            for item in validated_data
+        ]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Recipe.objects.bulk_create(recipes)
+            # bulk_create не отправляет post_save: счётчики авторов,
+            # обработку изображений и раскладку по лентам запускаем сами.
+            authors = Counter(recipe.author_id for recipe in recipes)
+            for author_id, count in authors.items():
+                change_counter(User, author_id, 'recipes_count', count)
+            for recipe in recipes:
+                schedule_recipe_image_variants(recipe)
+            schedule_search_vector_update(Recipe.objects.filter(
+                pk__in=[recipe.pk for recipe in recipes]
+            ))
+            schedule_recipe_ingredient_changes(
+                recipe.pk for recipe in recipes
+            )
+            schedule_fan_out(recipes)
+        else:
+            for recipe in recipes:
+                recipe.save()
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe=recipe, tag=tag)
+            for recipe, item in zip(recipes, validated_data)
+            for tag in item['tags']
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=recipe_ingredient['ingredient']['id'],
+                amount=recipe_ingredient['amount']
+            )
+            for recipe, item in zip(recipes, validated_data)
+            for recipe_ingredient in item['recipeingredient_set']
+        ])
+        return recipes
 
 
 class RecipeSerializer(serializers.ModelSerializer):
     image = Base64ImageField()
+    image_variants = ImageVariantsField()
     author = UserSerializer(read_only=True)
-    tags = serializers.PrimaryKeyRelatedField(
+    tags = LoadedPrimaryKeyRelatedField(
         many=True,
         queryset=Tag.objects.all(),
     )
@@ -145,14 +283,17 @@ class RecipeSerializer(serializers.ModelSerializer):
     class Meta:
         model = Recipe
         fields = ('id', 'name', 'text', 'author', 'cooking_time', 'image',
-                  'is_favorited', 'is_in_shopping_cart', 'tags',
-                  'ingredients',)
+                  'image_variants', 'is_favorited', 'is_in_shopping_cart',
+                  'tags', 'ingredients',)
         read_only_fields = ('is_favorited', 'is_in_shopping_cart',)
+        list_serializer_class = RecipeListSerializer
 
     def current_user(self):
         return self.context.get('request').user
 
     def get_is_favorited(self, obj):
+        if hasattr(obj, 'is_favorited'):
+            return obj.is_favorited
         if self.current_user().is_authenticated:
             return Recipe.objects.filter(
                 id=obj.id,
@@ -161,6 +302,8 @@ class RecipeSerializer(serializers.ModelSerializer):
         return False
 
     def get_is_in_shopping_cart(self, obj):
+        if hasattr(obj, 'is_in_shopping_cart'):
+            return obj.is_in_shopping_cart
         if self.current_user().is_authenticated:
             return Recipe.objects.filter(
                 id=obj.id,
@@ -170,7 +313,12 @@ class RecipeSerializer(serializers.ModelSerializer):
 
     def to_representation(self, instance):
         data = super(RecipeSerializer, self).to_representation(instance)
-        data['tags'] = TagSerializer(instance=instance.tags, many=True).data
+        # Теги уже загружены полем tags и лежат в карте идентичности.
+        identity_map = get_identity_map(self.context.get('request'))
+        data['tags'] = TagSerializer(
+            instance=[identity_map.get(Tag, pk) for pk in data['tags']],
+            many=True
+        ).data
         return data
 
     def validate_tags(self, value):
@@ -181,18 +329,25 @@ class RecipeSerializer(serializers.ModelSerializer):
         return value
 
     def validate(self, data):
-        if not validate_ingredients(data.get('recipeingredient_set')):
+        if not validate_ingredients(
+            data.get('recipeingredient_set'),
+            get_identity_map(self.context.get('request'))
+        ):
             raise serializers.ValidationError(
                 {'ingredients': 'Невозможно провести валидацию.'}
             )
         return super().validate(data)
 
     def create_tags(self, tags, recipe_object):
+        if not tags:
+            return
         RecipeTag.objects.bulk_create(
             [RecipeTag(recipe=recipe_object, tag=tag) for tag in tags]
         )
 
     def create_ingredients(self, ingredients, recipe_object):
+        if not ingredients:
+            return
         RecipeIngredient.objects.bulk_create(
             [
                 RecipeIngredient(
@@ -203,6 +358,7 @@ class RecipeSerializer(serializers.ModelSerializer):
             ]
         )
 
+    @transaction.atomic
     def create(self, validated_data):
         tags = validated_data.pop('tags')
         ingredients = validated_data.pop('recipeingredient_set')
@@ -211,11 +367,80 @@ class RecipeSerializer(serializers.ModelSerializer):
         self.create_ingredients(ingredients, recipe)
         return recipe
 
+    def update_tags(self, tags, recipe_object):
+        current_ids = set(
+            RecipeTag.objects.filter(
+                recipe=recipe_object
+            ).values_list('tag_id', flat=True)
+        )
+        submitted_ids = {tag.id for tag in tags}
+        removed_ids = current_ids - submitted_ids
+        if removed_ids:
+            RecipeTag.objects.filter(
+                recipe=recipe_object,
+                tag_id__in=removed_ids
+            ).delete()
+        self.create_tags(
+            [tag for tag in tags if tag.id not in current_ids], recipe_object
+        )
+
+    def update_ingredients(self, ingredients, recipe_object):
+        current = {
+            recipe_ingredient.ingredient_id: recipe_ingredient
+            for recipe_ingredient in RecipeIngredient.objects.filter(
+                recipe=recipe_object
+            ).only('id', 'ingredient_id', 'amount')
+        }
+        submitted = {
+            recipe_ingredient['ingredient']['id']: recipe_ingredient['amount']
+            for recipe_ingredient in ingredients
+        }
+        removed_ids = current.keys() - submitted.keys()
+        if removed_ids:
+            # Без сигналов: списки покупок пересчитываются в update()
+            # один раз для всех изменённых ингредиентов.
+            delete_rows(RecipeIngredient, 'id', [
+                current[ingredient_id].id for ingredient_id in removed_ids
+            ])
+        changed = []
+        for ingredient_id, amount in submitted.items():
+            recipe_ingredient = current.get(ingredient_id)
+            if recipe_ingredient and recipe_ingredient.amount != amount:
+                recipe_ingredient.amount = amount
+                changed.append(recipe_ingredient)
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        added = [
+            recipe_ingredient for recipe_ingredient in ingredients
+            if recipe_ingredient['ingredient']['id'] not in current
+        ]
+        self.create_ingredients(added, recipe_object)
+        return removed_ids.union(
+            recipe_ingredient.ingredient_id for recipe_ingredient in changed
+        ).union(
+            recipe_ingredient['ingredient']['id']
+            for recipe_ingredient in added
+        )
+
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
+        # Блокируем рецепт, чтобы параллельные правки не смешали
+        # сравнение текущих и новых связей.
+        Recipe.objects.select_for_update().only('id').get(pk=instance.pk)
+        tags = validated_data.pop('tags', None)
         ingredients = validated_data.pop('recipeingredient_set')
-        instance.tags.clear()
-        instance.ingredients.clear()
-        self.create_tags(tags, instance)
-        self.create_ingredients(ingredients, instance)
+        if tags is not None:
+            self.update_tags(tags, instance)
+        refresh_recipe_in_shopping_lists(
+            instance.id, self.update_ingredients(ingredients, instance)
+        )
         return super(RecipeSerializer, self).update(instance, validated_data)
+
+
+class RecipeMatchSerializer(RecipeSerializer):
+    matched_ingredients = serializers.IntegerField(read_only=True)
+    missing_ingredients = serializers.IntegerField(read_only=True)
+
+    class Meta(RecipeSerializer.Meta):
+        fields = RecipeSerializer.Meta.fields + ('matched_ingredients',
+                                                 'missing_ingredients',)
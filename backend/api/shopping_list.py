@@ -0,0 +1,118 @@
+import csv
+import io
+import json
+import os
+from functools import lru_cache
+
+from django.conf import settings
+
+from foodgram.models import ShoppingListItem
+
+SHOPPING_LIST_TITLE = 'Продуктовый помощник'
+SHOPPING_LIST_SUBTITLE = 'Список покупок'
+SHOPPING_LIST_HEADER = ('Ингредиент', 'Единица измерения', 'Количество')
+
+PDF_FONT_NAME = 'ShoppingListFont'
+PDF_FONT_SIZE = 12
+PDF_LINE_HEIGHT = 18
+PDF_MARGIN = 50
+PDF_CHUNK_SIZE = 64 * 1024
+
+
+def get_shopping_list(user):
+    """Строки (название, единица измерения, количество) из заранее
+    посчитанного списка покупок пользователя."""
+    return ShoppingListItem.objects.filter(
+        user=user
+    ).values_list(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+        'amount',
+    ).order_by(
+        'ingredient__name',
+        'ingredient__measurement_unit',
+    )
+
+
+def export_txt(rows):
+    yield f'{SHOPPING_LIST_TITLE}\n{SHOPPING_LIST_SUBTITLE}\n\n'
+    for ingredient, measurement_unit, amount in rows:
+        yield f'{ingredient} - {amount}({measurement_unit})\n'
+
+
+class Echo:
+    def write(self, value):
+        return value
+
+
+def export_csv(rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(SHOPPING_LIST_HEADER)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def export_json(rows):
+    separator = ''
+    yield '['
+    for ingredient, measurement_unit, amount in rows:
+        yield separator + json.dumps(
+            {
+                'name': ingredient,
+                'measurement_unit': measurement_unit,
+                'amount': amount,
+            },
+            ensure_ascii=False
+        )
+        separator = ','
+    yield ']'
+
+
+@lru_cache(maxsize=None)
+def get_pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+
+    if not os.path.exists(settings.SHOPPING_LIST_PDF_FONT):
+        return 'Helvetica'
+    pdfmetrics.registerFont(
+        TTFont(PDF_FONT_NAME, settings.SHOPPING_LIST_PDF_FONT)
+    )
+    return PDF_FONT_NAME
+
+
+def export_pdf(rows):
+    # Таблица ссылок PDF записывается в конце файла, поэтому документ
+    # собирается целиком и затем отдаётся частями.
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font = get_pdf_font()
+    buffer = io.BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    pdf.setFont(font, PDF_FONT_SIZE)
+    y = height - PDF_MARGIN
+    for line in (SHOPPING_LIST_TITLE, SHOPPING_LIST_SUBTITLE, ''):
+        pdf.drawString(PDF_MARGIN, y, line)
+        y -= PDF_LINE_HEIGHT
+    for ingredient, measurement_unit, amount in rows:
+        if y < PDF_MARGIN:
+            pdf.showPage()
+            pdf.setFont(font, PDF_FONT_SIZE)
+            y = height - PDF_MARGIN
+        pdf.drawString(
+            PDF_MARGIN, y, f'{ingredient} - {amount}({measurement_unit})'
+        )
+        y -= PDF_LINE_HEIGHT
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(PDF_CHUNK_SIZE), b'')
+
+
+SHOPPING_LIST_EXPORTERS = {
+    'txt': export_txt,
+    'csv': export_csv,
+    'json': export_json,
+    'pdf': export_pdf,
+}
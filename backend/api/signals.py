@@ -0,0 +1,33 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from foodgram.models import Ingredient, Recipe, RecipeIngredient, Tag
+from .cache import invalidate_reference_cache
+from .matching import schedule_recipe_ingredient_changes
+
+# Версия поднимается после фиксации транзакции: иначе другой воркер
+# может перечитать каталог до коммита и закрепить старые данные под
+# новой версией.
+
+
+@receiver((post_save, post_delete), sender=Ingredient)
+def invalidate_ingredient_cache(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate_reference_cache('ingredients'))
+
+
+@receiver((post_save, post_delete), sender=Tag)
+def invalidate_tag_cache(sender, **kwargs):
+    transaction.on_commit(lambda: invalidate_reference_cache('tags'))
+
+
+@receiver((post_save, post_delete), sender=Recipe)
+def record_recipe_change(sender, instance, **kwargs):
+    # Составы рецептов записываются bulk_create и удаляются запросом без
+    # сигналов, но сам рецепт при этом сохраняется или удаляется.
+    schedule_recipe_ingredient_changes([instance.pk])
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def record_recipe_ingredient_change(sender, instance, **kwargs):
+    schedule_recipe_ingredient_changes([instance.recipe_id])
@@ -0,0 +1,45 @@
+from django.test import TestCase
+from django.utils.http import http_date
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from foodgram.models import Recipe, User
+
+
+class RecipeConditionalRequestsTest(TestCase):
+    """Условные запросы рецепта опираются только на ETag, который
+    меняется и при изменении автора."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pw',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Борщ', text='Сварить.', cooking_time=60
+        )
+
+    def setUp(self):
+        self.client = APIClient()
+        self.url = f'/api/recipes/{self.recipe.pk}/'
+
+    def test_matching_etag_gives_not_modified(self):
+        response = self.client.get(self.url)
+        self.assertNotIn('Last-Modified', response)
+        response = self.client.get(
+            self.url, HTTP_IF_NONE_MATCH=response['ETag']
+        )
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    def test_author_change_is_not_hidden_by_if_modified_since(self):
+        etag = self.client.get(self.url)['ETag']
+        User.objects.filter(pk=self.author.pk).update(first_name='Повар')
+        for headers in ({'HTTP_IF_MODIFIED_SINCE': http_date()},
+                        {'HTTP_IF_NONE_MATCH': etag}):
+            with self.subTest(headers=headers):
+                response = self.client.get(self.url, **headers)
+                self.assertEqual(response.status_code, status.HTTP_200_OK)
+                self.assertEqual(
+                    response.data['author']['first_name'], 'Повар'
+                )
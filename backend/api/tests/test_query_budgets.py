@@ -0,0 +1,194 @@
+import shutil
+import tempfile
+
+from django.core.cache import cache
+from django.test import TransactionTestCase, override_settings
+from rest_framework import status
+from rest_framework.authtoken.models import Token
+from rest_framework.test import APIClient
+
+from api.instrumentation import assert_query_budget, query_budget
+from api.views import (IngredientViewSet, RecipeViewSet,
+                       ReferenceCacheStatsViewSet, TagViewSet, UserViewSet)
+from foodgram.models import (Favorite, Follow, Ingredient, Recipe,
+                             RecipeIngredient, RecipeTag, ShoppingCart, Tag,
+                             User)
+
+VIEWSETS = (UserViewSet, RecipeViewSet, TagViewSet, IngredientViewSet,
+            ReferenceCacheStatsViewSet)
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT, FEED_FANOUT_WORKERS=0,
+                   RECIPE_IMAGE_WORKERS=0)
+class QueryBudgetsTest(TransactionTestCase):
+    """Каждое действие с объявленным бюджетом укладывается в него при
+    авторизации по токену, как в рабочем режиме.
+
+    TransactionTestCase: в TestCase транзакции действий становятся
+    точками сохранения с лишними запросами, а on_commit не выполняется.
+    """
+
+    def setUp(self):
+        cache.clear()
+        self.checked = set()
+        self.author = self.create_user('author')
+        self.reader = self.create_user('reader')
+        self.other = self.create_user('other')
+        self.staff = self.create_user('staff', is_staff=True)
+        self.tags = [
+            Tag.objects.create(name=name, color=color, slug=slug)
+            for name, color, slug in (('Завтрак', '#E26C2D', 'breakfast'),
+                                      ('Обед', '#49B64E', 'lunch'))
+        ]
+        self.ingredients = [
+            Ingredient.objects.create(name=name, measurement_unit='г')
+            for name in ('Капуста', 'Свёкла', 'Картофель')
+        ]
+        self.recipes = []
+        for number in range(3):
+            recipe = Recipe.objects.create(
+                author=self.author, name=f'Борщ {number}', text='Сварить.',
+                cooking_time=60
+            )
+            RecipeTag.objects.create(recipe=recipe, tag=self.tags[0])
+            for ingredient in self.ingredients:
+                RecipeIngredient.objects.create(
+                    recipe=recipe, ingredient=ingredient, amount=100
+                )
+            self.recipes.append(recipe)
+        Follow.objects.create(user=self.reader, author=self.author)
+        Favorite.objects.create(user=self.reader, recipe=self.recipes[0])
+        ShoppingCart.objects.create(user=self.reader, recipe=self.recipes[0])
+
+    def create_user(self, username, **extra):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.org',
+            password='Kapusta-2022', first_name='Имя', last_name='Фамилия',
+            **extra
+        )
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def client_for(self, user=None):
+        client = APIClient()
+        if user is not None:
+            token, _created = Token.objects.get_or_create(user=user)
+            client.credentials(HTTP_AUTHORIZATION=f'Token {token.key}')
+        return client
+
+    def check(self, client, method, path, expected_status, data=None):
+        response = getattr(client, method)(path, data, format='json')
+        self.assertEqual(response.status_code, expected_status,
+                         getattr(response, 'data', None))
+        stats = response.query_stats
+        self.assertIsNotNone(stats.budget, f'{path}: бюджет не объявлен')
+        assert_query_budget(response)
+        self.checked.add(stats.endpoint)
+        return response
+
+    def recipe_body(self, **extra):
+        return dict({
+            'name': 'Щи', 'text': 'Сварить.', 'cooking_time': 40,
+            'image': IMAGE, 'tags': [self.tags[0].id],
+            'ingredients': [{'id': ingredient.id, 'amount': 200}
+                            for ingredient in self.ingredients[:2]],
+        }, **extra)
+
+    def test_every_budget_is_kept(self):
+        anonymous = self.client_for()
+        reader = self.client_for(self.reader)
+        author = self.client_for(self.author)
+        recipe_ids = [recipe.id for recipe in self.recipes]
+        ok, created = status.HTTP_200_OK, status.HTTP_201_CREATED
+        no_content = status.HTTP_204_NO_CONTENT
+        cases = (
+            (reader, 'get', '/api/users/', ok, None),
+            (reader, 'get', f'/api/users/{self.author.id}/', ok, None),
+            (reader, 'get', '/api/users/me/', ok, None),
+            (anonymous, 'post', '/api/users/', created, {
+                'username': 'newcomer', 'email': 'newcomer@example.org',
+                'password': 'Kapusta-2022', 'first_name': 'Имя',
+                'last_name': 'Фамилия',
+            }),
+            (reader, 'get', '/api/users/subscriptions/?recipes_limit=2', ok,
+             None),
+            (reader, 'post', f'/api/users/{self.other.id}/subscribe/',
+             created, None),
+            (reader, 'delete', f'/api/users/{self.other.id}/subscribe/',
+             no_content, None),
+            (reader, 'post', '/api/users/subscribe/', ok,
+             {'ids': [self.other.id, self.staff.id]}),
+            (reader, 'delete', '/api/users/subscribe/', ok,
+             {'ids': [self.other.id, self.staff.id]}),
+            (reader, 'get', '/api/recipes/', ok, None),
+            (reader, 'get', '/api/recipes/?cursor=', ok, None),
+            (reader, 'get', f'/api/recipes/{recipe_ids[0]}/', ok, None),
+            (reader, 'post', f'/api/recipes/{recipe_ids[1]}/favorite/',
+             created, None),
+            (reader, 'delete', f'/api/recipes/{recipe_ids[1]}/favorite/',
+             no_content, None),
+            (reader, 'post', f'/api/recipes/{recipe_ids[1]}/shopping_cart/',
+             created, None),
+            (reader, 'delete',
+             f'/api/recipes/{recipe_ids[1]}/shopping_cart/', no_content,
+             None),
+            (reader, 'post', '/api/recipes/favorite/', ok,
+             {'ids': recipe_ids}),
+            (reader, 'delete', '/api/recipes/favorite/', ok,
+             {'ids': recipe_ids}),
+            (reader, 'post', '/api/recipes/shopping_cart/', ok,
+             {'ids': recipe_ids}),
+            (reader, 'delete', '/api/recipes/shopping_cart/', ok,
+             {'ids': recipe_ids[1:]}),
+            (reader, 'get', '/api/recipes/shopping_list/', ok, None),
+            (reader, 'get', '/api/recipes/download_shopping_cart/', ok,
+             None),
+            (reader, 'get',
+             f'/api/recipes/match/?ingredients={self.ingredients[0].id}'
+             f'&missing=2', ok, None),
+            (reader, 'get', '/api/recipes/feed/', ok, None),
+            (author, 'post', '/api/recipes/', created, self.recipe_body()),
+            (author, 'patch', f'/api/recipes/{recipe_ids[0]}/', ok,
+             self.recipe_body(
+                 tags=[self.tags[1].id],
+                 ingredients=[{'id': self.ingredients[2].id, 'amount': 5}]
+             )),
+            (author, 'delete', f'/api/recipes/{recipe_ids[0]}/',
+             no_content, None),
+            (anonymous, 'get', '/api/tags/', ok, None),
+            (anonymous, 'get', f'/api/tags/{self.tags[0].id}/', ok, None),
+            (anonymous, 'get', '/api/ingredients/', ok, None),
+            (anonymous, 'get', '/api/ingredients/?name=Кап', ok, None),
+            (anonymous, 'get',
+             f'/api/ingredients/{self.ingredients[0].id}/', ok, None),
+            (self.client_for(self.staff), 'get',
+             '/api/reference-cache-stats/', ok, None),
+            (reader, 'post', '/api/users/set_password/', no_content, {
+                'current_password': 'Kapusta-2022',
+                'new_password': 'Svyokla-2022',
+            }),
+        )
+        for client, method, path, expected_status, data in cases:
+            with self.subTest(method=method, path=path):
+                self.check(client, method, path, expected_status, data)
+        declared = {
+            f'{viewset.__name__}.{action}'
+            for viewset in VIEWSETS for action in viewset.query_budgets
+        }
+        self.assertEqual(declared - self.checked, set())
+
+    def test_query_budget_helper(self):
+        with query_budget(1):
+            Recipe.objects.count()
+        with self.assertRaises(AssertionError):
+            with query_budget(1):
+                Recipe.objects.count()
+                Recipe.objects.count()
@@ -0,0 +1,18 @@
+from django.test import TestCase
+
+from api.query_plans import check_query_plans
+from foodgram.synthetic import generate_dataset
+
+
+class QueryPlansTest(TestCase):
+    """Горячие пути API укладываются в бюджет запросов и не читают
+    большие таблицы целиком (см. check_query_plans)."""
+
+    @classmethod
+    def setUpTestData(cls):
+        generate_dataset()
+
+    def test_hot_paths(self):
+        for check, path, queries, budget, problems in check_query_plans():
+            with self.subTest(check.name, path=path):
+                self.assertEqual(problems, [], f'{queries}/{budget} запросов')
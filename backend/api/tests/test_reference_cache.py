@@ -0,0 +1,117 @@
+import os
+
+from django.core.cache import cache, caches
+from django.test import TestCase, override_settings
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from api import cache as reference_cache
+from foodgram.models import Tag, User
+
+NAMESPACE = 'tags'
+STATS_URL = '/api/reference-cache-stats/'
+TAGS_URL = '/api/tags/'
+
+
+class SharedVersionTest(TestCase):
+    """Версии справочников хранятся в общем кэше, и изменение, сделанное
+    другим процессом (например, командой manage.py), видно воркеру."""
+
+    def setUp(self):
+        reference_cache.forget_reference_cache_versions()
+        self.addCleanup(reference_cache.forget_reference_cache_versions)
+
+    def bump_in_other_process(self):
+        remembered = dict(reference_cache._versions)
+        reference_cache._versions.clear()
+        reference_cache.invalidate_reference_cache(NAMESPACE)
+        reference_cache._versions.clear()
+        reference_cache._versions.update(remembered)
+
+    def test_version_is_stored_in_shared_cache(self):
+        version = reference_cache.get_reference_cache_version(NAMESPACE)
+        self.assertEqual(
+            caches[reference_cache.SHARED_CACHE].get(
+                reference_cache._version_key(NAMESPACE)
+            ),
+            version
+        )
+
+    @override_settings(REFERENCE_CACHE_VERSION_TTL=0)
+    def test_invalidation_from_other_process_is_seen(self):
+        version = reference_cache.get_reference_cache_version(NAMESPACE)
+        self.bump_in_other_process()
+        self.assertGreater(
+            reference_cache.get_reference_cache_version(NAMESPACE), version
+        )
+
+    @override_settings(REFERENCE_CACHE_VERSION_TTL=60)
+    def test_version_is_reread_after_ttl(self):
+        version = reference_cache.get_reference_cache_version(NAMESPACE)
+        self.bump_in_other_process()
+        self.assertEqual(
+            reference_cache.get_reference_cache_version(NAMESPACE), version
+        )
+        reference_cache._versions[NAMESPACE] = (version, 0)
+        self.assertGreater(
+            reference_cache.get_reference_cache_version(NAMESPACE), version
+        )
+
+    def test_own_invalidation_is_seen_immediately(self):
+        version = reference_cache.get_reference_cache_version(NAMESPACE)
+        reference_cache.record_reference_changes(NAMESPACE, [1])
+        new_version = reference_cache.get_reference_cache_version(NAMESPACE)
+        self.assertGreater(new_version, version)
+        self.assertEqual(
+            reference_cache.get_reference_changes(
+                NAMESPACE, version, new_version
+            ),
+            [1]
+        )
+
+
+class ReferenceCacheStatsTest(TestCase):
+    """Счётчики кэша видны через API процесса, который обслуживал
+    запросы к справочникам."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.staff = User.objects.create_user(
+            username='staff', email='staff@example.org', password='pw',
+            first_name='Админ', last_name='Сайта', is_staff=True
+        )
+        cls.user = User.objects.create_user(
+            username='user', email='user@example.org', password='pw',
+            first_name='Обычный', last_name='Пользователь'
+        )
+        Tag.objects.create(name='Завтрак', color='#E26C2D', slug='breakfast')
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def get_stats(self):
+        self.client.force_authenticate(self.staff)
+        response = self.client.get(STATS_URL)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response.data
+
+    def test_counts_hits_and_misses_of_this_process(self):
+        before = self.get_stats()
+        self.client.logout()
+        self.assertEqual(self.client.get(TAGS_URL)['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get(TAGS_URL)['X-Cache'], 'HIT')
+        after = self.get_stats()
+        self.assertEqual(after['pid'], os.getpid())
+        self.assertEqual(after['misses'] - before['misses'], 1)
+        self.assertEqual(after['hits'] - before['hits'], 1)
+
+    def test_only_staff_can_read_stats(self):
+        self.assertEqual(
+            self.client.get(STATS_URL).status_code,
+            status.HTTP_401_UNAUTHORIZED
+        )
+        self.client.force_authenticate(self.user)
+        self.assertEqual(
+            self.client.get(STATS_URL).status_code, status.HTTP_403_FORBIDDEN
+        )
@@ -0,0 +1,64 @@
+from datetime import timedelta
+
+from django.test import TestCase
+from django.utils import timezone
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from foodgram.models import Recipe, User
+from foodgram.search import update_search_vectors
+
+SEARCH_URL = '/api/recipes/?search=borscht'
+
+
+class SearchCursorTest(TestCase):
+    """Курсорная пагинация поиска сохраняет порядок по релевантности."""
+
+    @classmethod
+    def setUpTestData(cls):
+        author = User.objects.create_user(
+            username='author', email='author@example.org', password='pw',
+            first_name='Автор', last_name='Рецептов'
+        )
+        now = timezone.now()
+        # Совпадение в названии важнее свежести: новые рецепты, где слово
+        # есть только в описании, должны идти после старых.
+        for age, name, text in ((5, 'Borscht', 'Cook.'),
+                                (4, 'Green borscht', 'Cook.'),
+                                (3, 'Soup', 'Like borscht.'),
+                                (2, 'Stew', 'Borscht style.'),
+                                (1, 'Salad', 'Cut.')):
+            recipe = Recipe.objects.create(
+                author=author, name=name, text=text, cooking_time=10
+            )
+            Recipe.objects.filter(pk=recipe.pk).update(
+                pub_date=now - timedelta(days=age)
+            )
+        # Векторы пересчитываются в on_commit, который TestCase не
+        # выполняет; без них поиск в PostgreSQL ничего не найдёт.
+        update_search_vectors()
+
+    def setUp(self):
+        self.client = APIClient()
+
+    def get_ids(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return response, [recipe['id'] for recipe in response.data['results']]
+
+    def test_cursor_pages_follow_relevance(self):
+        _response, expected = self.get_ids(SEARCH_URL)
+        self.assertEqual(
+            [Recipe.objects.get(pk=pk).name for pk in expected],
+            ['Green borscht', 'Borscht', 'Stew', 'Soup']
+        )
+        ids, url = [], f'{SEARCH_URL}&cursor=&limit=1'
+        while url:
+            response, page = self.get_ids(url)
+            ids += page
+            url = response.data['next']
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_not_found(self):
+        response = self.client.get(f'{SEARCH_URL}&cursor=WzFd')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
@@ -1,7 +1,8 @@
 from django.urls import include, path
 from rest_framework import routers
 
-from .views import IngredientViewSet, RecipeViewSet, TagViewSet, UserViewSet
+from .views import (IngredientViewSet, RecipeViewSet,
+                    ReferenceCacheStatsViewSet, TagViewSet, UserViewSet)
 
 app_name = 'api'
 
@@ -10,6 +11,8 @@ router.register(r'recipes', RecipeViewSet, basename='recipes')
 router.register(r'users', UserViewSet, basename='users')
 router.register(r'ingredients', IngredientViewSet, basename='ingredients')
 router.register(r'tags', TagViewSet, basename='tags')
+router.register(r'reference-cache-stats', ReferenceCacheStatsViewSet,
+                basename='reference-cache-stats')
 
 urlpatterns = [
     path('auth/', include('djoser.urls.authtoken')),
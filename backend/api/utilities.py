@@ -1,5 +1,6 @@
-from typing import Type
+from typing import Iterable, Type
 
+from django.db import IntegrityError, transaction
 from django.db.models import Model
 from django.db.models.base import ModelBase
 from django.shortcuts import get_object_or_404
@@ -7,35 +8,52 @@ from rest_framework import serializers, status
 from rest_framework.request import Request
 from rest_framework.response import Response
 
+from foodgram.user_lists import (add_to_user_list, lock_user,
+                                 remove_from_user_list)
+
+
+def get_subscribed_author_ids(request: Request) -> set:
+    if not hasattr(request, '_subscribed_author_ids'):
+        request._subscribed_author_ids = set(
+            request.user.follower.values_list('author_id', flat=True)
+        )
+    return request._subscribed_author_ids
+
 
 def delete_object(model: ModelBase, fields: dict,
-                  exist: bool, errors_message: str) -> Response:
-    if not exist:
+                  errors_message: str) -> Response:
+    with transaction.atomic():
+        lock_user(fields['user'].pk)
+        deleted, _rows = model.objects.filter(**fields).delete()
+    if not deleted:
         return Response(
             {
                 'errors': errors_message
             },
             status=status.HTTP_400_BAD_REQUEST
         )
-    get_object_or_404(model, **fields).delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 def response_created_object(model: Type[Model], fields: dict,
-                            exist: bool, errors_message: str,
+                            errors_message: str,
                             serializer_class: serializers.SerializerMetaclass,
                             context: dict) -> Response:
-    if exist:
+    # Повтор и другие недопустимые связи отсекают ограничения таблицы.
+    # Блокировка пользователя не даёт пакетному добавлению посчитать эту
+    # строку своей.
+    try:
+        with transaction.atomic():
+            lock_user(fields['user'].pk)
+            created_object = model.objects.create(**fields)
+    except IntegrityError:
         return Response(
             {
                 'errors': errors_message
             },
             status=status.HTTP_400_BAD_REQUEST
         )
-    serializer = serializer_class(
-        model.objects.create(**fields),
-        context=context
-    )
+    serializer = serializer_class(created_object, context=context)
     return Response(serializer.data, status=status.HTTP_201_CREATED)
 
 
@@ -50,19 +68,46 @@ def create_or_delete_favorite_or_purchase_recipe(
 ) -> Response:
     recipe = get_object_or_404(model_recipe, pk=pk_object)
     fields = {'user': request.user, 'recipe': recipe}
-    if_already_exists = model_object.objects.filter(**fields).exists()
     if request.method == 'DELETE':
         return delete_object(
             model=model_object,
             fields=fields,
-            exist=if_already_exists,
             errors_message=delete_errors_message,
         )
     return response_created_object(
         model=model_object,
         fields=fields,
-        exist=if_already_exists,
         errors_message=post_errors_message,
         serializer_class=serializer_class,
         context={'request': request}
     )
+
+
+def change_user_list_batch(request: Request,
+                           model: Type[Model],
+                           target_model: Type[Model],
+                           serializer_class: serializers.SerializerMetaclass,
+                           excluded_ids: Iterable[int] = ()) -> Response:
+    """Добавляет в список пользователя или удаляет из него пачку объектов.
+
+    POST отвечает списками added, unchanged (уже были в списке) и invalid
+    (не существуют или недопустимы), DELETE — removed и unchanged.
+    """
+    serializer = serializer_class(data=request.data)
+    serializer.is_valid(raise_exception=True)
+    ids = set(serializer.validated_data['ids'])
+    if request.method == 'DELETE':
+        removed = remove_from_user_list(model, request.user.pk, ids)
+        return Response({
+            'removed': removed,
+            'unchanged': sorted(ids.difference(removed)),
+        })
+    found = set(target_model.objects.filter(
+        pk__in=ids.difference(excluded_ids)
+    ).values_list('pk', flat=True))
+    added = add_to_user_list(model, request.user.pk, found)
+    return Response({
+        'added': added,
+        'unchanged': sorted(found.difference(added)),
+        'invalid': sorted(ids - found),
+    })
@@ -2,49 +2,48 @@ from django.utils.translation import ugettext_lazy as _
 from rest_framework import serializers
 
 from foodgram.models import Ingredient
+from .loaders import IdentityMap
 
 
-def validate_ingredients(ingredients: dict) -> bool:
+def validate_ingredients(ingredients: list,
+                         identity_map: IdentityMap = None) -> bool:
+    """Проверяет ингредиенты рецепта одним запросом id__in.
+
+    Ингредиенты загружаются через карту идентичности, поэтому при
+    выводе созданного рецепта они уже не запрашиваются повторно.
+
+    Ошибки возвращаются списком по позициям, как у вложенного
+    сериализатора: элемент с ошибкой получает словарь с описанием,
+    корректный — пустой словарь.
+    """
     if not ingredients:
         raise serializers.ValidationError(
             {
                 'ingredients': 'Обязательное поле.'
             }
         )
-    ingredient_list = []
-    for ingredient_item in ingredients:
+    ingredient_ids = [item['ingredient']['id'] for item in ingredients]
+    identity_map = identity_map or IdentityMap()
+    existing_ids = set(identity_map.load_many(
+        Ingredient,
+        [ingredient_id for ingredient_id in ingredient_ids if ingredient_id]
+    ))
+    missing_ids = set(ingredient_ids) - existing_ids
+    errors = [{} for _item in ingredients]
+    seen_ids = set()
+    for position, ingredient_item in enumerate(ingredients):
         ingredient_id = ingredient_item['ingredient']['id']
-        amount = ingredient_item['amount']
         if not ingredient_id:
-            raise serializers.ValidationError(
-                {
-                    'ingredients': {
-                        'id': _('Обязательное поле.')
-                    }
-                }
-            )
-        if not amount:
-            raise serializers.ValidationError(
-                {
-                    'ingredients': {
-                        'amount': _('Обязательное поле.')
-                    }
-                }
-            )
-        ingredient = Ingredient.objects.filter(id=ingredient_id)
-        ingredient_exists = ingredient.exists()
-        if not ingredient_exists:
-            raise serializers.ValidationError(
-                {
-                    'ingredients': {
-                        'id': _('Ингридиента не существует.')
-                    }
-                }
-            )
-        ingredient = ingredient.get()
-        if ingredient in ingredient_list:
-            raise serializers.ValidationError(
+            errors[position]['id'] = _('Обязательное поле.')
+        elif ingredient_id in missing_ids:
+            errors[position]['id'] = _('Ингридиента не существует.')
+        elif ingredient_id in seen_ids:
+            errors[position]['id'] = _(
                 'Недопустимо дублирование ингридиентов.'
             )
-        ingredient_list.append(ingredient)
+        if not ingredient_item['amount']:
+            errors[position]['amount'] = _('Обязательное поле.')
+        seen_ids.add(ingredient_id)
+    if any(errors):
+        raise serializers.ValidationError({'ingredients': errors})
     return True
@@ -1,27 +1,60 @@
-from django.db.models import Case, IntegerField, Q, Sum, Value, When
-from django.http import HttpResponse
+import os
+from itertools import chain
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from django.http import StreamingHttpResponse
 from django.shortcuts import get_object_or_404
 from django.utils.translation import ugettext_lazy as _
 from django_filters.rest_framework import DjangoFilterBackend
 from djoser.views import UserViewSet as DjoserUserViewSet
 from rest_framework import permissions, status, viewsets
 from rest_framework.decorators import action
+from rest_framework.exceptions import PermissionDenied
 from rest_framework.response import Response
 
-from foodgram.models import (Favorite, Follow, Ingredient, Recipe,
-                             ShoppingCart, Tag, User)
+from foodgram.feed import get_feed_positions
+from foodgram.models import (SEARCH_ORDERING, Favorite, Follow, Ingredient,
+                             Recipe, ShoppingCart, Tag, User)
+from foodgram.ranking import RANKING_ORDERINGS
+from foodgram.user_lists import delete_recipe
+from .cache import (ReferenceCacheMixin, get_reference_cache_stats,
+                    get_reference_cache_version)
+from .conditional import (etag_matches, make_etag, not_modified_response,
+                          set_validators)
 from .filter import RecipeFilter
+from .loaders import IdentityMapMixin
+from .matching import recipe_match_index
 from .permissions import IsOwner, IsOwnerOrReadOnly
+from .renderers import SHOPPING_LIST_RENDERERS
+from .search import ingredient_search_index
 from .serializers import (FavoriteOrShoppingCartRecipeSerializer,
                           FollowSerializer, IngredientSerializer,
-                          RecipeSerializer, TagSerializer)
-from .utilities import (create_or_delete_favorite_or_purchase_recipe,
-                        delete_object, response_created_object)
+                          RecipeMatchQuerySerializer, RecipeMatchSerializer,
+                          RecipeSerializer, ShoppingListItemSerializer,
+                          TagSerializer, UserListBatchSerializer)
+from .shopping_list import SHOPPING_LIST_EXPORTERS, get_shopping_list
+from .utilities import (change_user_list_batch,
+                        create_or_delete_favorite_or_purchase_recipe,
+                        delete_object, get_subscribed_author_ids,
+                        response_created_object)
 
 
 class UserViewSet(DjoserUserViewSet):
     queryset = User.objects.all()
     lookup_field = 'pk'
+    cursor_ordering = None
+    query_budgets = {
+        'list': 4,
+        'retrieve': 3,
+        'me': 2,
+        'create': 4,
+        'set_password': 4,
+        'subscriptions': 5,
+        'subscribe': 12,
+        'subscribe_batch': 14,
+    }
 
     @action(
         methods=['post', 'delete'],
@@ -32,32 +65,46 @@ class UserViewSet(DjoserUserViewSet):
     def subscribe(self, request, pk=None):
         author = get_object_or_404(User, pk=pk)
         fields = {'user': request.user, 'author': author}
-        if_already_exists = Follow.objects.filter(**fields).exists()
         if request.method == 'DELETE':
             return delete_object(
                 model=Follow,
                 fields=fields,
-                exist=if_already_exists,
                 errors_message=_('Вы еще не подписаны!'),
             )
         return response_created_object(
             model=Follow,
             fields=fields,
-            exist=bool(if_already_exists or request.user == author),
             errors_message=_('Вы уже подписаны или пытаетесь '
-                             'подписатьсяна самого себя.'),
+                             'подписаться на самого себя.'),
             serializer_class=self.get_serializer_class(),
             context={'request': request}
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='subscribe',
+        url_name='subscribe-batch',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def subscribe_batch(self, request):
+        return change_user_list_batch(
+            request=request,
+            model=Follow,
+            target_model=User,
+            serializer_class=UserListBatchSerializer,
+            excluded_ids=[request.user.pk]
+        )
+
     @action(
         methods=['get'],
         detail=False,
         permission_classes=[IsOwner],
         serializer_class=FollowSerializer,
+        cursor_ordering=('-id',),
     )
     def subscriptions(self, request):
-        user = request.user.follower.all()
+        user = request.user.follower.select_related('author')
         page = self.paginate_queryset(user)
         serializer = self.get_serializer(
             page,
@@ -67,49 +114,275 @@ class UserViewSet(DjoserUserViewSet):
         return self.get_paginated_response(serializer.data)
 
 
-class IngredientViewSet(viewsets.ReadOnlyModelViewSet):
+class IngredientViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = IngredientSerializer
+    queryset = Ingredient.objects.all()
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
+    cache_namespace = 'ingredients'
+    query_budgets = {'list': 2, 'retrieve': 2}
 
     INGREDIENT_SEARCH_PARAM = 'name'
 
-    def get_queryset(self):
-        queryset = Ingredient.objects.all()
-        keywords = self.request.query_params.get(self.INGREDIENT_SEARCH_PARAM)
-        if keywords:
-            at_beginning = Q(name__regex=fr'^{keywords}')
-            anywhere = Q(name__regex=fr'{keywords}')
-            search_type_ordering_expression = Case(
-                When(at_beginning, then=Value(1)),
-                When(anywhere, then=Value(0)),
-                default=Value(-1),
-                output_field=IntegerField()
-            )
-            queryset = queryset.filter(at_beginning | anywhere).annotate(
-                search_type_ordering=search_type_ordering_expression
-            ).distinct().order_by('-search_type_ordering')
-        return queryset
+    def list(self, request, *args, **kwargs):
+        if not request.query_params.get(self.INGREDIENT_SEARCH_PARAM):
+            return super().list(request, *args, **kwargs)
+        return self.get_cached_response(self.search, request)
+
+    def search(self, request):
+        keywords = request.query_params.get(self.INGREDIENT_SEARCH_PARAM)
+        serializer = self.get_serializer(
+            ingredient_search_index.search(
+                keywords, settings.INGREDIENT_SEARCH_LIMIT
+            ),
+            many=True
+        )
+        return Response(serializer.data)
 
 
-class TagViewSet(viewsets.ReadOnlyModelViewSet):
+class TagViewSet(ReferenceCacheMixin, viewsets.ReadOnlyModelViewSet):
     serializer_class = TagSerializer
     queryset = Tag.objects.all()
     permission_classes = (permissions.AllowAny,)
     pagination_class = None
+    cache_namespace = 'tags'
+    query_budgets = {'list': 2, 'retrieve': 2}
+
+
+class ReferenceCacheStatsViewSet(viewsets.ViewSet):
+    """Попадания и промахи кэша справочников воркера, обработавшего
+    запрос: у каждого процесса свой счёт."""
+
+    permission_classes = (permissions.IsAdminUser,)
+    query_budgets = {'list': 1}
 
+    def list(self, request):
+        return Response({'pid': os.getpid(), **get_reference_cache_stats()})
 
-class RecipeViewSet(viewsets.ModelViewSet):
-    queryset = Recipe.objects.all()
+
+class RecipeViewSet(IdentityMapMixin, viewsets.ModelViewSet):
     serializer_class = RecipeSerializer
     permission_classes = (IsOwnerOrReadOnly,)
     http_method_names = ['get', 'post', 'patch', 'delete',
                          'head', 'options', 'trace']
     filter_backends = (DjangoFilterBackend,)
     filterset_class = RecipeFilter
+    cursor_ordering = ('-pub_date', '-id')
+    # Бюджет bulk не объявлен: без RETURNING рецепты пакета сохраняются
+    # по одному, и число запросов растёт с размером пакета.
+    query_budgets = {
+        'list': 6,
+        'retrieve': 5,
+        'create': 8,
+        'partial_update': 20,
+        'destroy': 20,
+        'favorite': 8,
+        'shopping_cart': 15,
+        'favorite_batch': 9,
+        'shopping_cart_batch': 16,
+        'shopping_list': 2,
+        'download_shopping_cart': 2,
+        'match': 5,
+        'feed': 7,
+    }
+
+    def get_queryset(self):
+        return Recipe.objects.select_related('author').with_user_flags(
+            self.request.user
+        )
+
+    def get_etag(self, recipes, *extra):
+        """ETag набора рецептов.
+
+        В ETag входят версии рецептов, данные авторов, версии справочников
+        и флаги текущего пользователя, поэтому условный ответ корректен для
+        каждого пользователя отдельно. Last-Modified не отдаётся: дата
+        изменения рецепта не учитывает изменения авторов, тегов и
+        ингредиентов.
+        """
+        user = self.request.user
+        subscriptions = (
+            get_subscribed_author_ids(self.request)
+            if user.is_authenticated else set()
+        )
+        return make_etag([
+            user.id,
+            extra,
+            get_reference_cache_version('tags'),
+            get_reference_cache_version('ingredients'),
+            [
+                (recipe.id, recipe.updated_at, recipe.image_variants_source,
+                 recipe.is_favorited, recipe.is_in_shopping_cart,
+                 recipe.author_id,
+                 recipe.author.email, recipe.author.username,
+                 recipe.author.first_name, recipe.author.last_name,
+                 recipe.author_id in subscriptions)
+                for recipe in recipes
+            ],
+        ])
+
+    def list(self, request, *args, **kwargs):
+        # Курсор идёт по тому же ключу, что и выбранная сортировка:
+        # явная сортировка заменяет порядок по релевантности поиска,
+        # недопустимое значение отклонит фильтр.
+        ordering = request.query_params.get('ordering')
+        if ordering in RANKING_ORDERINGS:
+            self.cursor_ordering = RANKING_ORDERINGS[ordering]
+        elif request.query_params.get('search', '').strip():
+            self.cursor_ordering = SEARCH_ORDERING
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        recipes = list(queryset) if page is None else page
+        etag = self.get_etag(
+            recipes,
+            self.paginator.get_validator_data() if page is not None else None
+        )
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        prefetch_related_objects(recipes, *Recipe.objects.related_lookups())
+        serializer = self.get_serializer(recipes, many=True)
+        if page is None:
+            response = Response(serializer.data)
+        else:
+            response = self.get_paginated_response(serializer.data)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        recipe = self.get_object()
+        etag = self.get_etag([recipe])
+        if etag_matches(request, etag):
+            return not_modified_response(etag)
+        prefetch_related_objects([recipe], *Recipe.objects.related_lookups())
+        serializer = self.get_serializer(recipe)
+        return set_validators(Response(serializer.data), etag)
 
     def perform_create(self, serializer):
-        serializer.save(author=self.request.user)
+        recipe = serializer.save(author=self.request.user)
+        # Новый рецепт ещё никто не добавил в избранное и покупки.
+        recipe.is_favorited = recipe.is_in_shopping_cart = False
+
+    def perform_destroy(self, instance):
+        delete_recipe(instance)
+
+    def get_bulk_instances(self, items):
+        ids = set()
+        for item in items:
+            if isinstance(item, dict) and item.get('id') is not None:
+                try:
+                    ids.add(int(item['id']))
+                except (TypeError, ValueError):
+                    pass
+        return Recipe.objects.in_bulk(ids) if ids else {}
+
+    def validate_bulk_item(self, item, instances):
+        """Сериализатор элемента пакета или пара (статус, ошибки)."""
+        if not isinstance(item, dict):
+            return status.HTTP_400_BAD_REQUEST, {
+                'non_field_errors': [_('Ожидается объект рецепта.')]
+            }
+        instance = None
+        if item.get('id') is not None:
+            try:
+                instance = instances.get(int(item['id']))
+            except (TypeError, ValueError):
+                pass
+            if instance is None:
+                return status.HTTP_404_NOT_FOUND, {
+                    'detail': _('Рецепт не найден.')
+                }
+            if instance.author_id != self.request.user.id:
+                return status.HTTP_403_FORBIDDEN, {
+                    'detail': PermissionDenied.default_detail
+                }
+        serializer = self.get_serializer(
+            instance, data=item, partial=instance is not None
+        )
+        if not serializer.is_valid():
+            return status.HTTP_400_BAD_REQUEST, serializer.errors
+        return serializer
+
+    @transaction.atomic
+    def save_bulk_items(self, created, updated):
+        """Сохраняет элементы пакета и возвращает {позиция: (статус,
+        id рецепта)}."""
+        saved = {}
+        if created:
+            recipes = self.get_serializer(many=True).create([
+                dict(serializer.validated_data, author=self.request.user)
+                for _index, serializer in created
+            ])
+            for (index, _serializer), recipe in zip(created, recipes):
+                saved[index] = (status.HTTP_201_CREATED, recipe.pk)
+        for index, serializer in updated:
+            saved[index] = (status.HTTP_200_OK, serializer.save().pk)
+        return saved
+
+    @staticmethod
+    def get_bulk_status(saved, results):
+        if not saved:
+            return status.HTTP_400_BAD_REQUEST
+        if len(saved) < len(results):
+            return status.HTTP_207_MULTI_STATUS
+        if all(item_status == status.HTTP_201_CREATED
+               for item_status, _pk in saved.values()):
+            return status.HTTP_201_CREATED
+        return status.HTTP_200_OK
+
+    @action(
+        methods=['post'],
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def bulk(self, request):
+        """Создание и изменение нескольких рецептов за один запрос.
+
+        Элементы с id изменяют существующие рецепты автора, остальные
+        создаются. Каждый элемент проверяется отдельно: ошибочные
+        возвращаются с описанием ошибок, остальные сохраняются в одной
+        транзакции, а новые рецепты вставляются пачкой.
+        """
+        items = request.data
+        if not isinstance(items, list) or not items:
+            return Response(
+                {'errors': _('Ожидается непустой список рецептов.')},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        if len(items) > settings.RECIPE_BULK_MAX_ITEMS:
+            return Response(
+                {'errors': _('За один запрос можно передать не больше '
+                             '{} рецептов.').format(
+                    settings.RECIPE_BULK_MAX_ITEMS
+                )},
+                status=status.HTTP_400_BAD_REQUEST
+            )
+        instances = self.get_bulk_instances(items)
+        results = [None] * len(items)
+        created, updated = [], []
+        for index, item in enumerate(items):
+            serializer = self.validate_bulk_item(item, instances)
+            if isinstance(serializer, tuple):
+                item_status, errors = serializer
+                results[index] = {'status': item_status, 'errors': errors}
+            elif serializer.instance is None:
+                created.append((index, serializer))
+            else:
+                updated.append((index, serializer))
+        saved = self.save_bulk_items(created, updated)
+        recipes = self.get_queryset().in_bulk(
+            [pk for _status, pk in saved.values()]
+        )
+        prefetch_related_objects(
+            list(recipes.values()), *Recipe.objects.related_lookups()
+        )
+        for index, (item_status, pk) in saved.items():
+            results[index] = {
+                'status': item_status,
+                'recipe': self.get_serializer(recipes[pk]).data,
+            }
+        return Response(
+            {'results': results},
+            status=self.get_bulk_status(saved, results)
+        )
 
     @action(
         methods=['post', 'delete'],
@@ -143,35 +416,145 @@ class RecipeViewSet(viewsets.ModelViewSet):
             delete_errors_message=_('Рецепт ещё не добавлен в список покупок!')
         )
 
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='favorite',
+        url_name='favorite-batch',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def favorite_batch(self, request):
+        return change_user_list_batch(
+            request=request,
+            model=Favorite,
+            target_model=Recipe,
+            serializer_class=UserListBatchSerializer
+        )
+
+    @action(
+        methods=['post', 'delete'],
+        detail=False,
+        url_path='shopping_cart',
+        url_name='shopping-cart-batch',
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def shopping_cart_batch(self, request):
+        return change_user_list_batch(
+            request=request,
+            model=ShoppingCart,
+            target_model=Recipe,
+            serializer_class=UserListBatchSerializer
+        )
+
+    @action(
+        methods=['get'],
+        detail=False,
+        serializer_class=RecipeMatchSerializer,
+        cursor_ordering=None,
+    )
+    def match(self, request):
+        """Рецепты, которые можно приготовить из ингредиентов ingredients,
+        докупив не больше missing недостающих.
+
+        Кандидаты и их ранг даёт индекс ингредиентов в памяти процесса,
+        из базы читается только текущая страница рецептов.
+        """
+        query = RecipeMatchQuerySerializer(data=request.query_params)
+        query.is_valid(raise_exception=True)
+        matches = recipe_match_index.match(
+            query.validated_data['ingredients'],
+            query.validated_data['missing']
+        )
+        page = self.paginate_queryset(matches)
+        if page is not None:
+            matches = page
+        found = self.get_queryset().in_bulk(
+            [match.recipe_id for match in matches]
+        )
+        recipes = []
+        for match in matches:
+            recipe = found.get(match.recipe_id)
+            if recipe is not None:
+                recipe.matched_ingredients = match.matched
+                recipe.missing_ingredients = match.missing
+                recipes.append(recipe)
+        prefetch_related_objects(recipes, *Recipe.objects.related_lookups())
+        serializer = self.get_serializer(recipes, many=True)
+        if page is None:
+            return Response(serializer.data)
+        return self.get_paginated_response(serializer.data)
+
     @action(
         methods=['get'],
         detail=False,
-        permission_classes=[permissions.AllowAny],
+        permission_classes=[permissions.IsAuthenticated],
+    )
+    def feed(self, request):
+        """Рецепты авторов, на которых подписан пользователь, новые сверху.
+
+        Пагинация всегда курсорная: позиции страницы дают лента подписок
+        и индексы популярных авторов, из рецептов читается только
+        текущая страница.
+        """
+        positions = self.paginator.paginate_positions(
+            lambda limit, before: get_feed_positions(
+                request.user, limit, before
+            ),
+            Recipe, request, self
+        )
+        found = self.get_queryset().in_bulk(
+            [recipe_id for _pub_date, recipe_id in positions]
+        )
+        recipes = [
+            found[recipe_id] for _pub_date, recipe_id in positions
+            if recipe_id in found
+        ]
+        prefetch_related_objects(recipes, *Recipe.objects.related_lookups())
+        serializer = self.get_serializer(recipes, many=True)
+        return self.paginator.get_paginated_response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        serializer_class=ShoppingListItemSerializer,
+        pagination_class=None,
+    )
+    def shopping_list(self, request):
+        serializer = self.get_serializer(
+            request.user.shopping_list.select_related('ingredient').order_by(
+                'ingredient__name', 'ingredient__measurement_unit'
+            ),
+            many=True
+        )
+        return Response(serializer.data)
+
+    @action(
+        methods=['get'],
+        detail=False,
+        permission_classes=[permissions.IsAuthenticated],
+        renderer_classes=SHOPPING_LIST_RENDERERS,
     )
     def download_shopping_cart(self, request):
-        user = request.user
-        purchases_data = user.purchases.all().select_related(
-            'recipe'
-        ).order_by(
-            'recipe__ingredients__name'
-        ).values(
-            'recipe__ingredients__name',
-            'recipe__ingredients__measurement_unit'
-        ).annotate(
-            amount=Sum('recipe__recipeingredient__amount')
-        )
-        if not purchases_data:
+        purchases_data = iter(get_shopping_list(request.user).iterator())
+        first_item = next(purchases_data, None)
+        if first_item is None:
             return Response(
                 {
                     'error': _('Ваш список покупок пуст!')
                 },
-                status=status.HTTP_404_NOT_FOUND
+                status=status.HTTP_404_NOT_FOUND,
+                content_type='application/json'
             )
-        purchases_text = 'Продуктовый помощник\nСписок покупок\n\n'
-        for item in purchases_data:
-            ingredient, measurement_unit, amount = item.values()
-            purchases_text += f'{ingredient} - {amount}({measurement_unit})\n'
-        response = HttpResponse(purchases_text, content_type='text/plain')
-        filename = 'shopping_list.txt'
+        renderer = request.accepted_renderer
+        exporter = SHOPPING_LIST_EXPORTERS[renderer.format]
+        content_type = renderer.media_type
+        if renderer.charset:
+            content_type = f'{content_type}; charset={renderer.charset}'
+        response = StreamingHttpResponse(
+            exporter(chain((first_item,), purchases_data)),
+            content_type=content_type
+        )
+        filename = f'shopping_list.{renderer.format}'
         response['Content-Disposition'] = f'attachment; filename={filename}'
         return response
@@ -1,4 +1,5 @@
 import os
+from datetime import datetime
 
 from dotenv import load_dotenv
 
@@ -31,6 +32,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.instrumentation.QueryInstrumentationMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'corsheaders.middleware.CorsMiddleware',
@@ -73,6 +75,38 @@ DATABASES = {
     }
 }
 
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND',
+            default='django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', default='foodgram'),
+        'TIMEOUT': int(os.getenv('CACHE_TIMEOUT', default=60 * 60)),
+    },
+    # Версии справочников и журнал их изменений читают все воркеры и
+    # команды manage.py, поэтому этот кэш должен быть общим для процессов.
+    # Таблицу кэша в базе создаёт миграция api.
+    'shared': {
+        'BACKEND': os.getenv(
+            'SHARED_CACHE_BACKEND',
+            default='django.core.cache.backends.db.DatabaseCache'
+        ),
+        'LOCATION': os.getenv(
+            'SHARED_CACHE_LOCATION', default='foodgram_shared_cache'
+        ),
+        'TIMEOUT': None,
+        # Журнал изменений пишет ключ на каждую версию справочника.
+        'OPTIONS': {'MAX_ENTRIES': 100000},
+    },
+}
+
+# Как долго процесс не перечитывает версию справочника из общего кэша:
+# изменение, сделанное другим процессом, видно с этой задержкой.
+REFERENCE_CACHE_VERSION_TTL: float = float(
+    os.getenv('REFERENCE_CACHE_VERSION_TTL', default=1)
+)
+
 AUTH_PASSWORD_VALIDATORS = [
     {
         'NAME': 'django.contrib.auth.password_validation.UserAttributeSimilarityValidator',
@@ -150,6 +184,74 @@ USERNAME_REGEXES: list = [
     (r'(^[\w.@+-]+)$', ACCEPT_REGEX,),
 ]
 
+INGREDIENT_SEARCH_LIMIT: int = 50
+
+RECIPE_BULK_MAX_ITEMS: int = int(os.getenv('RECIPE_BULK_MAX_ITEMS', 100))
+
+USER_LIST_BATCH_MAX_ITEMS: int = int(
+    os.getenv('USER_LIST_BATCH_MAX_ITEMS', 500)
+)
+
+RECIPE_MATCH_MAX_MISSING: int = int(
+    os.getenv('RECIPE_MATCH_MAX_MISSING', 3)
+)
+
+RECIPE_MATCH_MAX_INGREDIENTS: int = int(
+    os.getenv('RECIPE_MATCH_MAX_INGREDIENTS', 100)
+)
+
+FEED_TIMELINE_LENGTH: int = int(os.getenv('FEED_TIMELINE_LENGTH', 500))
+
+FEED_FANOUT_MAX_FOLLOWERS: int = int(
+    os.getenv('FEED_FANOUT_MAX_FOLLOWERS', 1000)
+)
+
+FEED_FANOUT_BATCH_SIZE: int = 1000
+
+# Потоки раскладки новых рецептов по лентам; 0 — в потоке запроса.
+FEED_FANOUT_WORKERS: int = int(os.getenv('FEED_FANOUT_WORKERS', default=1))
+
+RECIPE_SEARCH_CONFIG: str = os.getenv('RECIPE_SEARCH_CONFIG', 'russian')
+
+# Оценки популярности отсчитываются от эпохи: логарифм оценки растёт на
+# ln 2 за каждый период полураспада после неё.
+RANKING_EPOCH: datetime = datetime.fromisoformat(
+    os.getenv('RANKING_EPOCH', '2026-01-01T00:00:00+00:00')
+)
+
+RANKING_POPULAR_HALF_LIFE_DAYS: float = float(
+    os.getenv('RANKING_POPULAR_HALF_LIFE_DAYS', 30)
+)
+
+RANKING_TRENDING_HALF_LIFE_DAYS: float = float(
+    os.getenv('RANKING_TRENDING_HALF_LIFE_DAYS', 2)
+)
+
+QUERY_BUDGETS_STRICT: bool = os.getenv(
+    'QUERY_BUDGETS_STRICT', 'False'
+).lower() in ('true', '1')
+
+RECIPE_IMAGE_MAX_SIZE: int = 5 * 1024 * 1024
+
+# Сжатый файл мал, но декодированное изображение занимает 3–4 байта на
+# пиксель: больше этого изображения не принимаются.
+RECIPE_IMAGE_MAX_PIXELS: int = 4096 * 4096
+
+# Варианты уменьшаются друг из друга от большего к меньшему, поэтому
+# каждый размер должен помещаться в предыдущий.
+RECIPE_IMAGE_VARIANTS: dict = {
+    'thumbnail': (320, 320),
+    'medium': (960, 960),
+    'webp': None,
+}
+
+RECIPE_IMAGE_WORKERS: int = int(os.getenv('RECIPE_IMAGE_WORKERS', default=2))
+
+SHOPPING_LIST_PDF_FONT: str = os.getenv(
+    'SHOPPING_LIST_PDF_FONT',
+    default='/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 COLORS_HEX_REGEX: tuple = (r'^#(?:[0-9a-fA-F]{6})$', ACCEPT_REGEX,)
 
 CORS_ALLOW_ALL_ORIGINS = True
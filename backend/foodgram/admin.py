@@ -2,7 +2,7 @@ from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
 
 from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
-                     RecipeTag, ShoppingCart, Tag)
+                     RecipeTag, ShoppingCart, ShoppingListItem, Tag, User)
 
 
 class RecipeTagInline(admin.TabularInline):
@@ -22,19 +22,34 @@ class RecipeAdmin(admin.ModelAdmin):
               'get_quantity_added_favorites',
               'image')
     readonly_fields = ('get_quantity_added_favorites', 'get_tags')
-    list_display = ('pk', 'name', 'author', 'get_tags')
+    list_display = ('pk', 'name', 'author', 'get_tags',
+                    'favorites_count', 'cart_count', 'popularity_score',
+                    'trending_score')
     search_fields = ('name', 'author__username')
     list_filter = ('author', 'name', 'tags__name')
     empty_value_display = '-пусто-'
     inlines = (RecipeTagInline, RecipeIngredientInline,)
 
+    def get_search_results(self, request, queryset, search_term):
+        # Поиск по вектору названия, ингредиентов и описания вместо ILIKE
+        # по каждому полю; автора ищем по точному имени пользователя.
+        search_term = search_term.strip()
+        if not search_term:
+            return queryset, False
+        author_ids = list(User.objects.filter(
+            username__iexact=search_term
+        ).values_list('pk', flat=True))
+        return (queryset.matching(search_term)
+                | queryset.filter(author_id__in=author_ids)), False
+
     def get_tags(self, obj):
         return list(obj.tags.values_list('name', flat=True))
 
     def get_quantity_added_favorites(self, obj):
-        return obj.favorites.count()
+        return obj.favorites_count
 
     get_tags.short_description = _('Теги рецепта')
+    get_quantity_added_favorites.admin_order_field = 'favorites_count'
     get_quantity_added_favorites.short_description = _(
         'Добавлений рецепта в избранное'
     )
@@ -98,7 +113,15 @@ class ShoppingCartAdmin(admin.ModelAdmin):
     ordering = ('-pk',)
 
 
+@admin.register(ShoppingListItem)
+class ShoppingListItemAdmin(admin.ModelAdmin):
+    list_display = ('pk', 'user', 'ingredient', 'amount',)
+    list_select_related = ('user', 'ingredient',)
+    ordering = ('-pk',)
+
+
 @admin.register(Tag)
 class TagAdmin(admin.ModelAdmin):
-    list_display = ('pk', 'name', 'color', 'slug')
+    list_display = ('pk', 'name', 'color', 'slug', 'popularity_score',
+                    'trending_score')
     ordering = ('-pk',)
@@ -5,3 +5,6 @@ from django.utils.translation import ugettext_lazy as _
 class FoodgramConfig(AppConfig):
     name = 'foodgram'
     verbose_name = _('Продуктовый помощник')
+
+    def ready(self):
+        from . import signals  # noqa: F401
@@ -0,0 +1,33 @@
+from typing import Type
+
+from django.db.models import (Count, F, IntegerField, Model, OuterRef,
+                              Subquery)
+from django.db.models.functions import Coalesce
+
+from .models import Favorite, Follow, Recipe, ShoppingCart, User
+
+# (модель-источник, модель со счётчиком, внешний ключ, поле счётчика)
+COUNTERS = (
+    (Favorite, Recipe, 'recipe_id', 'favorites_count'),
+    (ShoppingCart, Recipe, 'recipe_id', 'cart_count'),
+    (Recipe, User, 'author_id', 'recipes_count'),
+    (Follow, User, 'author_id', 'followers_count'),
+)
+
+
+def change_counter(model: Type[Model], pk: int,
+                   field: str, delta: int) -> None:
+    model.objects.filter(pk=pk).update(**{field: F(field) + delta})
+
+
+def rebuild_counters() -> None:
+    for source, target, foreign_key, field in COUNTERS:
+        counts = source.objects.filter(
+            **{foreign_key: OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            count=Count('pk')
+        ).values('count')
+        target.objects.update(
+            **{field: Coalesce(Subquery(counts, output_field=IntegerField()),
+                               0)}
+        )
@@ -0,0 +1,276 @@
+import logging
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from itertools import groupby
+from operator import attrgetter
+from typing import Iterable, List, Optional, Tuple
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from api.instrumentation import unbudgeted
+from .importer import batched
+from .models import Follow, Recipe, TimelineEntry, User
+
+# Лента обрезается не при каждой новой записи, а когда вырастает на эту
+# долю сверх FEED_TIMELINE_LENGTH: обрезка одного пользователя приходится
+# на десятки записей.
+TRIM_SLACK_RATIO = 0.1
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_position_filter(position: Optional[Tuple], date_field: str,
+                        id_field: str) -> Q:
+    """Условие «старше позиции (дата, id)» для чтения по индексу."""
+    if position is None:
+        return Q()
+    pub_date, pk = position
+    return (Q(**{f'{date_field}__lt': pub_date})
+            | Q(**{date_field: pub_date, f'{id_field}__lt': pk}))
+
+
+def trim_timelines(user_ids: Iterable[int]) -> None:
+    """Оставляет в лентах пользователей FEED_TIMELINE_LENGTH новых записей
+    и сверяет с ними счётчик timeline_size."""
+    length = settings.FEED_TIMELINE_LENGTH
+    for user_id in user_ids:
+        entries = TimelineEntry.objects.filter(user_id=user_id)
+        boundary = list(entries.order_by(
+            '-pub_date', '-recipe_id'
+        ).values_list('pub_date', 'recipe_id')[length - 1:length])
+        if boundary:
+            entries.filter(get_position_filter(
+                boundary[0], 'pub_date', 'recipe_id'
+            )).delete()
+            size = length
+        else:
+            size = entries.count()
+        User.objects.filter(pk=user_id).update(timeline_size=size)
+
+
+def add_timeline_entries(user_ids: Iterable[int], rows: List[Tuple]) -> None:
+    """Добавляет рецепты rows — (id рецепта, id автора, дата) — в ленты
+    пользователей пачками по FEED_FANOUT_BATCH_SIZE."""
+    if not rows:
+        return
+    overflow = settings.FEED_TIMELINE_LENGTH + max(
+        1, int(settings.FEED_TIMELINE_LENGTH * TRIM_SLACK_RATIO)
+    )
+    for batch in batched(user_ids, settings.FEED_FANOUT_BATCH_SIZE):
+        TimelineEntry.objects.bulk_create([
+            TimelineEntry(user_id=user_id, recipe_id=recipe_id,
+                          author_id=author_id, pub_date=pub_date)
+            for user_id in batch
+            for recipe_id, author_id, pub_date in rows
+        ], ignore_conflicts=True)
+        # Счётчик приблизительный: пропущенные дубли и каскадное удаление
+        # рецептов его не уменьшают. Он только решает, когда обрезать
+        # ленту, и при обрезке сверяется заново.
+        User.objects.filter(pk__in=batch).update(
+            timeline_size=F('timeline_size') + len(rows)
+        )
+        trim_timelines(User.objects.filter(
+            pk__in=batch, timeline_size__gt=overflow
+        ).order_by().values_list('pk', flat=True))
+
+
+@transaction.atomic
+def fan_out_recipes(recipes: Iterable[Recipe]) -> None:
+    """Добавляет новые рецепты в ленты подписчиков их авторов.
+
+    Рецепты авторов, у которых подписчиков больше
+    FEED_FANOUT_MAX_FOLLOWERS, не раскладываются: лента подмешивает их
+    при чтении, пока число подписчиков не опустится до порога (см.
+    backfill_timelines).
+    """
+    recipes = sorted(recipes, key=attrgetter('author_id'))
+    followers = defaultdict(list)
+    for author_id, user_id in Follow.objects.filter(
+        author_id__in={recipe.author_id for recipe in recipes},
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author_id', 'user_id'):
+        followers[author_id].append(user_id)
+    for author_id, author_recipes in groupby(recipes,
+                                             key=attrgetter('author_id')):
+        add_timeline_entries(followers.get(author_id, ()), [
+            (recipe.pk, author_id, recipe.pub_date)
+            for recipe in author_recipes
+        ])
+
+
+@transaction.atomic
+def backfill_timelines(author_ids: Iterable[int]) -> None:
+    """Раскладывает последние рецепты авторов по лентам всех их
+    подписчиков.
+
+    Рецепты, опубликованные, пока у автора было больше
+    FEED_FANOUT_MAX_FOLLOWERS подписчиков, в ленты не попали. Когда число
+    подписчиков опускается до порога, лента перестаёт подмешивать их при
+    чтении, поэтому они раскладываются здесь; подписчиков в этот момент
+    не больше порога.
+    """
+    for author_id in set(author_ids):
+        add_timeline_entries(
+            Follow.objects.filter(
+                author_id=author_id
+            ).values_list('user_id', flat=True),
+            list(Recipe.objects.filter(author_id=author_id).order_by(
+                '-pub_date', '-id'
+            ).values_list(
+                'id', 'author_id', 'pub_date'
+            )[:settings.FEED_TIMELINE_LENGTH])
+        )
+
+
+def _run_in_worker(function, *args) -> None:
+    try:
+        function(*args)
+    except Exception:
+        logger.exception('Не удалось обновить ленты подписок')
+    finally:
+        connection.close()
+
+
+def _run_in_request(function, *args) -> None:
+    # Число запросов раскладки зависит от числа подписчиков, а не от
+    # действия, поэтому в бюджет действия она не входит.
+    with unbudgeted():
+        function(*args)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.FEED_FANOUT_WORKERS,
+            thread_name_prefix='feed-fan-out',
+        )
+    return _executor
+
+
+def schedule(function, *args) -> None:
+    """Выполняет function после фиксации транзакции.
+
+    Число её запросов растёт с числом подписчиков автора, поэтому она
+    выполняется в фоновом потоке, если FEED_FANOUT_WORKERS не 0.
+    """
+    if settings.FEED_FANOUT_WORKERS:
+        transaction.on_commit(
+            lambda: get_executor().submit(_run_in_worker, function, *args)
+        )
+    else:
+        transaction.on_commit(lambda: _run_in_request(function, *args))
+
+
+def schedule_fan_out(recipes: Iterable[Recipe]) -> None:
+    """Раскладывает рецепты по лентам после фиксации транзакции."""
+    recipes = list(recipes)
+    if recipes:
+        schedule(fan_out_recipes, recipes)
+
+
+def schedule_backfill(author_ids: Iterable[int]) -> None:
+    """Вызывается после уменьшения счётчиков подписчиков авторов на
+    единицу: авторы, у которых подписчиков стало ровно
+    FEED_FANOUT_MAX_FOLLOWERS, только что опустились до порога.
+
+    Уменьшение счётчика блокирует строку автора до конца транзакции,
+    поэтому из одновременных отписок порог увидит ровно одна.
+    """
+    crossed = list(User.objects.filter(
+        pk__in=set(author_ids),
+        followers_count=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('pk', flat=True))
+    if crossed:
+        schedule(backfill_timelines, crossed)
+
+
+def add_authors_to_timeline(user_id: int, author_ids: Iterable[int]) -> None:
+    """Добавляет в ленту пользователя последние рецепты авторов, на
+    которых он подписался."""
+    add_timeline_entries([user_id], list(Recipe.objects.filter(
+        author_id__in=set(author_ids),
+        author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).order_by('-pub_date', '-id').values_list(
+        'id', 'author_id', 'pub_date'
+    )[:settings.FEED_TIMELINE_LENGTH]))
+
+
+def remove_authors_from_timeline(user_id: int,
+                                 author_ids: Iterable[int]) -> None:
+    """Убирает из ленты пользователя рецепты авторов, от которых он
+    отписался."""
+    removed, _details = TimelineEntry.objects.filter(
+        user_id=user_id, author_id__in=set(author_ids)
+    ).delete()
+    if removed:
+        User.objects.filter(pk=user_id).update(
+            timeline_size=Greatest(F('timeline_size') - removed, 0)
+        )
+
+
+def get_author_recipe_positions(author_ids: List[int], limit: int,
+                                before: Optional[Tuple]) -> List[Tuple]:
+    querysets = [
+        Recipe.objects.filter(
+            get_position_filter(before, 'pub_date', 'id'),
+            author_id=author_id
+        ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:limit]
+        for author_id in author_ids
+    ]
+    if len(querysets) == 1:
+        return list(querysets[0])
+    features = connections[Recipe.objects.db].features
+    if features.supports_slicing_ordering_in_compound:
+        # Каждый автор читается по индексу (автор, дата) с LIMIT, и
+        # выборка не зависит от числа его рецептов.
+        return list(querysets[0].union(*querysets[1:], all=True))
+    return list(Recipe.objects.filter(
+        get_position_filter(before, 'pub_date', 'id'),
+        author_id__in=author_ids
+    ).order_by('-pub_date', '-id').values_list('pub_date', 'id')[:limit])
+
+
+def get_feed_positions(user: User, limit: int,
+                       before: Optional[Tuple] = None) -> List[Tuple]:
+    """Позиции (дата, id рецепта) ленты подписок пользователя старше
+    before, новые сверху, не больше limit.
+
+    Рецепты обычных авторов читаются из материализованной ленты,
+    рецепты авторов с большим числом подписчиков — по индексу каждого из
+    них. Обе выборки ограничены limit, поэтому чтение зависит от размера
+    страницы, а не от числа подписок и рецептов.
+    """
+    positions = set(TimelineEntry.objects.filter(
+        get_position_filter(before, 'pub_date', 'recipe_id'),
+        user=user
+    ).order_by('-pub_date', '-recipe_id').values_list(
+        'pub_date', 'recipe_id'
+    )[:limit])
+    author_ids = list(Follow.objects.filter(
+        user=user,
+        author__followers_count__gt=settings.FEED_FANOUT_MAX_FOLLOWERS
+    ).values_list('author_id', flat=True))
+    if author_ids:
+        positions.update(
+            get_author_recipe_positions(author_ids, limit, before)
+        )
+    return sorted(positions, reverse=True)[:limit]
+
+
+@transaction.atomic
+def rebuild_timelines() -> None:
+    """Заново собирает ленты всех пользователей по текущим подпискам."""
+    TimelineEntry.objects.all().delete()
+    User.objects.update(timeline_size=0)
+    follows = Follow.objects.order_by('user_id').values_list(
+        'user_id', 'author_id'
+    )
+    for user_id, rows in groupby(follows.iterator(), key=lambda row: row[0]):
+        add_authors_to_timeline(user_id, [author_id for _user_id, author_id
+                                          in rows])
@@ -0,0 +1,125 @@
+import io
+import logging
+import math
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connection, transaction
+from PIL import Image
+
+from api.instrumentation import unbudgeted
+
+VARIANTS_DIR = 'variants'
+WEBP_QUALITY = 80
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+
+
+def get_variant_name(name: str, variant: str) -> str:
+    directory, filename = os.path.split(name)
+    stem = os.path.splitext(filename)[0]
+    return os.path.join(directory, VARIANTS_DIR, f'{stem}_{variant}.webp')
+
+
+def get_variant_urls(name: str) -> dict:
+    return {
+        variant: default_storage.url(get_variant_name(name, variant))
+        for variant in settings.RECIPE_IMAGE_VARIANTS
+    }
+
+
+def get_variants_by_size() -> list:
+    """Варианты от большего к меньшему; None — исходный размер."""
+    return sorted(
+        settings.RECIPE_IMAGE_VARIANTS.items(),
+        key=lambda item: -item[1][0] * item[1][1] if item[1] else -math.inf
+    )
+
+
+def check_image_size(image: Image.Image) -> None:
+    """Проверяет размер по заголовку, до декодирования пикселей."""
+    if image.width * image.height > settings.RECIPE_IMAGE_MAX_PIXELS:
+        raise ValueError(
+            f'Изображение {image.width}×{image.height} больше '
+            f'{settings.RECIPE_IMAGE_MAX_PIXELS} пикселей.'
+        )
+
+
+def render_variant(image: Image.Image, size) -> bytes:
+    """Уменьшает image на месте до size и кодирует в WebP."""
+    if size:
+        image.thumbnail(size, Image.LANCZOS)
+    buffer = io.BytesIO()
+    image.save(buffer, format='WEBP', quality=WEBP_QUALITY)
+    return buffer.getvalue()
+
+
+def generate_image_variants(recipe_id: int, name: str) -> None:
+    """Создаёт уменьшенные копии и WebP-вариант изображения рецепта.
+
+    Варианты строятся от большего к меньшему, и каждый уменьшается из
+    предыдущего, а не из исходного изображения. Рецепт отмечается, только
+    если его изображение за это время не сменилось: иначе варианты
+    достанутся новому файлу.
+    """
+    from .models import Recipe
+
+    with default_storage.open(name) as original:
+        image = Image.open(original)
+        check_image_size(image)
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    for variant, size in get_variants_by_size():
+        variant_name = get_variant_name(name, variant)
+        if default_storage.exists(variant_name):
+            default_storage.delete(variant_name)
+        default_storage.save(
+            variant_name, ContentFile(render_variant(image, size))
+        )
+    Recipe.objects.filter(pk=recipe_id, image=name).update(
+        image_variants_source=name
+    )
+
+
+def _generate_in_worker(recipe_id: int, name: str) -> None:
+    try:
+        generate_image_variants(recipe_id, name)
+    except Exception:
+        logger.exception('Не удалось обработать изображение %s', name)
+    finally:
+        connection.close()
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=settings.RECIPE_IMAGE_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return _executor
+
+
+def schedule_image_variants(recipe_id: int, name: str) -> None:
+    if settings.RECIPE_IMAGE_WORKERS:
+        get_executor().submit(_generate_in_worker, recipe_id, name)
+    else:
+        # Бюджет запросов действия рассчитан на обработку в фоне.
+        with unbudgeted():
+            generate_image_variants(recipe_id, name)
+
+
+def schedule_recipe_image_variants(recipe) -> None:
+    """Ставит обработку изображения рецепта после фиксации транзакции,
+    если для текущего файла вариантов ещё нет."""
+    name = recipe.image.name
+    if name and name != recipe.image_variants_source:
+        transaction.on_commit(
+            lambda: schedule_image_variants(recipe.pk, name)
+        )
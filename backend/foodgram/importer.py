@@ -0,0 +1,165 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+
+import django
+from django.contrib.auth.hashers import make_password
+
+from .models import Ingredient, Tag, User
+
+JSON_READ_SIZE = 64 * 1024
+
+
+def batched(iterable, size):
+    iterator = iter(iterable)
+    batch = list(islice(iterator, size))
+    while batch:
+        yield batch
+        batch = list(islice(iterator, size))
+
+
+def read_csv(path, fieldnames):
+    """Строки CSV в виде словарей. Первая строка считается заголовком,
+    только если совпадает с ожидаемыми полями."""
+    with open(path, 'r', encoding='utf-8', newline='') as csvfile:
+        reader = csv.reader(csvfile, delimiter=',', quotechar='"')
+        first_row = next(reader, None)
+        if first_row is None:
+            return
+        if set(first_row) == set(fieldnames):
+            header = first_row
+        else:
+            header = fieldnames
+            yield dict(zip(header, first_row))
+        for row in reader:
+            yield dict(zip(header, row))
+
+
+def read_json(path, fieldnames=None):
+    """Элементы JSON-массива по одному, без загрузки файла целиком."""
+    decoder = json.JSONDecoder()
+    with open(path, 'r', encoding='utf-8') as jsonfile:
+        buffer = jsonfile.read(JSON_READ_SIZE).lstrip()
+        if not buffer.startswith('['):
+            raise ValueError(f'{path}: ожидается JSON-массив.')
+        buffer = buffer[1:]
+        while True:
+            buffer = buffer.lstrip().lstrip(',').lstrip()
+            if buffer.startswith(']'):
+                return
+            try:
+                item, end = decoder.raw_decode(buffer)
+            except json.JSONDecodeError:
+                chunk = jsonfile.read(JSON_READ_SIZE)
+                if not chunk:
+                    raise
+                buffer += chunk
+                continue
+            yield item
+            buffer = buffer[end:]
+
+
+READERS = {
+    '.csv': read_csv,
+    '.json': read_json,
+}
+
+
+def hash_passwords(passwords, pool):
+    if pool is None:
+        return [make_password(password) for password in passwords]
+    return list(pool.map(make_password, passwords, chunksize=16))
+
+
+class ModelImporter:
+    model = None
+    fieldnames = ()
+
+    def __init__(self, batch_size, pool=None):
+        self.batch_size = batch_size
+        self.pool = pool
+
+    def prepare(self, rows):
+        return [self.model(**row) for row in rows]
+
+    def run(self, rows):
+        """Загружает строки пачками и возвращает (прочитано, создано)."""
+        total = 0
+        before = self.model.objects.count()
+        for rows_batch in batched(rows, self.batch_size):
+            total += len(rows_batch)
+            self.model.objects.bulk_create(
+                self.prepare(rows_batch),
+                ignore_conflicts=True,
+            )
+        return total, self.model.objects.count() - before
+
+
+class TagImporter(ModelImporter):
+    model = Tag
+    fieldnames = ('name', 'color', 'slug')
+
+
+class IngredientImporter(ModelImporter):
+    model = Ingredient
+    fieldnames = ('name', 'measurement_unit')
+
+
+class UserImporter(ModelImporter):
+    model = User
+    fieldnames = ('username', 'email', 'first_name', 'last_name', 'password')
+
+    def prepare(self, rows):
+        # Пароли хешируются только для новых пользователей: повторный
+        # запуск не тратит время на дорогое хеширование.
+        existing = set(self.model.objects.filter(
+            username__in=[row['username'] for row in rows]
+        ).values_list('username', flat=True))
+        rows = [row for row in rows if row['username'] not in existing]
+        passwords = hash_passwords(
+            [row.pop('password') for row in rows], self.pool
+        )
+        return [
+            self.model(password=password, **row)
+            for row, password in zip(rows, passwords)
+        ]
+
+
+IMPORTERS = {
+    'tags': TagImporter,
+    'ingredients': IngredientImporter,
+    'users': UserImporter,
+}
+
+
+def get_importer_class(path):
+    name, extension = os.path.splitext(os.path.basename(path))
+    if name not in IMPORTERS or extension not in READERS:
+        raise ValueError(f'{path}: неизвестный тип файла.')
+    return IMPORTERS[name], READERS[extension]
+
+
+def import_file(path, batch_size, workers=None):
+    """Импортирует файл и возвращает (модель, прочитано, создано, секунды).
+
+    Тип данных определяется по имени файла (tags, ingredients, users),
+    формат — по расширению (.csv, .json). Повторный импорт не создаёт
+    дублей: конфликты по уникальным полям пропускаются.
+    """
+    importer_class, reader = get_importer_class(path)
+    started = time.monotonic()
+    pool = None
+    if importer_class is UserImporter and workers != 1:
+        pool = ProcessPoolExecutor(max_workers=workers,
+                                   initializer=django.setup)
+    try:
+        total, created = importer_class(batch_size, pool).run(
+            reader(path, importer_class.fieldnames)
+        )
+    finally:
+        if pool is not None:
+            pool.shutdown()
+    return importer_class.model, total, created, time.monotonic() - started
@@ -0,0 +1,28 @@
+from django.core.management import BaseCommand
+from django.db.models import F
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.images import generate_image_variants
+from foodgram.models import Recipe
+
+
+class Command(BaseCommand):
+    help = _('Создание уменьшенных копий и WebP-вариантов изображений '
+             'рецептов, для которых они ещё не готовы')
+
+    def handle(self, *args, **options):
+        recipes = Recipe.objects.exclude(image='').exclude(
+            image__isnull=True
+        ).exclude(image_variants_source=F('image')).values_list('id', 'image')
+        processed = 0
+        for recipe_id, name in recipes.iterator():
+            try:
+                generate_image_variants(recipe_id, name)
+                processed += 1
+            except Exception as error:
+                self.stdout.write(self.style.WARNING(f'{name}: {error}'))
+        self.stdout.write(
+            self.style.SUCCESS(_('Обработано изображений: {}').format(
+                processed
+            ))
+        )
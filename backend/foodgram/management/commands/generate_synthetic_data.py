@@ -0,0 +1,73 @@
+import time
+
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from api.cache import invalidate_reference_cache
+from api.matching import RECIPE_INGREDIENTS_NAMESPACE
+from foodgram.synthetic import generate_dataset
+
+
+class Command(BaseCommand):
+    help = _('Генерация синтетических пользователей, рецептов, тегов, '
+             'избранного, корзин и подписок для замеров и нагрузочных '
+             'тестов')
+
+    def add_arguments(self, parser):
+        for name, default, help_text in (
+            ('users', 50, _('Количество пользователей')),
+            ('recipes', 2000, _('Количество рецептов')),
+            ('ingredients', 500, _('Количество ингредиентов')),
+            ('tags', 3, _('Количество тегов')),
+            ('ingredients-per-recipe', 5,
+             _('Количество ингредиентов в рецепте')),
+            ('favorites', 40,
+             _('Количество рецептов в избранном у пользователя')),
+            ('carts', 5, _('Количество рецептов в корзине у пользователя')),
+            ('follows', 5, _('Количество подписок у пользователя')),
+            ('batch-size', 5000, _('Количество строк в одной вставке')),
+            ('random-seed', 0,
+             _('Зерно генератора: с тем же зерном данные повторяются')),
+        ):
+            parser.add_argument(f'--{name}', type=int, default=default,
+                                help=help_text)
+        parser.add_argument(
+            '--skew',
+            type=float,
+            default=1.0,
+            help=_('Перекос популярности авторов, рецептов, тегов и '
+                   'ингредиентов (показатель закона Ципфа, 0 — равномерно)')
+        )
+        parser.add_argument(
+            '--prefix',
+            default='synthetic',
+            help=_('Префикс имён создаваемых объектов')
+        )
+
+    def handle(self, *args, **options):
+        started = time.monotonic()
+        with transaction.atomic():
+            created = generate_dataset(
+                users=options['users'],
+                recipes=options['recipes'],
+                ingredients=options['ingredients'],
+                tags=options['tags'],
+                ingredients_per_recipe=options['ingredients_per_recipe'],
+                favorites=options['favorites'],
+                carts=options['carts'],
+                follows=options['follows'],
+                skew=options['skew'],
+                random_seed=options['random_seed'],
+                prefix=options['prefix'],
+                batch_size=options['batch_size'],
+            )
+        for namespace in ('tags', 'ingredients',
+                          RECIPE_INGREDIENTS_NAMESPACE):
+            invalidate_reference_cache(namespace)
+        self.stdout.write(self.style.SUCCESS(
+            _('Создано за {seconds:.1f} с: пользователей {users}, тегов '
+              '{tags}, ингредиентов {ingredients}, рецептов {recipes}').format(
+                seconds=time.monotonic() - started, **created
+            )
+        ))
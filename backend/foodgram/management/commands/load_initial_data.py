@@ -1,61 +1,73 @@
-import csv
 import os
 
 from django.conf import settings
 from django.core.management import BaseCommand
 from django.utils.translation import ugettext_lazy as _
 
-from foodgram.models import Ingredient, Tag, User
+from api.cache import invalidate_reference_cache
+from foodgram.importer import import_file
+from foodgram.models import Ingredient, Tag
 
-data_files_list = [
-    ['tags.csv', Tag],
-    ['ingredients.csv', Ingredient],
-    ['users.csv', User],
-]
-
-
-def get_dirs(list_files: list) -> None:
-    for i, lst in enumerate(list_files):
-        data_files_list[i].append(
-            os.path.join(settings.BASE_DIR, 'static/data', lst[0])
-        )
-
-
-def load_tags_data(list_data: list) -> None:
-    for file, model, path in list_data:
-        with open(path, 'r', encoding='utf-8') as csvfile:
-            reader = csv.reader(csvfile, delimiter=',', quotechar='"')
-            header = next(reader)
-            for row in reader:
-                import_dict = {
-                    key: value for key, value in zip(header, row)
-                }
-                if file == 'ingredients.csv':
-                    ingredient, _ = model.objects.get_or_create(**import_dict)
-                if file == 'tags.csv':
-                    tag, _ = model.objects.get_or_create(**import_dict)
-                if file == 'users.csv':
-                    raw_password = import_dict.pop('password')
-                    user, created = model.objects.get_or_create(**import_dict)
-                    if created:
-                        user.set_password(raw_password)
-                        user.save()
+DATA_DIR = os.path.join(settings.BASE_DIR, 'static/data')
+DATA_FILES = ('tags.csv', 'ingredients.csv', 'users.csv')
+BATCH_SIZE = 5000
+CACHE_NAMESPACES = {
+    Tag: 'tags',
+    Ingredient: 'ingredients',
+}
 
 
 class Command(BaseCommand):
     help = _('Загрузка данных')
 
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'files',
+            nargs='*',
+            help=_('Файлы tags, ingredients или users в формате CSV или '
+                   'JSON. По умолчанию загружаются файлы из static/data.'),
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=BATCH_SIZE,
+            help=_('Количество строк в одной вставке.'),
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help=_('Количество процессов для хеширования паролей.'),
+        )
+
     def handle(self, *args, **options):
-        get_dirs(data_files_list)
+        files = options['files'] or [
+            os.path.join(DATA_DIR, file) for file in DATA_FILES
+        ]
         self.stdout.write(_('Загрузка данных...'))
         try:
-            load_tags_data(data_files_list)
+            for path in files:
+                model, total, created, seconds = import_file(
+                    path, options['batch_size'], options['workers']
+                )
+                self.stdout.write(
+                    _('{file}: прочитано {total}, создано {created} '
+                      'за {seconds:.2f} с ({speed:.0f} строк/с)').format(
+                        file=os.path.basename(path),
+                        total=total,
+                        created=created,
+                        seconds=seconds,
+                        speed=total / seconds if seconds else total,
+                    )
+                )
+                if model in CACHE_NAMESPACES:
+                    invalidate_reference_cache(CACHE_NAMESPACES[model])
             self.stdout.write(
                 self.style.SUCCESS(_('Модели импортированы'))
             )
         except Exception as error:
             self.stdout.write(
-                self.style.WARNING(error)
+                self.style.WARNING(str(error))
             )
             self.stdout.write(
                 self.style.ERROR(_('Не удалось выполнить импорт'))
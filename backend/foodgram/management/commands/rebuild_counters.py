@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from django.db import transaction
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.counters import rebuild_counters
+
+
+class Command(BaseCommand):
+    help = _('Пересчёт счётчиков избранного, списков покупок, '
+             'рецептов и подписчиков')
+
+    def handle(self, *args, **options):
+        self.stdout.write(_('Пересчёт счётчиков...'))
+        with transaction.atomic():
+            rebuild_counters()
+        self.stdout.write(self.style.SUCCESS(_('Счётчики пересчитаны')))
@@ -0,0 +1,16 @@
+from django.core.management import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.ranking import rebuild_rankings
+
+
+class Command(BaseCommand):
+    help = _('Пересчёт оценок популярности рецептов и тегов по избранному '
+             'и спискам покупок')
+
+    def handle(self, *args, **options):
+        self.stdout.write(_('Пересчёт оценок популярности...'))
+        rebuild_rankings()
+        self.stdout.write(self.style.SUCCESS(
+            _('Оценки популярности пересчитаны')
+        ))
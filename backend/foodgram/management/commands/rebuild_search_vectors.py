@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.search import update_search_vectors
+
+
+class Command(BaseCommand):
+    help = _('Пересчёт поисковых векторов рецептов (только PostgreSQL)')
+
+    def handle(self, *args, **options):
+        self.stdout.write(_('Пересчёт поисковых векторов...'))
+        updated = update_search_vectors()
+        self.stdout.write(self.style.SUCCESS(
+            _('Поисковых векторов пересчитано: {}').format(updated)
+        ))
@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.shopping_list import rebuild_shopping_lists
+
+
+class Command(BaseCommand):
+    help = _('Пересчёт списков покупок по содержимому корзин')
+
+    def handle(self, *args, **options):
+        self.stdout.write(_('Пересчёт списков покупок...'))
+        rebuild_shopping_lists()
+        self.stdout.write(self.style.SUCCESS(_('Списки покупок пересчитаны')))
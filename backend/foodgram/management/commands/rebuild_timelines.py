@@ -0,0 +1,13 @@
+from django.core.management import BaseCommand
+from django.utils.translation import ugettext_lazy as _
+
+from foodgram.feed import rebuild_timelines
+
+
+class Command(BaseCommand):
+    help = _('Пересборка лент подписок пользователей по текущим подпискам')
+
+    def handle(self, *args, **options):
+        self.stdout.write(_('Пересборка лент подписок...'))
+        rebuild_timelines()
+        self.stdout.write(self.style.SUCCESS(_('Ленты подписок пересобраны')))
@@ -0,0 +1,49 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:31
+
+from django.db import migrations, models
+from django.db.models import Count, IntegerField, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def rebuild_counters(apps, schema_editor):
+    recipe = apps.get_model('foodgram', 'Recipe')
+    user = apps.get_model('users', 'User')
+    counters = (
+        ('Favorite', recipe, 'recipe_id', 'favorites_count'),
+        ('ShoppingCart', recipe, 'recipe_id', 'cart_count'),
+        ('Recipe', user, 'author_id', 'recipes_count'),
+        ('Follow', user, 'author_id', 'followers_count'),
+    )
+    for source_name, target, foreign_key, field in counters:
+        source = apps.get_model('foodgram', source_name)
+        counts = source.objects.filter(
+            **{foreign_key: OuterRef('pk')}
+        ).order_by().values(foreign_key).annotate(
+            count=Count('pk')
+        ).values('count')
+        target.objects.update(
+            **{field: Coalesce(Subquery(counts, output_field=IntegerField()),
+                               0)}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0002_auto_20220628_1100'),
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='cart_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Счётчик пользователей, добавивших рецепт в список покупок.', verbose_name='Добавлений в список покупок'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='favorites_count',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Счётчик пользователей, добавивших рецепт в избранное.', verbose_name='Добавлений в избранное'),
+        ),
+        migrations.RunPython(rebuild_counters, migrations.RunPython.noop),
+    ]
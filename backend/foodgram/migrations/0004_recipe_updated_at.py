@@ -0,0 +1,26 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:33
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def fill_updated_at(apps, schema_editor):
+    apps.get_model('foodgram', 'Recipe').objects.update(
+        updated_at=F('pub_date')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0003_recipe_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True, help_text='Обновляется автоматически при каждом сохранении рецепта.', verbose_name='Дата изменения'),
+        ),
+        migrations.RunPython(fill_updated_at, migrations.RunPython.noop),
+    ]
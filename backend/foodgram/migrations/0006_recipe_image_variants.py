@@ -0,0 +1,18 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0005_recipe_pub_date_id_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_variants_source',
+            field=models.CharField(blank=True, editable=False, help_text='Совпадает с image, когда уменьшенные копии и WebP-вариант готовы.', max_length=100, verbose_name='Изображение, для которого созданы варианты'),
+        ),
+    ]
@@ -0,0 +1,50 @@
+# Generated by Django 2.2.16 on 2026-10-18 04:39
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Sum
+
+
+def fill_shopping_lists(apps, schema_editor):
+    recipe_ingredient = apps.get_model('foodgram', 'RecipeIngredient')
+    shopping_list_item = apps.get_model('foodgram', 'ShoppingListItem')
+    totals = recipe_ingredient.objects.filter(
+        recipe__purchases__isnull=False
+    ).values_list(
+        'recipe__purchases__user_id', 'ingredient_id'
+    ).annotate(amount=Sum('amount')).order_by()
+    shopping_list_item.objects.bulk_create(
+        shopping_list_item(user_id=user_id, ingredient_id=ingredient_id,
+                           amount=amount)
+        for user_id, ingredient_id, amount in totals.iterator()
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram', '0006_recipe_image_variants'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListItem',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(help_text='Суммарное количество ингредиента по всем рецептам в списке покупок.', verbose_name='Количество ингредиента')),
+                ('ingredient', models.ForeignKey(help_text='Ингредиент из рецептов в списке покупок.', on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list_items', to='foodgram.Ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(help_text='Пользователь, которому принадлежит список покупок.', on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Позиция списка покупок',
+                'verbose_name_plural': 'Списки покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistitem',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='ShoppingListItem_unique_relationships'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:12
+
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+from django.db.models import OuterRef, Subquery, TextField
+
+SEARCH_INDEX = 'recipe_search_vector_idx'
+
+
+def create_search_index(apps, schema_editor):
+    # GIN-индекс есть только в PostgreSQL; на других СУБД поиск идёт
+    # без вектора.
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    recipe = apps.get_model('foodgram', 'Recipe')
+    schema_editor.execute('CREATE INDEX {} ON {} USING gin ({})'.format(
+        schema_editor.quote_name(SEARCH_INDEX),
+        schema_editor.quote_name(recipe._meta.db_table),
+        schema_editor.quote_name('search_vector'),
+    ))
+
+
+def drop_search_index(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS {}'.format(
+        schema_editor.quote_name(SEARCH_INDEX)
+    ))
+
+
+def fill_search_vectors(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    recipe = apps.get_model('foodgram', 'Recipe')
+    recipe_ingredient = apps.get_model('foodgram', 'RecipeIngredient')
+    ingredient_names = recipe_ingredient.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    config = settings.RECIPE_SEARCH_CONFIG
+    recipe.objects.update(search_vector=(
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(Subquery(ingredient_names, output_field=TextField()),
+                       weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0008_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, help_text='Название, ингредиенты и описание рецепта для полнотекстового поиска. Обновляется после сохранения рецепта; GIN-индекс создаётся только в PostgreSQL.', null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(create_search_index, drop_search_index),
+        migrations.RunPython(fill_search_vectors, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_timelines(apps, schema_editor):
+    user = apps.get_model('users', 'User')
+    follow = apps.get_model('foodgram', 'Follow')
+    recipe = apps.get_model('foodgram', 'Recipe')
+    timeline_entry = apps.get_model('foodgram', 'TimelineEntry')
+    follower_ids = follow.objects.order_by().values_list(
+        'user_id', flat=True
+    ).distinct()
+    for user_id in follower_ids.iterator():
+        recipes = recipe.objects.filter(
+            author__following__user_id=user_id,
+            author__followers_count__lte=settings.FEED_FANOUT_MAX_FOLLOWERS
+        ).order_by('-pub_date', '-id').values_list(
+            'id', 'author_id', 'pub_date'
+        )[:settings.FEED_TIMELINE_LENGTH]
+        entries = timeline_entry.objects.bulk_create(
+            timeline_entry(user_id=user_id, recipe_id=recipe_id,
+                           author_id=author_id, pub_date=pub_date)
+            for recipe_id, author_id, pub_date in recipes
+        )
+        user.objects.filter(pk=user_id).update(timeline_size=len(entries))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('foodgram', '0009_recipe_search_vector'),
+        ('users', '0003_user_timeline_size'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('pub_date', models.DateTimeField(help_text='Копия даты рецепта: лента читается по индексу без соединения с рецептами.', verbose_name='Дата создания рецепта')),
+                ('author', models.ForeignKey(db_index=False, help_text='Автор рецепта: по нему записи удаляются при отписке.', on_delete=django.db.models.deletion.CASCADE, related_name='+', to=settings.AUTH_USER_MODEL, verbose_name='Автор')),
+                ('recipe', models.ForeignKey(help_text='Рецепт автора, на которого подписан пользователь.', on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='foodgram.Recipe', verbose_name='Рецепт')),
+                ('user', models.ForeignKey(db_index=False, help_text='Владелец ленты подписок.', on_delete=django.db.models.deletion.CASCADE, related_name='timeline', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Запись ленты подписок',
+                'verbose_name_plural': 'Ленты подписок',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', '-pub_date', '-recipe'], name='timeline_user_pub_date_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='timelineentry',
+            index=models.Index(fields=['user', 'author'], name='timeline_user_author_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='timelineentry',
+            constraint=models.UniqueConstraint(fields=('user', 'recipe'), name='TimelineEntry_unique_relationships'),
+        ),
+        migrations.RunPython(fill_timelines, migrations.RunPython.noop),
+    ]
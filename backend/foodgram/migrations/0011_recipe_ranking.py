@@ -0,0 +1,95 @@
+# Generated by Django 2.2.16 on 2026-10-18 11:20
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F, FloatField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+import django.utils.timezone
+
+# Веса событий на момент миграции: избранное — 1, корзина — 2.
+FAVORITE_WEIGHT = 1.0
+SHOPPING_CART_WEIGHT = 2.0
+SCORE_FIELDS = ('popularity_score', 'trending_score')
+
+
+def fill_scores(apps, schema_editor):
+    # Существующим строкам избранного и корзин миграция проставила одно
+    # время добавления, поэтому оценка рецепта — его счётчики с общим
+    # множителем затухания.
+    recipe = apps.get_model('foodgram', 'Recipe')
+    recipe_tag = apps.get_model('foodgram', 'RecipeTag')
+    tag = apps.get_model('foodgram', 'Tag')
+    age = (
+        django.utils.timezone.now() - settings.RANKING_EPOCH
+    ).total_seconds() / 86400
+    factors = (
+        2 ** (age / settings.RANKING_POPULAR_HALF_LIFE_DAYS),
+        2 ** (age / settings.RANKING_TRENDING_HALF_LIFE_DAYS),
+    )
+    recipe.objects.update(**{
+        field: (F('favorites_count') * FAVORITE_WEIGHT
+                + F('cart_count') * SHOPPING_CART_WEIGHT) * factor
+        for field, factor in zip(SCORE_FIELDS, factors)
+    })
+    tag.objects.update(**{
+        field: Coalesce(Subquery(
+            recipe_tag.objects.filter(
+                tag=OuterRef('pk')
+            ).order_by().values('tag').annotate(
+                total=Sum(f'recipe__{field}')
+            ).values('total'),
+            output_field=FloatField()
+        ), Value(0.0))
+        for field in SCORE_FIELDS
+    })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0010_timeline_entry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='favorite',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, help_text='Время события для расчёта популярности рецепта.', verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='shoppingcart',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, help_text='Время события для расчёта популярности рецепта.', verbose_name='Дата добавления'),
+            preserve_default=False,
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='popularity_score',
+            field=models.FloatField(default=0, editable=False, help_text='Добавления в избранное и список покупок, затухающие со временем: период полураспада — RANKING_POPULAR_HALF_LIFE_DAYS.', verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='То же с коротким периодом полураспада RANKING_TRENDING_HALF_LIFE_DAYS: важны недавние добавления.', verbose_name='Набирает популярность'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='popularity_score',
+            field=models.FloatField(default=0, editable=False, help_text='Сумма популярности рецептов с тегом. Пересчитывается командой rebuild_rankings.', verbose_name='Популярность'),
+        ),
+        migrations.AddField(
+            model_name='tag',
+            name='trending_score',
+            field=models.FloatField(default=0, editable=False, help_text='Сумма оценок «набирает популярность» рецептов с тегом. Пересчитывается командой rebuild_rankings.', verbose_name='Набирает популярность'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-popularity_score', '-id'], name='recipe_popularity_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['-trending_score', '-id'], name='recipe_trending_idx'),
+        ),
+        migrations.RunPython(fill_scores, migrations.RunPython.noop),
+    ]
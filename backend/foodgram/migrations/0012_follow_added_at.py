@@ -0,0 +1,20 @@
+# Generated by Django 2.2.16 on 2026-10-18 14:05
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0011_recipe_ranking'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='follow',
+            name='added_at',
+            field=models.DateTimeField(auto_now_add=True, default=django.utils.timezone.now, help_text='Время, когда пользователь подписался на автора.', verbose_name='Дата подписки'),
+            preserve_default=False,
+        ),
+    ]
@@ -0,0 +1,62 @@
+# Generated by Django 2.2.16 on 2026-10-18 15:30
+
+from django.db import migrations, models
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Exp, Ln
+
+# Пустая сумма оценок на момент миграции.
+NO_SCORE = -1e9
+SCORE_FIELDS = ('popularity_score', 'trending_score')
+
+
+def to_log_scores(apps, schema_editor):
+    for name in ('Recipe', 'Tag'):
+        apps.get_model('foodgram', name).objects.update(**{
+            field: Case(
+                When(**{f'{field}__gt': 0}, then=Ln(F(field))),
+                default=Value(NO_SCORE)
+            )
+            for field in SCORE_FIELDS
+        })
+
+
+def from_log_scores(apps, schema_editor):
+    for name in ('Recipe', 'Tag'):
+        apps.get_model('foodgram', name).objects.update(**{
+            field: Case(
+                When(**{f'{field}__gt': NO_SCORE}, then=Exp(F(field))),
+                default=Value(0.0)
+            )
+            for field in SCORE_FIELDS
+        })
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('foodgram', '0012_follow_added_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='recipe',
+            name='popularity_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, help_text='Добавления в избранное и список покупок, затухающие со временем: период полураспада — RANKING_POPULAR_HALF_LIFE_DAYS.', verbose_name='Популярность'),
+        ),
+        migrations.AlterField(
+            model_name='recipe',
+            name='trending_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, help_text='То же с коротким периодом полураспада RANKING_TRENDING_HALF_LIFE_DAYS: важны недавние добавления.', verbose_name='Набирает популярность'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='popularity_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, help_text='Сумма популярности рецептов с тегом. Пересчитывается командой rebuild_rankings.', verbose_name='Популярность'),
+        ),
+        migrations.AlterField(
+            model_name='tag',
+            name='trending_score',
+            field=models.FloatField(default=-1000000000.0, editable=False, help_text='Сумма оценок «набирает популярность» рецептов с тегом. Пересчитывается командой rebuild_rankings.', verbose_name='Набирает популярность'),
+        ),
+        migrations.RunPython(to_log_scores, from_log_scores),
+    ]
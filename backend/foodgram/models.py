@@ -1,12 +1,22 @@
+from django.conf import settings
 from django.contrib.auth import get_user_model
+from django.contrib.postgres.search import (SearchQuery, SearchRank,
+                                            SearchVectorField)
 from django.core.validators import MinValueValidator
-from django.db import models
+from django.db import connections, models
 from django.utils.translation import ugettext_lazy as _
 
+from users.models import DenormalizedFieldsMixin
 from .validators import validate_tag_color
 
 User = get_user_model()
 
+# Порядок результатов поиска; id делает его однозначным для курсора.
+SEARCH_ORDERING = ('-search_rank', '-pub_date', '-id')
+# Оценки популярности хранятся как логарифмы сумм; так записывается пустая
+# сумма — меньше оценки любого события.
+NO_SCORE = -1e9
+
 
 class Follow(models.Model):
     user = models.ForeignKey(
@@ -23,6 +33,11 @@ class Follow(models.Model):
         verbose_name=_('Автор'),
         help_text=_('Пользователь, на которого подписываются.'),
     )
+    added_at = models.DateTimeField(
+        _('Дата подписки'),
+        auto_now_add=True,
+        help_text=_('Время, когда пользователь подписался на автора.')
+    )
 
     class Meta:
         ordering = ['user']
@@ -68,7 +83,7 @@ class Ingredient(models.Model):
         return f'{self.name}, {self.measurement_unit}'
 
 
-class Tag(models.Model):
+class Tag(DenormalizedFieldsMixin, models.Model):
     name = models.CharField(
         _('Название тега'),
         max_length=256,
@@ -90,6 +105,22 @@ class Tag(models.Model):
         help_text=_('Укажите короткую метку для тега. Используйте только '
                     'латиницу, цифры, дефисы и знаки подчёркивания')
     )
+    popularity_score = models.FloatField(
+        _('Популярность'),
+        default=NO_SCORE,
+        editable=False,
+        help_text=_('Сумма популярности рецептов с тегом. Пересчитывается '
+                    'командой rebuild_rankings.')
+    )
+    trending_score = models.FloatField(
+        _('Набирает популярность'),
+        default=NO_SCORE,
+        editable=False,
+        help_text=_('Сумма оценок «набирает популярность» рецептов с тегом. '
+                    'Пересчитывается командой rebuild_rankings.')
+    )
+
+    denormalized_fields = ('popularity_score', 'trending_score')
 
     class Meta:
         ordering = ('name',)
@@ -100,7 +131,123 @@ class Tag(models.Model):
         return f'{self.name}, {self.color}, {self.slug}'
 
 
-class Recipe(models.Model):
+class RecipeQuerySet(models.QuerySet):
+
+    @staticmethod
+    def related_lookups():
+        # Сами теги и ингредиенты сериализаторы берут из каталога
+        # справочников, здесь нужны только связи.
+        return (
+            models.Prefetch('tags', queryset=Tag.objects.only('id')),
+            'recipeingredient_set',
+        )
+
+    def with_related(self):
+        return self.select_related('author').prefetch_related(
+            *self.related_lookups()
+        )
+
+    def with_tags(self, slugs, match_all=False):
+        """Рецепты с любым (или, при match_all, каждым) из тегов.
+
+        Фильтр строится на EXISTS-подзапросах, поэтому строки рецептов
+        не размножаются соединением и DISTINCT не нужен.
+        """
+        slugs = sorted(set(slugs))
+        if not slugs:
+            return self
+        if not match_all:
+            return self.annotate(
+                has_tags=models.Exists(RecipeTag.objects.filter(
+                    recipe=models.OuterRef('pk'), tag__slug__in=slugs
+                ))
+            ).filter(has_tags=True)
+        queryset = self
+        for number, slug in enumerate(slugs):
+            queryset = queryset.annotate(**{
+                f'has_tag_{number}': models.Exists(RecipeTag.objects.filter(
+                    recipe=models.OuterRef('pk'), tag__slug=slug
+                ))
+            }).filter(**{f'has_tag_{number}': True})
+        return queryset
+
+    def full_text_search_supported(self):
+        return connections[self.db].vendor == 'postgresql'
+
+    def matching(self, text):
+        """Рецепты, в названии, описании или ингредиентах которых есть все
+        слова text.
+
+        В PostgreSQL условие проверяется по search_vector с GIN-индексом,
+        на других СУБД — через LIKE по каждому слову.
+        """
+        if self.full_text_search_supported():
+            return self.filter(search_vector=SearchQuery(
+                text, config=settings.RECIPE_SEARCH_CONFIG
+            ))
+        condition = models.Q()
+        for word in text.split():
+            condition &= (
+                models.Q(name__icontains=word)
+                | models.Q(text__icontains=word)
+                | models.Q(pk__in=RecipeIngredient.objects.filter(
+                    ingredient__name__icontains=word
+                ).values('recipe_id'))
+            )
+        return self.filter(condition)
+
+    def search(self, text):
+        """matching, упорядоченные по релевантности search_rank.
+
+        Совпадения в названии весят больше совпадений в ингредиентах, а те —
+        больше совпадений в описании. Ранг считается только для найденных
+        строк, поэтому остальные фильтры, сужающие выборку, его удешевляют.
+        """
+        if self.full_text_search_supported():
+            rank = SearchRank(models.F('search_vector'), SearchQuery(
+                text, config=settings.RECIPE_SEARCH_CONFIG
+            ))
+        else:
+            rank = models.Case(
+                models.When(name__icontains=text, then=models.Value(1.0)),
+                default=models.Value(0.0),
+                output_field=models.FloatField(),
+            )
+        return self.matching(text).annotate(search_rank=rank).order_by(
+            *SEARCH_ORDERING
+        )
+
+    def with_user_flags(self, user):
+        if not user.is_authenticated:
+            return self.annotate(
+                is_favorited=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+                is_in_shopping_cart=models.Value(
+                    False, output_field=models.BooleanField()
+                ),
+            )
+        return self.annotate(
+            is_favorited=models.Exists(
+                Favorite.objects.filter(user=user,
+                                        recipe=models.OuterRef('pk'))
+            ),
+            is_in_shopping_cart=models.Exists(
+                ShoppingCart.objects.filter(user=user,
+                                            recipe=models.OuterRef('pk'))
+            ),
+        )
+
+
+class RecipeManager(models.Manager.from_queryset(RecipeQuerySet)):
+
+    def get_queryset(self):
+        # Вектор нужен только в условиях поиска: не читаем его вместе с
+        # рецептами и не перезаписываем устаревшим значением при save().
+        return super().get_queryset().defer('search_vector')
+
+
+class Recipe(DenormalizedFieldsMixin, models.Model):
     name = models.CharField(
         _('Название'),
         max_length=256,
@@ -114,6 +261,7 @@ class Recipe(models.Model):
         User,
         on_delete=models.CASCADE,
         related_name='recipes',
+        db_index=False,
         verbose_name=_('Автор'),
         help_text=_('Автор рецепта.')
     )
@@ -139,15 +287,85 @@ class Recipe(models.Model):
         null=True,
         help_text=_('Изображение готового блюда рецепта.')
     )
+    image_variants_source = models.CharField(
+        _('Изображение, для которого созданы варианты'),
+        max_length=100,
+        blank=True,
+        editable=False,
+        help_text=_('Совпадает с image, когда уменьшенные копии '
+                    'и WebP-вариант готовы.')
+    )
     pub_date = models.DateTimeField(
         _('Дата создания'),
         auto_now_add=True,
         help_text=_('Дата создания будет автоматически установлена '
                     'в текущую дату при создании рецепта.')
     )
+    updated_at = models.DateTimeField(
+        _('Дата изменения'),
+        auto_now=True,
+        help_text=_('Обновляется автоматически при каждом '
+                    'сохранении рецепта.')
+    )
+    favorites_count = models.PositiveIntegerField(
+        _('Добавлений в избранное'),
+        default=0,
+        editable=False,
+        help_text=_('Счётчик пользователей, добавивших рецепт в избранное.')
+    )
+    cart_count = models.PositiveIntegerField(
+        _('Добавлений в список покупок'),
+        default=0,
+        editable=False,
+        help_text=_('Счётчик пользователей, добавивших рецепт '
+                    'в список покупок.')
+    )
+    popularity_score = models.FloatField(
+        _('Популярность'),
+        default=NO_SCORE,
+        editable=False,
+        help_text=_('Добавления в избранное и список покупок, затухающие '
+                    'со временем: период полураспада — '
+                    'RANKING_POPULAR_HALF_LIFE_DAYS.')
+    )
+    trending_score = models.FloatField(
+        _('Набирает популярность'),
+        default=NO_SCORE,
+        editable=False,
+        help_text=_('То же с коротким периодом полураспада '
+                    'RANKING_TRENDING_HALF_LIFE_DAYS: важны недавние '
+                    'добавления.')
+    )
+
+    search_vector = SearchVectorField(
+        _('Поисковый вектор'),
+        null=True,
+        editable=False,
+        help_text=_('Название, ингредиенты и описание рецепта для '
+                    'полнотекстового поиска. Обновляется после сохранения '
+                    'рецепта; GIN-индекс создаётся только в PostgreSQL.')
+    )
+
+    objects = RecipeManager()
+
+    # Варианты изображения и поисковый вектор тоже записываются фоновыми
+    # запросами UPDATE после сохранения рецепта.
+    denormalized_fields = ('favorites_count', 'cart_count',
+                           'popularity_score', 'trending_score',
+                           'image_variants_source', 'search_vector')
 
     class Meta:
         ordering = ('-pub_date',)
+        indexes = [
+            models.Index(fields=['-pub_date', '-id'],
+                         name='recipe_pub_date_id_idx'),
+            models.Index(fields=['author', '-pub_date', '-id'],
+                         name='recipe_author_pub_date_idx'),
+            models.Index(fields=['-popularity_score', '-id'],
+                         name='recipe_popularity_idx'),
+            models.Index(fields=['-trending_score', '-id'],
+                         name='recipe_trending_idx'),
+        ]
         verbose_name = _('Рецепт')
         verbose_name_plural = _('Рецепты')
 
@@ -168,6 +386,7 @@ class RecipeTag(models.Model):
         on_delete=models.CASCADE,
         verbose_name=_('Тег'),
         null=True,
+        db_index=False,
         help_text=_('Тег, к которому будет относиться рецепт'),
     )
 
@@ -179,6 +398,10 @@ class RecipeTag(models.Model):
             models.UniqueConstraint(fields=['recipe', 'tag'],
                                     name='RecipeTag_unique_relationships'),
         ]
+        indexes = [
+            models.Index(fields=['tag', 'recipe'],
+                         name='recipetag_tag_recipe_idx'),
+        ]
 
     def __str__(self):
         return f'У рецепта {self.recipe} есть тег {self.tag}.'
@@ -230,10 +453,16 @@ class Favorite(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='favorites',
+        db_index=False,
         verbose_name=_('Рецепт'),
         help_text=_('Рецепт, который есть у пользователя '
                     'как любимый рецепт.'),
     )
+    added_at = models.DateTimeField(
+        _('Дата добавления'),
+        auto_now_add=True,
+        help_text=_('Время события для расчёта популярности рецепта.')
+    )
 
     class Meta:
         ordering = ['user']
@@ -243,6 +472,10 @@ class Favorite(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='Favorite_unique_relationships')
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='favorite_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return f'Рецепт {self.recipe} в избранном у пользователя {self.user}.'
@@ -260,9 +493,15 @@ class ShoppingCart(models.Model):
         Recipe,
         on_delete=models.CASCADE,
         related_name='purchases',
+        db_index=False,
         verbose_name=_('Рецепт'),
         help_text=_('Рецепт, который есть у пользователя в списке покупок.'),
     )
+    added_at = models.DateTimeField(
+        _('Дата добавления'),
+        auto_now_add=True,
+        help_text=_('Время события для расчёта популярности рецепта.')
+    )
 
     class Meta:
         ordering = ['user']
@@ -272,7 +511,97 @@ class ShoppingCart(models.Model):
             models.UniqueConstraint(fields=['user', 'recipe'],
                                     name='ShoppingCart_unique_relationships')
         ]
+        indexes = [
+            models.Index(fields=['recipe', 'user'],
+                         name='shoppingcart_recipe_user_idx'),
+        ]
 
     def __str__(self):
         return (f'Рецепт {self.recipe} в списке покупок '
                 f'у пользователя {self.user}.')
+
+
+class ShoppingListItem(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name=_('Пользователь'),
+        help_text=_('Пользователь, которому принадлежит список покупок.')
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        related_name='shopping_list_items',
+        verbose_name=_('Ингредиент'),
+        help_text=_('Ингредиент из рецептов в списке покупок.')
+    )
+    amount = models.PositiveIntegerField(
+        _('Количество ингредиента'),
+        help_text=_('Суммарное количество ингредиента по всем рецептам '
+                    'в списке покупок.')
+    )
+
+    class Meta:
+        verbose_name = _('Позиция списка покупок')
+        verbose_name_plural = _('Списки покупок')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'ingredient'],
+                name='ShoppingListItem_unique_relationships'
+            )
+        ]
+
+    def __str__(self):
+        return (f'{self.amount} {self.ingredient.measurement_unit} '
+                f'{self.ingredient.name} в списке покупок {self.user}.')
+
+
+class TimelineEntry(models.Model):
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='timeline',
+        db_index=False,
+        verbose_name=_('Пользователь'),
+        help_text=_('Владелец ленты подписок.')
+    )
+    recipe = models.ForeignKey(
+        Recipe,
+        on_delete=models.CASCADE,
+        related_name='timeline_entries',
+        verbose_name=_('Рецепт'),
+        help_text=_('Рецепт автора, на которого подписан пользователь.')
+    )
+    author = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='+',
+        db_index=False,
+        verbose_name=_('Автор'),
+        help_text=_('Автор рецепта: по нему записи удаляются при отписке.')
+    )
+    pub_date = models.DateTimeField(
+        _('Дата создания рецепта'),
+        help_text=_('Копия даты рецепта: лента читается по индексу '
+                    'без соединения с рецептами.')
+    )
+
+    class Meta:
+        verbose_name = _('Запись ленты подписок')
+        verbose_name_plural = _('Ленты подписок')
+        constraints = [
+            models.UniqueConstraint(
+                fields=['user', 'recipe'],
+                name='TimelineEntry_unique_relationships'
+            )
+        ]
+        indexes = [
+            models.Index(fields=['user', '-pub_date', '-recipe'],
+                         name='timeline_user_pub_date_idx'),
+            models.Index(fields=['user', 'author'],
+                         name='timeline_user_author_idx'),
+        ]
+
+    def __str__(self):
+        return f'Рецепт {self.recipe} в ленте {self.user}.'
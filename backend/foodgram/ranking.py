@@ -0,0 +1,152 @@
+import math
+from collections import defaultdict
+from datetime import datetime
+from typing import Iterable, Tuple, Type
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, F, FloatField, Model, Value, When
+from django.db.models.functions import Abs, Exp, Greatest, Ln
+
+from .models import NO_SCORE, Favorite, Recipe, RecipeTag, ShoppingCart, Tag
+
+POPULAR = 'popular'
+TRENDING = 'trending'
+# Сортировки ленты по хранимым оценкам; id делает порядок однозначным
+# для курсора.
+RANKING_ORDERINGS = {
+    POPULAR: ('-popularity_score', '-id'),
+    TRENDING: ('-trending_score', '-id'),
+}
+SCORE_FIELDS = ('popularity_score', 'trending_score')
+# Вес события: рецепт из списка покупок, скорее всего, готовят.
+EVENT_WEIGHTS = {Favorite: 1.0, ShoppingCart: 2.0}
+REBUILD_CHUNK_SIZE = 10000
+REBUILD_BATCH_SIZE = 1000
+SECONDS_PER_DAY = 86400
+# e^−50 меньше точности float: слагаемые, которые меньше большего в столько
+# раз, не меняют сумму. Ограничение не даёт EXP уйти в антипереполнение,
+# на котором PostgreSQL падает с ошибкой.
+MIN_EXPONENT = -50.0
+# Если после вычитания остаётся меньше этой доли суммы, остаток — ошибка
+# округления, и у рецепта считается, что событий нет.
+MIN_REMAINDER = 1e-9
+
+
+def get_event_scores(weight: float, added_at: datetime) -> Tuple[float, ...]:
+    """Вклад события в оценки SCORE_FIELDS.
+
+    Затухающая оценка рецепта в момент t — сумма
+    weight · 2^(−(t − added_at) / half_life) по его событиям. Все
+    слагаемые делятся на общий множитель 2^((t − RANKING_EPOCH) /
+    half_life), поэтому порядок рецептов задаёт сумма
+    weight · 2^((added_at − RANKING_EPOCH) / half_life). Она растёт
+    экспоненциально и через несколько лет переполнила бы float, поэтому
+    хранится её натуральный логарифм: он растёт линейно, а вклад события —
+    ln(weight) + ln 2 · (added_at − RANKING_EPOCH) / half_life.
+    """
+    age = (added_at - settings.RANKING_EPOCH).total_seconds() / SECONDS_PER_DAY
+    return tuple(math.log(weight) + math.log(2) * age / half_life
+                 for half_life in (settings.RANKING_POPULAR_HALF_LIFE_DAYS,
+                                   settings.RANKING_TRENDING_HALF_LIFE_DAYS))
+
+
+def add_log_scores(first: float, second: float) -> float:
+    """ln(e^first + e^second) без переполнения; NO_SCORE — пустая сумма."""
+    if first <= NO_SCORE:
+        return second
+    if second <= NO_SCORE:
+        return first
+    high, low = max(first, second), min(first, second)
+    return high + math.log1p(math.exp(low - high))
+
+
+def add_event_scores(scores: dict, weight: float,
+                     events: Iterable[Tuple[int, datetime]]) -> dict:
+    for recipe_id, added_at in events:
+        recipe_scores = scores[recipe_id]
+        for index, score in enumerate(get_event_scores(weight, added_at)):
+            recipe_scores[index] = add_log_scores(recipe_scores[index], score)
+    return scores
+
+
+def get_changed_score(field: str, delta: float, sign: int):
+    """Выражение для логарифма суммы field после прибавления
+    (sign = 1) или вычитания (sign = −1) слагаемого e^delta."""
+    if sign > 0:
+        return Greatest(F(field), Value(delta)) + Ln(1 + Exp(Greatest(
+            -Abs(F(field) - Value(delta)), Value(MIN_EXPONENT)
+        )))
+    return F(field) + Ln(1 - Exp(Greatest(
+        Value(delta) - F(field), Value(MIN_EXPONENT)
+    )))
+
+
+def get_change_condition(field: str, recipe_id: int, delta: float,
+                         sign: int) -> dict:
+    condition = {'pk': recipe_id}
+    if sign < 0:
+        condition[f'{field}__gt'] = delta - math.log1p(-MIN_REMAINDER)
+    return condition
+
+
+def change_recipe_scores(model: Type[Model],
+                         events: Iterable[Tuple[int, datetime]],
+                         sign: int = 1) -> None:
+    """Прибавляет (sign = 1) или вычитает (sign = −1) вклад событий
+    model — пар (id рецепта, время события) — одним UPDATE.
+
+    Если вычитание оставляет меньше MIN_REMAINDER суммы, оценка
+    становится NO_SCORE: разность логарифмов близких чисел неточна,
+    а события, которые остались, уточнит rebuild_rankings.
+    """
+    deltas = add_event_scores(
+        defaultdict(lambda: [NO_SCORE] * len(SCORE_FIELDS)),
+        EVENT_WEIGHTS[model], events
+    )
+    if not deltas:
+        return
+    Recipe.objects.filter(pk__in=deltas).update(**{
+        field: Case(
+            *[When(then=get_changed_score(field, delta[index], sign),
+                   **get_change_condition(field, recipe_id, delta[index],
+                                          sign))
+              for recipe_id, delta in deltas.items()],
+            default=Value(NO_SCORE),
+            output_field=FloatField()
+        )
+        for index, field in enumerate(SCORE_FIELDS)
+    })
+
+
+@transaction.atomic
+def rebuild_rankings() -> None:
+    """Пересчитывает оценки рецептов по всем событиям, а оценки тегов —
+    как суммы оценок их рецептов.
+
+    Оценки рецептов обновляются при каждом событии, оценки тегов — только
+    этой командой, поэтому её запускают периодически.
+    """
+    scores = defaultdict(lambda: [NO_SCORE] * len(SCORE_FIELDS))
+    for model, weight in EVENT_WEIGHTS.items():
+        add_event_scores(scores, weight, model.objects.order_by().values_list(
+            'recipe_id', 'added_at'
+        ).iterator(chunk_size=REBUILD_CHUNK_SIZE))
+    Recipe.objects.update(**{field: NO_SCORE for field in SCORE_FIELDS})
+    Recipe.objects.bulk_update([
+        Recipe(pk=recipe_id, **dict(zip(SCORE_FIELDS, recipe_scores)))
+        for recipe_id, recipe_scores in scores.items()
+    ], SCORE_FIELDS, batch_size=REBUILD_BATCH_SIZE)
+    tag_scores = defaultdict(lambda: [NO_SCORE] * len(SCORE_FIELDS))
+    for tag_id, *recipe_scores in RecipeTag.objects.order_by().values_list(
+        'tag_id', *[f'recipe__{field}' for field in SCORE_FIELDS]
+    ).iterator(chunk_size=REBUILD_CHUNK_SIZE):
+        tag_scores[tag_id] = [
+            add_log_scores(total, score)
+            for total, score in zip(tag_scores[tag_id], recipe_scores)
+        ]
+    Tag.objects.update(**{field: NO_SCORE for field in SCORE_FIELDS})
+    Tag.objects.bulk_update([
+        Tag(pk=tag_id, **dict(zip(SCORE_FIELDS, totals)))
+        for tag_id, totals in tag_scores.items()
+    ], SCORE_FIELDS, batch_size=REBUILD_BATCH_SIZE)
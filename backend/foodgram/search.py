@@ -0,0 +1,45 @@
+from django.conf import settings
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import SearchVector
+from django.db import connections, transaction
+from django.db.models import OuterRef, Subquery, TextField
+
+from .models import Recipe, RecipeIngredient
+
+
+def get_search_vector(recipe_ingredient_model=RecipeIngredient):
+    """Выражение поискового вектора рецепта: название (вес A), названия
+    ингредиентов (B) и описание (C).
+
+    Модель связи передаётся параметром, чтобы выражение можно было
+    построить и по историческим моделям в миграции.
+    """
+    ingredient_names = recipe_ingredient_model.objects.filter(
+        recipe=OuterRef('pk')
+    ).order_by().values('recipe').annotate(
+        names=StringAgg('ingredient__name', ' ')
+    ).values('names')
+    config = settings.RECIPE_SEARCH_CONFIG
+    return (
+        SearchVector('name', weight='A', config=config)
+        + SearchVector(Subquery(ingredient_names, output_field=TextField()),
+                       weight='B', config=config)
+        + SearchVector('text', weight='C', config=config)
+    )
+
+
+def update_search_vectors(recipes=None) -> int:
+    """Пересчитывает search_vector одним UPDATE для рецептов из
+    queryset recipes (по умолчанию — для всех). Вне PostgreSQL поиск
+    обходится без вектора, и ничего не делается."""
+    if recipes is None:
+        recipes = Recipe.objects.all()
+    if connections[recipes.db].vendor != 'postgresql':
+        return 0
+    return recipes.order_by().update(search_vector=get_search_vector())
+
+
+def schedule_search_vector_update(recipes) -> None:
+    """Пересчитывает векторы рецептов из queryset recipes после фиксации
+    транзакции, когда связи рецептов с ингредиентами уже записаны."""
+    transaction.on_commit(lambda: update_search_vectors(recipes))
@@ -0,0 +1,71 @@
+from typing import Iterable
+
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import RecipeIngredient, ShoppingCart, ShoppingListItem, User
+
+
+@transaction.atomic
+def refresh_shopping_lists(user_ids: Iterable[int],
+                           ingredient_ids: Iterable[int]) -> None:
+    """Пересчитывает строки списков покупок для указанных пар
+    пользователь × ингредиент по текущему содержимому корзин."""
+    user_ids = sorted(set(user_ids))
+    ingredient_ids = set(ingredient_ids)
+    if not user_ids or not ingredient_ids:
+        return
+    # Блокировка пользователей упорядочивает параллельные пересчёты
+    # одного и того же списка.
+    list(User.objects.select_for_update().filter(
+        id__in=user_ids
+    ).order_by('id').values_list('id', flat=True))
+    ShoppingListItem.objects.filter(
+        user_id__in=user_ids,
+        ingredient_id__in=ingredient_ids
+    ).delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__purchases__user_id__in=user_ids,
+        ingredient_id__in=ingredient_ids
+    ).values_list(
+        'recipe__purchases__user_id', 'ingredient_id'
+    ).annotate(amount=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create([
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=amount)
+        for user_id, ingredient_id, amount in totals
+    ])
+
+
+def refresh_recipe_in_shopping_lists(recipe_id: int,
+                                     ingredient_ids: Iterable[int]) -> None:
+    refresh_shopping_lists(
+        ShoppingCart.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('user_id', flat=True),
+        ingredient_ids
+    )
+
+
+def refresh_cart_recipe(user_id: int, recipe_id: int) -> None:
+    refresh_shopping_lists(
+        [user_id],
+        RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', flat=True)
+    )
+
+
+@transaction.atomic
+def rebuild_shopping_lists() -> None:
+    ShoppingListItem.objects.all().delete()
+    totals = RecipeIngredient.objects.filter(
+        recipe__purchases__isnull=False
+    ).values_list(
+        'recipe__purchases__user_id', 'ingredient_id'
+    ).annotate(amount=Sum('amount')).order_by()
+    ShoppingListItem.objects.bulk_create(
+        ShoppingListItem(user_id=user_id, ingredient_id=ingredient_id,
+                         amount=amount)
+        for user_id, ingredient_id, amount in totals.iterator()
+    )
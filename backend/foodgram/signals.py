@@ -0,0 +1,99 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .counters import COUNTERS, change_counter
+from .feed import (add_authors_to_timeline, remove_authors_from_timeline,
+                   schedule_backfill, schedule_fan_out)
+from .images import schedule_recipe_image_variants
+from .models import (Favorite, Follow, Ingredient, Recipe,
+                     RecipeIngredient, ShoppingCart)
+from .ranking import change_recipe_scores
+from .search import schedule_search_vector_update
+from .shopping_list import (refresh_cart_recipe,
+                            refresh_recipe_in_shopping_lists)
+
+
+def connect_counter(source, target, foreign_key, field):
+    def increment(sender, instance, created, **kwargs):
+        if created:
+            change_counter(target, getattr(instance, foreign_key), field, 1)
+
+    def decrement(sender, instance, **kwargs):
+        change_counter(target, getattr(instance, foreign_key), field, -1)
+
+    post_save.connect(increment, sender=source, weak=False,
+                      dispatch_uid=f'{field}_increment')
+    post_delete.connect(decrement, sender=source, weak=False,
+                        dispatch_uid=f'{field}_decrement')
+
+
+for counter in COUNTERS:
+    connect_counter(*counter)
+
+
+@receiver(post_save, sender=Recipe)
+def create_image_variants(sender, instance, **kwargs):
+    schedule_recipe_image_variants(instance)
+
+
+@receiver(post_save, sender=Recipe)
+def update_search_vector(sender, instance, **kwargs):
+    schedule_search_vector_update(Recipe.objects.filter(pk=instance.pk))
+
+
+@receiver(post_save, sender=Recipe)
+def fan_out_recipe(sender, instance, created, **kwargs):
+    if created:
+        schedule_fan_out([instance])
+
+
+@receiver(post_save, sender=Follow)
+def add_author_to_timeline(sender, instance, created, **kwargs):
+    if created:
+        add_authors_to_timeline(instance.user_id, [instance.author_id])
+
+
+@receiver(post_delete, sender=Follow)
+def remove_author_from_timeline(sender, instance, **kwargs):
+    remove_authors_from_timeline(instance.user_id, [instance.author_id])
+    schedule_backfill([instance.author_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_search_vectors_on_ingredient_change(sender, instance, created,
+                                               **kwargs):
+    if not created:
+        schedule_search_vector_update(Recipe.objects.filter(
+            pk__in=RecipeIngredient.objects.filter(
+                ingredient=instance
+            ).values('recipe_id')
+        ))
+
+
+@receiver(post_save, sender=Favorite)
+@receiver(post_save, sender=ShoppingCart)
+def add_recipe_scores(sender, instance, created, **kwargs):
+    if created:
+        change_recipe_scores(
+            sender, [(instance.recipe_id, instance.added_at)]
+        )
+
+
+@receiver(post_delete, sender=Favorite)
+@receiver(post_delete, sender=ShoppingCart)
+def remove_recipe_scores(sender, instance, **kwargs):
+    change_recipe_scores(
+        sender, [(instance.recipe_id, instance.added_at)], -1
+    )
+
+
+@receiver((post_save, post_delete), sender=ShoppingCart)
+def refresh_shopping_list_on_cart_change(sender, instance, **kwargs):
+    refresh_cart_recipe(instance.user_id, instance.recipe_id)
+
+
+@receiver((post_save, post_delete), sender=RecipeIngredient)
+def refresh_shopping_lists_on_ingredient_change(sender, instance, **kwargs):
+    refresh_recipe_in_shopping_lists(
+        instance.recipe_id, [instance.ingredient_id]
+    )
@@ -0,0 +1,170 @@
+import random
+from bisect import bisect
+from itertools import accumulate
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.db.models import Max
+
+from .counters import rebuild_counters
+from .feed import rebuild_timelines
+from .importer import batched
+from .models import (Favorite, Follow, Ingredient, Recipe, RecipeIngredient,
+                     RecipeTag, ShoppingCart, Tag, User)
+from .ranking import rebuild_rankings
+from .search import update_search_vectors
+from .shopping_list import rebuild_shopping_lists
+
+UNIQUE_SAMPLE_ATTEMPTS = 4
+
+
+class ZipfSampler:
+    """Выбирает элементы с вероятностью, обратной рангу в степени skew.
+
+    При skew = 0 выбор равномерный, при skew ≈ 1 несколько популярных
+    авторов, рецептов и ингредиентов получают большую часть связей, как
+    в живых данных. Ранги назначаются случайно, а не по id.
+    """
+
+    def __init__(self, items, skew, rng):
+        self.items = list(items)
+        rng.shuffle(self.items)
+        self.rng = rng
+        self.cumulative = list(accumulate(
+            1 / (rank + 1) ** skew for rank in range(len(self.items))
+        ))
+
+    def sample(self):
+        point = self.rng.random() * self.cumulative[-1]
+        return self.items[bisect(self.cumulative, point)]
+
+    def sample_unique(self, count, exclude=None):
+        count = min(count, len(self.items) - (exclude is not None))
+        found = set()
+        for _attempt in range(count * UNIQUE_SAMPLE_ATTEMPTS):
+            if len(found) == count:
+                break
+            item = self.sample()
+            if item != exclude:
+                found.add(item)
+        return found
+
+
+def get_created_recipe_ids(batch) -> list:
+    """Идентификаторы рецептов пачки по их именам: имена в пачке
+    уникальны, а при повторной генерации с тем же префиксом новые строки
+    получают бо́льшие id. Рецепты, созданные параллельно, не попадают."""
+    names = [recipe.name for recipe in batch]
+    ids = []
+    for chunk in batched(names, connection.ops.bulk_batch_size(['name'],
+                                                               batch)):
+        ids.extend(Recipe.objects.filter(
+            name__in=chunk
+        ).order_by().values('name').annotate(
+            last_id=Max('id')
+        ).values_list('last_id', flat=True))
+    return ids
+
+
+def generate_dataset(users=50, recipes=2000, ingredients=500, tags=3,
+                     ingredients_per_recipe=5, favorites=40, carts=5,
+                     follows=5, skew=1.0, random_seed=0,
+                     prefix='synthetic', batch_size=5000) -> dict:
+    """Синтетические данные для проверки планов, замеров и нагрузочных
+    тестов.
+
+    favorites, carts и follows — сколько рецептов в избранном и в
+    корзине и сколько подписок у каждого пользователя; skew задаёт
+    перекос популярности. При одинаковых параметрах и random_seed
+    данные совпадают. Рецепты и их связи создаются пачками, поэтому
+    объём ограничен только временем: миллион рецептов не держится в
+    памяти целиком. Возвращает количество созданных объектов.
+    """
+    rng = random.Random(random_seed)
+    User.objects.bulk_create([
+        User(username=f'{prefix}_user_{number}',
+             email=f'{prefix}_user_{number}@example.com',
+             first_name='Synthetic', last_name='User',
+             password=make_password(None))
+        for number in range(users)
+    ], ignore_conflicts=True)
+    user_ids = list(User.objects.filter(
+        username__startswith=f'{prefix}_user_'
+    ).values_list('id', flat=True))
+    Tag.objects.bulk_create([
+        Tag(name=f'{prefix} tag {number}', color=f'#{number:06X}',
+            slug=f'{prefix}_tag_{number}')
+        for number in range(tags)
+    ], ignore_conflicts=True)
+    tag_ids = list(Tag.objects.filter(
+        slug__startswith=f'{prefix}_tag_'
+    ).values_list('id', flat=True))
+    Ingredient.objects.bulk_create([
+        Ingredient(name=f'{prefix} ingredient {number}',
+                   measurement_unit='г')
+        for number in range(ingredients)
+    ], ignore_conflicts=True)
+    ingredient_ids = list(Ingredient.objects.filter(
+        name__startswith=f'{prefix} ingredient'
+    ).values_list('id', flat=True))
+
+    author_sampler = ZipfSampler(user_ids, skew, rng)
+    tag_sampler = ZipfSampler(tag_ids, skew, rng)
+    ingredient_sampler = ZipfSampler(ingredient_ids, skew, rng)
+    recipe_ids = []
+    for numbers in batched(range(recipes), batch_size):
+        batch = Recipe.objects.bulk_create([
+            Recipe(name=f'{prefix} recipe {number}', text='Synthetic',
+                   author_id=author_sampler.sample(),
+                   cooking_time=rng.randint(5, 120))
+            for number in numbers
+        ])
+        if batch[0].pk is None:
+            # Не все СУБД возвращают первичные ключи из bulk_create.
+            ids = sorted(get_created_recipe_ids(batch))
+        else:
+            ids = sorted(recipe.pk for recipe in batch)
+        recipe_ids.extend(ids)
+        # У части рецептов несколько тегов, чтобы фильтр по нескольким
+        # тегам находил и пересечения.
+        RecipeTag.objects.bulk_create([
+            RecipeTag(recipe_id=recipe_id, tag_id=tag_id)
+            for recipe_id in ids
+            for tag_id in tag_sampler.sample_unique(rng.randint(1, 2))
+        ])
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe_id=recipe_id, ingredient_id=ingredient_id,
+                             amount=rng.randint(1, 500))
+            for recipe_id in ids
+            for ingredient_id in ingredient_sampler.sample_unique(
+                ingredients_per_recipe
+            )
+        ])
+
+    recipe_sampler = ZipfSampler(recipe_ids, skew, rng)
+    for model, count in ((Favorite, favorites), (ShoppingCart, carts)):
+        if not count or not recipe_ids:
+            continue
+        for user_batch in batched(user_ids, max(1, batch_size // count)):
+            model.objects.bulk_create([
+                model(user_id=user_id, recipe_id=recipe_id)
+                for user_id in user_batch
+                for recipe_id in recipe_sampler.sample_unique(count)
+            ], ignore_conflicts=True)
+    Follow.objects.bulk_create([
+        Follow(user_id=user_id, author_id=author_id)
+        for user_id in user_ids
+        for author_id in author_sampler.sample_unique(follows,
+                                                      exclude=user_id)
+    ], ignore_conflicts=True)
+    rebuild_counters()
+    rebuild_shopping_lists()
+    rebuild_timelines()
+    rebuild_rankings()
+    update_search_vectors()
+    return {
+        'users': len(user_ids),
+        'tags': len(tag_ids),
+        'ingredients': len(ingredient_ids),
+        'recipes': len(recipe_ids),
+    }
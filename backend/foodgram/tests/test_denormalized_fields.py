@@ -0,0 +1,58 @@
+from django.test import TestCase
+
+from foodgram.models import NO_SCORE, Favorite, Follow, Recipe, Tag, User
+
+
+class DenormalizedFieldsTest(TestCase):
+    """Полное сохранение объекта не затирает счётчики и оценки, изменённые
+    запросами UPDATE после его загрузки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pw',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pw',
+            first_name='Читатель', last_name='Рецептов'
+        )
+        cls.recipe = Recipe.objects.create(
+            author=cls.author, name='Борщ', text='Сварить.', cooking_time=60
+        )
+
+    def test_recipe_save_keeps_counters_and_scores(self):
+        stale = Recipe.objects.get(pk=self.recipe.pk)
+        Favorite.objects.create(user=self.reader, recipe=self.recipe)
+        stale.name = 'Щи'
+        stale.save()
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        self.assertEqual(recipe.name, 'Щи')
+        self.assertEqual(recipe.favorites_count, 1)
+        self.assertGreater(recipe.popularity_score, NO_SCORE)
+
+    def test_user_save_keeps_counters(self):
+        stale = User.objects.get(pk=self.author.pk)
+        Follow.objects.create(user=self.reader, author=self.author)
+        stale.first_name = 'Повар'
+        stale.save()
+        author = User.objects.get(pk=self.author.pk)
+        self.assertEqual(author.first_name, 'Повар')
+        self.assertEqual(author.followers_count, 1)
+        self.assertEqual(author.recipes_count, 1)
+
+    def test_tag_save_keeps_scores(self):
+        tag = Tag.objects.create(name='Обед', color='#FF0000', slug='lunch')
+        Tag.objects.filter(pk=tag.pk).update(popularity_score=5)
+        tag.name = 'Ужин'
+        tag.save()
+        tag.refresh_from_db()
+        self.assertEqual(tag.name, 'Ужин')
+        self.assertEqual(tag.popularity_score, 5)
+
+    def test_explicit_update_fields_are_saved(self):
+        recipe = Recipe.objects.get(pk=self.recipe.pk)
+        recipe.favorites_count = 7
+        recipe.save(update_fields=['favorites_count'])
+        recipe.refresh_from_db()
+        self.assertEqual(recipe.favorites_count, 7)
@@ -0,0 +1,59 @@
+from django.test import TransactionTestCase, override_settings
+
+from foodgram.feed import get_feed_positions
+from foodgram.models import Follow, Recipe, User
+from foodgram.user_lists import remove_from_user_list
+
+
+@override_settings(FEED_FANOUT_MAX_FOLLOWERS=2, FEED_FANOUT_WORKERS=0,
+                   FEED_TIMELINE_LENGTH=10)
+class FanOutThresholdTest(TransactionTestCase):
+    """Рецепты не пропадают из ленты, когда число подписчиков автора
+    опускается до FEED_FANOUT_MAX_FOLLOWERS.
+
+    TransactionTestCase: раскладка выполняется в on_commit.
+    """
+
+    def setUp(self):
+        self.author = self.create_user('author')
+        self.readers = [self.create_user(f'reader{number}')
+                        for number in range(3)]
+
+    def create_user(self, username):
+        return User.objects.create_user(
+            username=username, email=f'{username}@example.org',
+            password='pw', first_name='Имя', last_name='Фамилия'
+        )
+
+    def publish(self, name):
+        return Recipe.objects.create(
+            author=self.author, name=name, text='Сварить.', cooking_time=10
+        )
+
+    def feed(self, user):
+        return [pk for _pub_date, pk in get_feed_positions(user, 10)]
+
+    def follow(self, reader):
+        Follow.objects.create(user=reader, author=self.author)
+
+    def test_recipes_published_above_threshold_stay_after_unfollow(self):
+        for reader in self.readers:
+            self.follow(reader)
+        recipe = self.publish('Борщ')
+        self.assertEqual(self.feed(self.readers[0]), [recipe.pk])
+        Follow.objects.filter(user=self.readers[2]).delete()
+        self.assertEqual(self.feed(self.readers[0]), [recipe.pk])
+        self.assertEqual(self.feed(self.readers[1]), [recipe.pk])
+
+    def test_late_follower_gets_recipes_after_batch_unfollow(self):
+        self.follow(self.readers[0])
+        self.follow(self.readers[1])
+        fanned_out = self.publish('Щи')
+        self.follow(self.readers[2])
+        merged = self.publish('Борщ')
+        expected = [merged.pk, fanned_out.pk]
+        self.assertEqual(self.feed(self.readers[2]), expected)
+        remove_from_user_list(Follow, self.readers[0].pk, [self.author.pk])
+        self.assertEqual(self.feed(self.readers[1]), expected)
+        self.assertEqual(self.feed(self.readers[2]), expected)
+        self.assertEqual(self.feed(self.readers[0]), [])
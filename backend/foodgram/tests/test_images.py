@@ -0,0 +1,58 @@
+import base64
+import io
+import shutil
+import tempfile
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.test import TestCase, override_settings
+from PIL import Image
+from rest_framework.exceptions import ValidationError
+
+from api.fields import Base64ImageField
+from foodgram.images import generate_image_variants, get_variant_name
+
+MEDIA_ROOT = tempfile.mkdtemp()
+
+
+def make_png(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), '#E26C2D').save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class ImageVariantsTest(TestCase):
+    """Варианты изображения уменьшаются друг из друга, а слишком большие
+    изображения отклоняются до декодирования пикселей."""
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+    def get_variant_size(self, name, variant):
+        with default_storage.open(get_variant_name(name, variant)) as file:
+            return Image.open(file).size
+
+    def test_variants_keep_aspect_ratio(self):
+        name = default_storage.save('recipes/wide.png',
+                                    ContentFile(make_png(1200, 600)))
+        generate_image_variants(0, name)
+        self.assertEqual(self.get_variant_size(name, 'webp'), (1200, 600))
+        self.assertEqual(self.get_variant_size(name, 'medium'), (960, 480))
+        self.assertEqual(self.get_variant_size(name, 'thumbnail'), (320, 160))
+
+    @override_settings(RECIPE_IMAGE_MAX_PIXELS=100 * 100)
+    def test_oversized_image_is_rejected(self):
+        png = make_png(101, 100)
+        name = default_storage.save('recipes/large.png', ContentFile(png))
+        with self.assertRaises(ValueError):
+            generate_image_variants(0, name)
+        self.assertFalse(
+            default_storage.exists(get_variant_name(name, 'thumbnail'))
+        )
+        with self.assertRaises(ValidationError):
+            Base64ImageField().to_internal_value(
+                'data:image/png;base64,' + base64.b64encode(png).decode()
+            )
@@ -0,0 +1,82 @@
+import math
+from datetime import timedelta
+
+from django.conf import settings
+from django.test import TestCase
+
+from foodgram.models import (NO_SCORE, Favorite, Recipe, RecipeTag,
+                             ShoppingCart, Tag, User)
+from foodgram.ranking import (POPULAR, RANKING_ORDERINGS, TRENDING,
+                              change_recipe_scores, get_event_scores,
+                              rebuild_rankings)
+
+# Через 20 лет после эпохи сумма 2^(age / half_life) с периодом полураспада
+# в два дня давно переполнила бы float.
+FAR_FROM_EPOCH = settings.RANKING_EPOCH + timedelta(days=20 * 365)
+
+
+class RankingTest(TestCase):
+    """Оценки событий, далёких от RANKING_EPOCH, остаются конечными и
+    упорядочивают рецепты так же, как затухающие суммы."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pw',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.recipes = [
+            Recipe.objects.create(author=cls.author, name=f'Суп {number}',
+                                  text='Сварить.', cooking_time=30)
+            for number in range(2)
+        ]
+
+    def get_ranking(self, ordering):
+        return list(Recipe.objects.order_by(
+            *RANKING_ORDERINGS[ordering]
+        ).values_list('pk', flat=True))
+
+    def test_far_events_keep_order_and_can_be_removed(self):
+        favorite, cart = [recipe.pk for recipe in self.recipes]
+        cart_added_at = FAR_FROM_EPOCH - timedelta(days=3)
+        change_recipe_scores(Favorite, [(favorite, FAR_FROM_EPOCH)])
+        change_recipe_scores(ShoppingCart, [(cart, cart_added_at)])
+        # Корзина весит вдвое больше, но за три дня «набирает популярность»
+        # затухает почти втрое, а популярность — почти не затухает.
+        self.assertEqual(self.get_ranking(POPULAR), [cart, favorite])
+        self.assertEqual(self.get_ranking(TRENDING), [favorite, cart])
+        recipe = Recipe.objects.get(pk=favorite)
+        for score, expected in zip(
+            (recipe.popularity_score, recipe.trending_score),
+            get_event_scores(1.0, FAR_FROM_EPOCH)
+        ):
+            self.assertAlmostEqual(score, expected)
+        change_recipe_scores(Favorite, [(favorite, cart_added_at)])
+        change_recipe_scores(Favorite, [(favorite, FAR_FROM_EPOCH)], -1)
+        recipe = Recipe.objects.get(pk=favorite)
+        self.assertAlmostEqual(
+            recipe.trending_score, get_event_scores(1.0, cart_added_at)[1]
+        )
+        change_recipe_scores(Favorite, [(favorite, cart_added_at)], -1)
+        recipe = Recipe.objects.get(pk=favorite)
+        self.assertEqual(recipe.popularity_score, NO_SCORE)
+        self.assertEqual(recipe.trending_score, NO_SCORE)
+
+    def test_rebuild_matches_incremental_scores(self):
+        reader = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pw',
+            first_name='Читатель', last_name='Рецептов'
+        )
+        tag = Tag.objects.create(name='Обед', color='#FF0000', slug='lunch')
+        for recipe in self.recipes:
+            RecipeTag.objects.create(recipe=recipe, tag=tag)
+            Favorite.objects.create(user=reader, recipe=recipe)
+        Favorite.objects.update(added_at=FAR_FROM_EPOCH)
+        rebuild_rankings()
+        expected = get_event_scores(1.0, FAR_FROM_EPOCH)
+        for recipe in Recipe.objects.all():
+            self.assertAlmostEqual(recipe.popularity_score, expected[0])
+            self.assertAlmostEqual(recipe.trending_score, expected[1])
+        tag.refresh_from_db()
+        # Сумма двух одинаковых оценок вдвое больше: её логарифм — на ln 2.
+        self.assertAlmostEqual(tag.trending_score, expected[1] + math.log(2))
@@ -0,0 +1,89 @@
+from django.test import TestCase
+
+from foodgram.models import (NO_SCORE, Favorite, Follow, Recipe, ShoppingCart,
+                             User)
+from foodgram.user_lists import (add_to_user_list, delete_recipe,
+                                 remove_from_user_list)
+
+
+class UserListsTest(TestCase):
+    """Пакетные изменения списков считают только действительно
+    вставленные и удалённые строки."""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create_user(
+            username='author', email='author@example.org', password='pw',
+            first_name='Автор', last_name='Рецептов'
+        )
+        cls.reader = User.objects.create_user(
+            username='reader', email='reader@example.org', password='pw',
+            first_name='Читатель', last_name='Рецептов'
+        )
+        cls.recipes = [
+            Recipe.objects.create(author=cls.author, name=f'Суп {number}',
+                                  text='Сварить.', cooking_time=30)
+            for number in range(3)
+        ]
+
+    def test_existing_rows_are_not_counted_as_added(self):
+        existing, *others = self.recipes
+        Favorite.objects.create(user=self.reader, recipe=existing)
+        before = Recipe.objects.get(pk=existing.pk)
+        added = add_to_user_list(
+            Favorite, self.reader.pk, [recipe.pk for recipe in self.recipes]
+        )
+        self.assertEqual(added, sorted(recipe.pk for recipe in others))
+        after = Recipe.objects.get(pk=existing.pk)
+        self.assertEqual(after.favorites_count, 1)
+        self.assertEqual(after.popularity_score, before.popularity_score)
+        for recipe in Recipe.objects.filter(pk__in=added):
+            self.assertEqual(recipe.favorites_count, 1)
+            self.assertGreater(recipe.popularity_score, NO_SCORE)
+        self.assertEqual(add_to_user_list(
+            Favorite, self.reader.pk, [recipe.pk for recipe in self.recipes]
+        ), [])
+
+    def test_follow_batch_counts_followers_once(self):
+        self.assertEqual(
+            add_to_user_list(Follow, self.reader.pk, [self.author.pk]),
+            [self.author.pk]
+        )
+        self.assertEqual(
+            add_to_user_list(Follow, self.reader.pk, [self.author.pk]), []
+        )
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).followers_count, 1
+        )
+        self.assertEqual(
+            remove_from_user_list(Follow, self.reader.pk, [self.author.pk]),
+            [self.author.pk]
+        )
+        self.assertEqual(
+            User.objects.get(pk=self.author.pk).followers_count, 0
+        )
+
+    def test_remove_restores_counters_and_scores(self):
+        ids = [recipe.pk for recipe in self.recipes]
+        add_to_user_list(ShoppingCart, self.reader.pk, ids)
+        self.assertEqual(
+            remove_from_user_list(ShoppingCart, self.reader.pk, ids[:2]),
+            ids[:2]
+        )
+        counts = dict(Recipe.objects.values_list('pk', 'cart_count'))
+        self.assertEqual(counts, {ids[0]: 0, ids[1]: 0, ids[2]: 1})
+        for recipe in Recipe.objects.filter(pk__in=ids[:2]):
+            self.assertEqual(recipe.popularity_score, NO_SCORE)
+        self.assertFalse(ShoppingCart.objects.filter(
+            user=self.reader, recipe_id__in=ids[:2]
+        ).exists())
+
+    def test_delete_recipe_removes_list_rows(self):
+        recipe = Recipe.objects.get(pk=self.recipes[0].pk)
+        Favorite.objects.create(user=self.reader, recipe=recipe)
+        ShoppingCart.objects.create(user=self.reader, recipe=recipe)
+        pk = recipe.pk
+        delete_recipe(recipe)
+        self.assertFalse(Recipe.objects.filter(pk=pk).exists())
+        self.assertFalse(Favorite.objects.filter(recipe_id=pk).exists())
+        self.assertFalse(ShoppingCart.objects.filter(recipe_id=pk).exists())
@@ -0,0 +1,152 @@
+from typing import Iterable, List, Type
+
+from django.db import connections, router, transaction
+from django.db.models import F, Model
+
+from .counters import COUNTERS
+from .feed import (add_authors_to_timeline, remove_authors_from_timeline,
+                   schedule_backfill)
+from .models import (Favorite, Follow, Recipe, RecipeIngredient, ShoppingCart,
+                     User)
+from .ranking import EVENT_WEIGHTS, change_recipe_scores
+from .shopping_list import refresh_shopping_lists
+
+# Списки пользователя: модель связи → (модель со счётчиком, внешний ключ,
+# поле счётчика).
+USER_LISTS = {
+    source: (target, foreign_key, field)
+    for source, target, foreign_key, field in COUNTERS
+    if source in (Favorite, ShoppingCart, Follow)
+}
+
+
+def lock_user(user_id: int) -> None:
+    # Изменения списков одного пользователя выполняются по очереди:
+    # иначе пакетный и одиночный запросы могут прочитать одну и ту же
+    # строку и изменить счётчик дважды.
+    list(User.objects.select_for_update().filter(
+        pk=user_id
+    ).values_list('pk', flat=True))
+
+
+def apply_changes(model: Type[Model], user_id: int,
+                  target_ids: List[int], delta: int) -> None:
+    """Счётчики, список покупок и лента подписок для изменённых одной
+    операцией строк: bulk_create и удаление запросом не вызывают
+    сигналы."""
+    if not target_ids:
+        return
+    target, _foreign_key, field = USER_LISTS[model]
+    target.objects.filter(pk__in=target_ids).update(
+        **{field: F(field) + delta}
+    )
+    if model is ShoppingCart:
+        refresh_shopping_lists([user_id], RecipeIngredient.objects.filter(
+            recipe_id__in=target_ids
+        ).values_list('ingredient_id', flat=True))
+    elif model is Follow and delta > 0:
+        add_authors_to_timeline(user_id, target_ids)
+    elif model is Follow:
+        remove_authors_from_timeline(user_id, target_ids)
+        schedule_backfill(target_ids)
+
+
+def delete_rows(model: Type[Model], field: str,
+                values: Iterable) -> int:
+    """Удаляет строки, у которых field входит в values, одним DELETE и
+    возвращает их число.
+
+    QuerySet.delete() при подключённых сигналах загружает строки и
+    обрабатывает каждую отдельно; здесь сигналы не вызываются, и
+    вызывающий сам пересчитывает зависимые данные одним запросом.
+    """
+    values = list(values)
+    if not values:
+        return 0
+    connection = connections[router.db_for_write(model)]
+    quote_name = connection.ops.quote_name
+    with connection.cursor() as cursor:
+        cursor.execute(
+            'DELETE FROM {} WHERE {} IN ({})'.format(
+                quote_name(model._meta.db_table),
+                quote_name(model._meta.get_field(field).column),
+                ', '.join(['%s'] * len(values))
+            ),
+            values
+        )
+        return cursor.rowcount
+
+
+@transaction.atomic
+def add_to_user_list(model: Type[Model], user_id: int,
+                     target_ids: Iterable[int]) -> List[int]:
+    """Добавляет объекты в список пользователя одним INSERT и
+    возвращает идентификаторы действительно добавленных.
+
+    bulk_create с ignore_conflicts не возвращает, какие строки вставлены,
+    поэтому добавленные — разность списков до и после INSERT, прочитанных
+    под блокировкой пользователя.
+    """
+    _target, foreign_key, _field = USER_LISTS[model]
+    target_ids = set(target_ids)
+    lock_user(user_id)
+    rows = model.objects.filter(
+        user_id=user_id, **{f'{foreign_key}__in': target_ids}
+    )
+    before = set(rows.values_list(foreign_key, flat=True))
+    if not target_ids - before:
+        return []
+    model.objects.bulk_create([
+        model(user_id=user_id, **{foreign_key: target_id})
+        for target_id in target_ids - before
+    ], ignore_conflicts=True)
+    inserted = [
+        (target_id, added_at)
+        for target_id, added_at in rows.values_list(foreign_key, 'added_at')
+        if target_id not in before
+    ]
+    added = sorted(target_id for target_id, _added_at in inserted)
+    apply_changes(model, user_id, added, 1)
+    if model in EVENT_WEIGHTS:
+        change_recipe_scores(model, inserted)
+    return added
+
+
+@transaction.atomic
+def remove_from_user_list(model: Type[Model], user_id: int,
+                          target_ids: Iterable[int]) -> List[int]:
+    """Удаляет объекты из списка пользователя одним DELETE ... WHERE id IN
+    и возвращает идентификаторы действительно удалённых."""
+    _target, foreign_key, _field = USER_LISTS[model]
+    lock_user(user_id)
+    # Время добавления нужно, чтобы вычесть вклад строки в оценки
+    # популярности рецепта.
+    fields = ('pk', foreign_key)
+    if model in EVENT_WEIGHTS:
+        fields += ('added_at',)
+    rows = list(model.objects.filter(
+        user_id=user_id, **{f'{foreign_key}__in': set(target_ids)}
+    ).values_list(*fields))
+    delete_rows(model, 'id', [row[0] for row in rows])
+    removed = sorted(row[1] for row in rows)
+    apply_changes(model, user_id, removed, -1)
+    if model in EVENT_WEIGHTS:
+        change_recipe_scores(model, [row[1:] for row in rows], -1)
+    return removed
+
+
+@transaction.atomic
+def delete_recipe(recipe: Recipe) -> None:
+    """Удаляет рецепт, убирая его из списков пользователей запросами без
+    сигналов: каскад вызвал бы пересчёт списка покупок и счётчиков
+    удаляемого рецепта отдельно для каждой строки."""
+    user_ids = list(ShoppingCart.objects.filter(
+        recipe=recipe
+    ).values_list('user_id', flat=True))
+    ingredient_ids = list(RecipeIngredient.objects.filter(
+        recipe=recipe
+    ).values_list('ingredient_id', flat=True))
+    for model in (Favorite, ShoppingCart, RecipeIngredient):
+        delete_rows(model, 'recipe', [recipe.pk])
+    recipe.delete()
+    refresh_shopping_lists(user_ids, ingredient_ids)
@@ -9,7 +9,8 @@ admin.site.unregister(Group)
 
 @admin.register(User)
 class UserAdmin(UserAdmin):
-    list_display = ('pk', 'username', 'email', 'first_name', 'last_name',)
+    list_display = ('pk', 'username', 'email', 'first_name', 'last_name',
+                    'recipes_count', 'followers_count',)
     search_fields = ('username', 'email', 'first_name', 'last_name',)
     list_filter = ('username', 'email', 'first_name')
     add_fieldsets = (
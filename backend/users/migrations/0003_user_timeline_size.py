@@ -0,0 +1,22 @@
+# Generated by Django 2.2.16 on 2026-10-18 09:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_user_counters'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='user',
+            name='timeline_size',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Записей в ленте подписок'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['followers_count'], name='user_followers_count_idx'),
+        ),
+    ]
@@ -5,7 +5,30 @@ from django.utils.translation import ugettext_lazy as _
 from .validators import validate_username
 
 
-class User(AbstractUser):
+class DenormalizedFieldsMixin:
+    """Не записывает при save() поля, которые ведутся запросами
+    UPDATE ... F() (счётчики, оценки): их значения в памяти объекта могут
+    устареть, и полное сохранение затёрло бы параллельные изменения.
+    Такие поля сохраняются, только если переданы в update_fields явно."""
+
+    denormalized_fields = ()
+
+    def save(self, force_insert=False, force_update=False, using=None,
+             update_fields=None):
+        if (update_fields is None and not force_insert
+                and not self._state.adding):
+            deferred = self.get_deferred_fields()
+            update_fields = [
+                field.name for field in self._meta.concrete_fields
+                if not field.primary_key
+                and field.name not in self.denormalized_fields
+                and field.attname not in deferred
+            ]
+        super().save(force_insert=force_insert, force_update=force_update,
+                     using=using, update_fields=update_fields)
+
+
+class User(DenormalizedFieldsMixin, AbstractUser):
     username = models.CharField(
         _('Имя пользователя'),
         max_length=150,
@@ -25,12 +48,36 @@ class User(AbstractUser):
         _('Фамилия'),
         max_length=150,
     )
+    recipes_count = models.PositiveIntegerField(
+        _('Количество рецептов'),
+        default=0,
+        editable=False,
+    )
+    followers_count = models.PositiveIntegerField(
+        _('Количество подписчиков'),
+        default=0,
+        editable=False,
+    )
+    timeline_size = models.PositiveIntegerField(
+        _('Записей в ленте подписок'),
+        default=0,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'username'
     REQUIRED_FIELDS = ['email', 'first_name', 'last_name']
 
+    denormalized_fields = ('recipes_count', 'followers_count',
+                           'timeline_size')
+
     class Meta:
         ordering = ['username']
+        indexes = [
+            # Авторы с большим числом подписчиков, рецепты которых лента
+            # подписок подмешивает при чтении.
+            models.Index(fields=['followers_count'],
+                         name='user_followers_count_idx'),
+        ]
         verbose_name = _('Пользователь')
         verbose_name_plural = _('Пользователи')
 